@@ -2,10 +2,34 @@
 # buildroot/share/PlatformIO/scripts/chitu_crypt.py
 # Customizations for Chitu boards
 #
-import os,random,struct,uuid,marlin
+# update.cbd is the firmware, padded to 2 KiB blocks and XORed with a keystream:
+#
+#   byte n of block b:  ((n * n + 0x4BAD * b) >> (n % 24)) ^ key
+#
+# The keystream only depends on the position, the block number and the low
+# byte of the file key, so each block's keystream is built from a table of the
+# per-position terms and the whole image is XORed (and its CRC folded) as one
+# big integer instead of byte by byte. xor_block and calculate_crc are the
+# original byte-wise implementation, kept to check the fast one against.
+#
+# Run standalone to check or time it, or to handle update.cbd files:
+#
+#   python chitu_crypt.py verify [firmware.bin ...]  # fast == byte-wise, decrypt(encrypt(x)) == x
+#   python chitu_crypt.py bench [SIZE_KB]
+#   python chitu_crypt.py encrypt firmware.bin update.cbd
+#   python chitu_crypt.py decrypt update.cbd firmware.bin
+#
+import os,random,struct,sys,time,uuid
 
-# Relocate firmware from 0x08000000 to 0x08008800
-marlin.relocate_firmware("0x08008800")
+BLOCK_SIZE = 0x800
+KEY_LENGTH = 0x18
+BLOCK_SEED = 0x4BAD
+FILE_HEADER = 0x443D2D3F
+CRC_SEED = 0xEF3D4323
+HEADER_SIZE = 12
+
+# The parts of the keystream that only depend on the position in the block: n * n and n % 24
+POSITIONS = [(n * n, n % KEY_LENGTH) for n in range(BLOCK_SIZE)]
 
 def calculate_crc(contents, seed):
     accumulating_xor_value = seed;
@@ -59,31 +83,76 @@ def xor_block(r0, r1, block_number, block_size, file_key):
         #increment the loop_counter
         loop_counter = loop_counter + 1
 
-def encrypt_file(input, output_file, file_length):
-    input_file = bytearray(input.read())
-    block_size = 0x800
-    key_length = 0x18
+def keystream(block_count, file_key):
+    """The bytes xor_block XORs the first block_count blocks with. The key byte is XORed in afterwards,
+    with one translate() over the whole stream."""
+    stream = bytearray()
+    for block_number in range(block_count):
+        seed = BLOCK_SEED * block_number
+        stream += bytes([((square + seed) >> shift) & 0xFF for square, shift in POSITIONS])
+    key = file_key & 0xFF
+    return stream.translate(bytes(value ^ key for value in range(256)))
 
-    uid_value = uuid.uuid4()
-    file_key = int(uid_value.hex[0:8], 16)
+def xor_bytes(data, stream):
+    """data XOR stream (same length), as one integer operation."""
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(stream, 'little')).to_bytes(len(data), 'little')
 
-    xor_crc = 0xEF3D4323;
+def fold_crc(contents, seed):
+    """calculate_crc in one go: the XOR of all little-endian words, folding the halves onto each other."""
+    value = int.from_bytes(contents, 'little')
+    words = len(contents) // 4
+    crc = seed
+    while words > 1:
+        if words & 1:
+            words -= 1
+            crc ^= value >> (32 * words)
+            value &= (1 << (32 * words)) - 1
+        half = words // 2
+        value = (value >> (32 * half)) ^ (value & ((1 << (32 * half)) - 1))
+        words = half
+    return crc ^ value
 
-    # the input file is exepcted to be in chunks of 0x800
-    # so round the size
-    while len(input_file) % block_size != 0:
-        input_file.extend(b'0x0')
+def pad(firmware):
+    # the input file is exepcted to be in chunks of 0x800; it has always been
+    # padded with b'0x0' (three bytes at a time), which the bootloader ignores
+    padded = bytearray(firmware)
+    while len(padded) % BLOCK_SIZE != 0:
+        padded.extend(b'0x0')
+    return padded
 
-    # write the file header
-    output_file.write(struct.pack(">I", 0x443D2D3F))
-    # encrypt the contents using a known file header key
+def encrypt_image(firmware, file_key):
+    """The update.cbd contents for firmware: header, file key, CRC and the encrypted blocks."""
+    padded = pad(firmware)
+    block_count = len(padded) // BLOCK_SIZE
+    print ("Block Count is ", block_count)
+    encrypted = xor_bytes(padded, keystream(block_count, file_key))
+    return struct.pack(">I", FILE_HEADER) + struct.pack("<I", file_key) + struct.pack("<I", fold_crc(encrypted, CRC_SEED)) + encrypted
 
-    # write the file_key
-    output_file.write(struct.pack("<I", file_key))
+def decrypt_image(update):
+    """The padded firmware in update.cbd contents; raises ValueError if the header or CRC do not match."""
+    if len(update) < HEADER_SIZE or struct.unpack(">I", update[0:4])[0] != FILE_HEADER:
+        raise ValueError("not a Chitu update file (bad header)")
+    encrypted = update[HEADER_SIZE:]
+    if len(encrypted) % BLOCK_SIZE != 0:
+        raise ValueError("size is not a whole number of 0x%X byte blocks" % BLOCK_SIZE)
+    file_key, crc = struct.unpack("<II", update[4:HEADER_SIZE])
+    if fold_crc(encrypted, CRC_SEED) != crc:
+        raise ValueError("CRC mismatch")
+    return xor_bytes(encrypted, keystream(len(encrypted) // BLOCK_SIZE, file_key))
 
-    #TODO - how to enforce that the firmware aligns to block boundaries?
+def encrypt_file(input, output_file, file_length, file_key=None):
+    if file_key is None:
+        uid_value = uuid.uuid4()
+        file_key = int(uid_value.hex[0:8], 16)
+    output_file.write(encrypt_image(input.read(), file_key))
+
+def encrypt_file_bytewise(firmware, file_key):
+    """update.cbd contents the original way, with xor_block and calculate_crc, one block and byte at a time."""
+    input_file = pad(firmware)
+    block_size = BLOCK_SIZE
+    xor_crc = CRC_SEED
+    header = struct.pack(">I", FILE_HEADER) + struct.pack("<I", file_key)
     block_count = int(len(input_file) / block_size)
-    print ("Block Count is ", block_count)
     for block_number in range(0, block_count):
         block_offset = (block_number * block_size)
         block_end = block_offset + block_size
@@ -94,13 +163,7 @@ def encrypt_file(input, output_file, file_length):
 
         # update the expected CRC value.
         xor_crc = calculate_crc(block_array, xor_crc)
-
-    # write CRC
-    output_file.write(struct.pack("<I", xor_crc))
-
-    # finally, append the encrypted results.
-    output_file.write(input_file)
-    return
+    return header + struct.pack("<I", xor_crc) + bytes(input_file)
 
 # Encrypt ${PROGNAME}.bin and save it as 'update.cbd'
 def encrypt(source, target, env):
@@ -113,4 +176,91 @@ def encrypt(source, target, env):
     firmware.close()
     update.close()
 
-marlin.add_post_action(encrypt);
+def _quietly(function, *args):
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        return function(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def verify(paths):
+    """Check the fast encryption against the byte-wise one and decrypt(encrypt(x)) against x; return an exit code."""
+    rng = random.Random(0x4BAD)
+    images = [('random %d bytes' % size, bytes(rng.getrandbits(8) for _ in range(size)))
+              for size in (0, 1, 3, 4, 2047, BLOCK_SIZE, BLOCK_SIZE + 1, 5 * BLOCK_SIZE - 2, 40000)]
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((path, f.read()))
+    failed = 0
+    for name, firmware in images:
+        for file_key in (0, 0xFFFFFFFF, rng.getrandbits(32)):
+            fast = _quietly(encrypt_image, firmware, file_key)
+            problems = []
+            if fast != encrypt_file_bytewise(firmware, file_key):
+                problems.append('differs from the byte-wise encryption')
+            if decrypt_image(fast) != bytes(pad(firmware)):
+                problems.append('does not decrypt to the padded input')
+            if problems:
+                failed += 1
+                print('FAIL %s, key %08X: %s' % (name, file_key, ', '.join(problems)))
+    print('%d images x 3 keys checked, %d failed' % (len(images), failed))
+    return 1 if failed else 0
+
+def bench(size_kb=256):
+    firmware = bytes(random.Random(1).getrandbits(8) for _ in range(size_kb * 1024))
+    file_key = 0x1234ABCD
+    timings = []
+    for name, function in (('byte-wise', encrypt_file_bytewise), ('table-driven', encrypt_image)):
+        started = time.time()
+        result = _quietly(function, firmware, file_key)
+        timings.append(time.time() - started)
+        print('%-12s %7.3f s' % (name, timings[-1]))
+    started = time.time()
+    decrypt_image(result)
+    print('%-12s %7.3f s' % ('decrypt', time.time() - started))
+    print('%d KiB image: %.0fx faster' % (size_kb, timings[0] / timings[1]))
+    return 0
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Chitu update.cbd encryption: verify, benchmark, encrypt or decrypt.')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('verify', help='check against the byte-wise implementation and round-trip')
+    p.add_argument('files', nargs='*', help='firmware images to check as well as random ones')
+    p = sub.add_parser('bench', help='time byte-wise against table-driven encryption')
+    p.add_argument('size_kb', nargs='?', type=int, default=256)
+    for command, help_text in (('encrypt', 'firmware.bin -> update.cbd'), ('decrypt', 'update.cbd -> firmware.bin (padded)')):
+        p = sub.add_parser(command, help=help_text)
+        p.add_argument('input')
+        p.add_argument('output')
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        return verify(args.files)
+    if args.command == 'bench':
+        return bench(args.size_kb)
+    with open(args.input, 'rb') as f:
+        data = f.read()
+    if args.command == 'decrypt':
+        try:
+            data = decrypt_image(data)
+        except ValueError as e:
+            print('ERROR: %s: %s' % (args.input, e), file=sys.stderr)
+            return 1
+    else:
+        data = encrypt_image(data, int(uuid.uuid4().hex[0:8], 16))
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+else:
+    import marlin
+
+    # Relocate firmware from 0x08000000 to 0x08008800
+    marlin.relocate_firmware("0x08008800")
+
+    marlin.add_post_action(encrypt);
@@ -5,11 +5,16 @@
 #   env:LERDGES  env:LERDGES_usb_flash_drive
 #   env:LERDGEK  env:LERDGEK_usb_flash_drive
 #
-import os,marlin
-Import("env")
-
-from SCons.Script import DefaultEnvironment
-board = DefaultEnvironment().BoardConfig()
+# The firmware is encrypted byte by byte with a fixed permutation (encryptByte),
+# so it is applied to the whole image at once through a 256-entry table.
+#
+# Run standalone to check it or to handle encrypted firmware files:
+#
+#   python lerdge.py verify [firmware.bin ...]  # table == encryptByte loop, decrypt(encrypt(x)) == x
+#   python lerdge.py encrypt firmware.bin Lerdge_firmware_force.bin
+#   python lerdge.py decrypt Lerdge_firmware_force.bin firmware.bin
+#
+import os,random,sys
 
 def encryptByte(byte):
     byte = 0xFF & ((byte << 6) | (byte >> 2))
@@ -18,7 +23,22 @@ def encryptByte(byte):
     byte = (0xF8 & i) | (0x07 & j)
     return byte
 
+ENCRYPT_TABLE = bytes(encryptByte(byte) for byte in range(256))
+
+DECRYPT_TABLE = bytearray(256)
+for byte in range(256):
+    DECRYPT_TABLE[ENCRYPT_TABLE[byte]] = byte
+DECRYPT_TABLE = bytes(DECRYPT_TABLE)
+
 def encrypt_file(input, output_file, file_length):
+    output_file.write(input.read().translate(ENCRYPT_TABLE))
+    return
+
+def decrypt_file(input, output_file):
+    output_file.write(input.read().translate(DECRYPT_TABLE))
+
+# The original encrypt_file loop, kept to check the table against
+def encrypt_file_bytewise(input, output_file, file_length):
     input_file = bytearray(input.read())
     for i in range(len(input_file)):
         result = encryptByte(input_file[i])
@@ -40,8 +60,64 @@ def encrypt(source, target, env):
     firmware.close()
     renamed.close()
 
-if 'encrypt' in board.get("build").keys():
-    marlin.add_post_action(encrypt);
+def verify(paths):
+    import io
+    rng = random.Random(0x58)
+    images = [('random %d bytes' % size, bytes(rng.getrandbits(8) for _ in range(size))) for size in (0, 1, 255, 4096, 256 * 1024)]
+    images.append(('every byte value', bytes(range(256))))
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((path, f.read()))
+    failed = 0
+    for name, firmware in images:
+        fast, slow, plain = io.BytesIO(), io.BytesIO(), io.BytesIO()
+        encrypt_file(io.BytesIO(firmware), fast, len(firmware))
+        encrypt_file_bytewise(io.BytesIO(firmware), slow, len(firmware))
+        decrypt_file(io.BytesIO(fast.getvalue()), plain)
+        problems = []
+        if fast.getvalue() != slow.getvalue():
+            problems.append('differs from the encryptByte loop')
+        if plain.getvalue() != firmware:
+            problems.append('does not decrypt to the input')
+        if problems:
+            failed += 1
+            print('FAIL %s: %s' % (name, ', '.join(problems)))
+    print('%d images checked, %d failed' % (len(images), failed))
+    return 1 if failed else 0
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Lerdge firmware encryption: verify, encrypt or decrypt.')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('verify', help='check the table against the encryptByte loop and round-trip')
+    p.add_argument('files', nargs='*', help='firmware images to check as well as random ones')
+    for command, help_text in (('encrypt', 'firmware.bin -> encrypted firmware'), ('decrypt', 'encrypted firmware -> firmware.bin')):
+        p = sub.add_parser(command, help=help_text)
+        p.add_argument('input')
+        p.add_argument('output')
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        return verify(args.files)
+    with open(args.input, 'rb') as input, open(args.output, 'wb') as output:
+        if args.command == 'encrypt':
+            encrypt_file(input, output, os.path.getsize(args.input))
+        else:
+            decrypt_file(input, output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
 else:
-    print("LERDGE builds require output file via board_build.encrypt = 'filename' parameter")
-    exit(1);
+    import marlin
+    Import("env")
+
+    from SCons.Script import DefaultEnvironment
+    board = DefaultEnvironment().BoardConfig()
+
+    if 'encrypt' in board.get("build").keys():
+        marlin.add_post_action(encrypt);
+    else:
+        print("LERDGE builds require output file via board_build.encrypt = 'filename' parameter")
+        exit(1);
@@ -2,10 +2,19 @@
 # buildroot/share/PlatformIO/scripts/marlin.py
 # Helper module with some commonly-used functions
 #
+# Run standalone to check or time the MKS firmware encoding:
+#
+#   python marlin.py verify [firmware.bin ...]  # encode_mks == the per-byte loop, for every mks_robin* script
+#   python marlin.py bench [SIZE_KB]
+#
 import os,shutil
 
-from SCons.Script import DefaultEnvironment
-env = DefaultEnvironment()
+try:
+	from SCons.Script import DefaultEnvironment
+	env = DefaultEnvironment()
+except ImportError:
+	# Imported outside of PlatformIO, e.g. to run the checks below
+	env = None
 
 def copytree(src, dst, symlinks=False, ignore=None):
    for item in os.listdir(src):
@@ -39,29 +48,43 @@ def custom_ld_script(ldname):
 		elif flag == "-T":
 			env["LINKFLAGS"][i + 1] = apath
 
+# The key MKS bootloaders decode the firmware with, and the part of the image it is applied to
+MKS_KEY = bytes([0xA3, 0xBD, 0xAD, 0x0D, 0x41, 0x11, 0xBB, 0x8D, 0xDC, 0x80, 0x2D, 0xD0, 0xD2, 0xC4, 0x9B, 0x1E, 0x26, 0xEB, 0xE3, 0x33, 0x4A, 0x15, 0xE4, 0x0A, 0xB3, 0xB1, 0x3C, 0x93, 0xBB, 0xAF, 0xF7, 0x3E])
+MKS_START, MKS_END = 320, 31040
+
+# XOR bytes MKS_START to MKS_END of the firmware with the repeating key.
+# The window starts on a key boundary, so the key is tiled over it from index 0
+# and the whole window is XORed as one integer.
+def encode_mks(firmware):
+	window = firmware[MKS_START:MKS_END]
+	if not window:
+		return bytes(firmware)
+	tiled = (MKS_KEY * (len(window) // len(MKS_KEY) + 1))[:len(window)]
+	window = (int.from_bytes(window, 'little') ^ int.from_bytes(tiled, 'little')).to_bytes(len(window), 'little')
+	return bytes(firmware[:MKS_START]) + window + bytes(firmware[MKS_END:])
+
 # Encrypt ${PROGNAME}.bin and save it with a new name
 # Called by specific encrypt() functions, mostly for MKS boards
 def encrypt_mks(source, target, env, new_name):
-	import sys
+	with open(target[0].path, "rb") as firmware:
+		encoded = encode_mks(firmware.read())
+	with open(target[0].dir.path + "/" + new_name, "wb") as renamed:
+		renamed.write(encoded)
 
-	key = [0xA3, 0xBD, 0xAD, 0x0D, 0x41, 0x11, 0xBB, 0x8D, 0xDC, 0x80, 0x2D, 0xD0, 0xD2, 0xC4, 0x9B, 0x1E, 0x26, 0xEB, 0xE3, 0x33, 0x4A, 0x15, 0xE4, 0x0A, 0xB3, 0xB1, 0x3C, 0x93, 0xBB, 0xAF, 0xF7, 0x3E]
+# The original encrypt_mks loop, one byte at a time, kept to check encode_mks against
+def encode_mks_bytewise(firmware, renamed, length):
+	import sys
 
-	firmware = open(target[0].path, "rb")
-	renamed = open(target[0].dir.path + "/" + new_name, "wb")
-	length = os.path.getsize(target[0].path)
+	key = list(MKS_KEY)
 	position = 0
-	try:
-		while position < length:
-			byte = firmware.read(1)
-			if position >= 320 and position < 31040:
-				byte = chr(ord(byte) ^ key[position & 31])
-				if sys.version_info[0] > 2:
-					byte = bytes(byte, 'latin1')
-			renamed.write(byte)
-			position += 1
-	finally:
-		firmware.close()
-		renamed.close()
+	while position < length:
+		byte = firmware.read(1)
+		if position >= 320 and position < 31040:
+			byte = chr(ord(byte) ^ key[position & 31])
+			if sys.version_info[0] > 2:
+				byte = bytes(byte, 'latin1')
+		renamed.write(byte)
+		position += 1
 
 def add_post_action(action):
 	env.AddPostAction("$BUILD_DIR/${PROGNAME}.bin", action);
@@ -73,3 +96,84 @@ def prepare_robin(address, ldname, fwname):
 	relocate_firmware(address)
 	custom_ld_script(ldname)
 	add_post_action(encrypt);
+
+def _mks_robin_names():
+	# The encoded firmware name each mks_robin* script passes to robin.prepare()
+	import glob,re
+	names = {}
+	for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "mks_robin*.py"))):
+		found = re.search(r'robin\.prepare\([^)]*"([^"]+)"\s*\)', open(path).read())
+		if found:
+			names[os.path.basename(path)] = found.group(1)
+	return names
+
+# Build each mks_robin* script's encoded firmware from random and given images,
+# through encrypt_mks as the post action would, and compare it to the per-byte loop
+def verify_mks(paths):
+	import io,random,tempfile
+
+	# Stands in for the SCons node: target[0].path and target[0].dir.path
+	class Node:
+		def __init__(self, path, dir=None):
+			self.path = path
+			self.dir = dir
+
+	rng = random.Random(MKS_END)
+	images = [("random %d bytes" % size, bytes(rng.getrandbits(8) for _ in range(size)))
+	          for size in (0, 1, MKS_START, MKS_START + 1, MKS_START + 33, MKS_END - 1, MKS_END, MKS_END + 1, 256 * 1024)]
+	for path in paths:
+		with open(path, "rb") as f:
+			images.append((path, f.read()))
+
+	scripts = _mks_robin_names()
+	failed = 0
+	with tempfile.TemporaryDirectory() as build_dir:
+		bin_path = os.path.join(build_dir, "firmware.bin")
+		target = Node(bin_path, Node(build_dir))
+		for name, image in images:
+			with open(bin_path, "wb") as f:
+				f.write(image)
+			expected = io.BytesIO()
+			with open(bin_path, "rb") as f:
+				encode_mks_bytewise(f, expected, len(image))
+			for script, new_name in scripts.items():
+				encrypt_mks(None, [target], None, new_name)
+				with open(os.path.join(build_dir, new_name), "rb") as f:
+					if f.read() != expected.getvalue():
+						failed += 1
+						print("FAIL %s, %s (%s): differs from the per-byte encoding" % (name, script, new_name))
+	print("%d images x %d mks_robin scripts checked, %d failed" % (len(images), len(scripts), failed))
+	return 1 if failed or not scripts else 0
+
+def bench_mks(size_kb=256):
+	import io,random,time
+
+	image = bytes(random.Random(1).getrandbits(8) for _ in range(size_kb * 1024))
+	started = time.time()
+	encode_mks_bytewise(io.BytesIO(image), io.BytesIO(), len(image))
+	bytewise = time.time() - started
+	started = time.time()
+	encode_mks(image)
+	buffered = time.time() - started
+	print("%-10s %7.3f s" % ("per-byte", bytewise))
+	print("%-10s %7.3f s" % ("buffered", buffered))
+	print("%d KiB image: %.0fx faster" % (size_kb, bytewise / max(buffered, 1e-6)))
+	return 0
+
+def main(argv):
+	import argparse
+	parser = argparse.ArgumentParser(description="Check or time the MKS firmware encoding used by encrypt_mks.")
+	sub = parser.add_subparsers(dest="command")
+	sub.required = True
+	p = sub.add_parser("verify", help="compare encrypt_mks with the per-byte loop for each mks_robin* script")
+	p.add_argument("files", nargs="*", help="firmware images to check as well as random ones")
+	p = sub.add_parser("bench", help="time the per-byte loop against encode_mks")
+	p.add_argument("size_kb", nargs="?", type=int, default=256)
+	args = parser.parse_args(argv)
+	if args.command == "verify":
+		return verify_mks(args.files)
+	return bench_mks(args.size_kb)
+
+if __name__ == "__main__":
+	import sys
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,354 @@
+#
+# buildroot/share/PlatformIO/scripts/objcache.py
+# Content-addressed cache for compiled object files, shared by every env and config
+#
+# object-cache.py puts this in front of the compiler when a cache directory is
+# configured. For each "gcc -c SOURCE -o OBJECT ..." it preprocesses SOURCE
+# and hashes the preprocessed text, the flags and the compiler's identity.
+# When the key is already in the cache the object (and the warnings the
+# compiler printed for it) are copied back instead of compiling.
+#
+# - Include paths and the object/source paths are left out of the key: what
+#   they point at is already in the preprocessed text. __FILE__ still counts
+#   because it is expanded in the text.
+# - With debug info (-g, -g3, ...) the object holds DWARF line tables and the
+#   source and build directory paths, so the line markers stay in the hashed
+#   text and the working directory is hashed too: moving code by some lines is
+#   a new entry. Without -g line markers are dropped.
+# - --base-dir is the project directory (object-cache.py passes $PROJECT_DIR and
+#   adds -ffile-prefix-map=$PROJECT_DIR=. to the compiles, so the objects name
+#   paths below it relative to '.'). Like ccache's base_dir, that prefix is
+#   rewritten to '.' in the flags, the line markers and the working directory
+#   before hashing, so the same TU built in two overlays or checkouts is one
+#   entry, with or without debug info.
+# - The compiler identity is its resolved path, size and mtime.
+# - Entries are renamed into place, so concurrent compilers never see a
+#   partial object. Once the cache is over its size limit the least recently
+#   used entries are removed.
+#
+# Usage:
+#   python objcache.py stats  --dir DIR            # hits, misses, bytes saved
+#   python objcache.py trim   --dir DIR --max-size 2G
+#   python objcache.py verify --dir DIR --sample 20  # recompile and compare
+#   python objcache.py clear  --dir DIR
+#   python objcache.py compile --dir DIR [--base-dir PROJECT_DIR] -- arm-none-eabi-g++ -c x.cpp -o x.o ...
+#
+import argparse,hashlib,json,os,random,shlex,shutil,subprocess,sys,tempfile,time
+
+CACHE_VERSION = 1
+DEFAULT_MAX_SIZE = '2G'
+TRIM_INTERVAL = 60          # seconds between size checks by the compiler wrapper
+STATS_FILE = 'stats.log'
+TRIM_LOCK = 'trim.lock'
+
+SOURCE_SUFFIXES = ('.c', '.cc', '.cpp', '.cxx', '.ino')
+# Flags whose effect is fully captured by the preprocessed text
+PATH_FLAGS = ('-I', '-isystem', '-iquote', '-idirafter')
+# Flags that make a compile unsuitable for caching
+UNCACHEABLE = ('-E', '-S', '-M', '-MM', '-MD', '-MMD', '-MF', '-MT', '-MQ', '-fprofile-generate', '-ftest-coverage')
+
+def parse_size(text):
+	text = str(text).strip().upper()
+	units = { 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30 }
+	if text and text[-1] in units:
+		return int(float(text[:-1]) * units[text[-1]])
+	return int(text)
+
+def expand_response_files(args):
+	# Inline @file arguments (PlatformIO uses them for long include lists)
+	result = []
+	for arg in args:
+		if arg.startswith('@') and os.path.isfile(arg[1:]):
+			with open(arg[1:]) as f:
+				result += expand_response_files(shlex.split(f.read()))
+		else:
+			result.append(arg)
+	return result
+
+def parse_compile(argv):
+	# Return (source, output, cpp argv, key flags) for a cacheable compile, else None
+	args = expand_response_files(argv[1:])
+	if '-c' not in args or any(a in UNCACHEABLE for a in args):
+		return None
+	output, sources, flags, cpp = None, [], [], [argv[0]]
+	i = 0
+	while i < len(args):
+		arg = args[i]
+		if arg == '-o' and i + 1 < len(args):
+			output = args[i + 1]
+			i += 2
+			continue
+		if arg.startswith('-o') and len(arg) > 2:
+			output = arg[2:]
+		elif arg in PATH_FLAGS and i + 1 < len(args):
+			cpp += [arg, args[i + 1]]
+			i += 2
+			continue
+		elif arg.startswith(PATH_FLAGS):
+			cpp.append(arg)
+		elif arg == '-c':
+			pass
+		elif not arg.startswith('-') and os.path.splitext(arg)[1] in SOURCE_SUFFIXES:
+			sources.append(arg)
+			cpp.append(arg)
+		else:
+			flags.append(arg)
+			cpp.append(arg)
+		i += 1
+	if output is None or len(sources) != 1:
+		return None
+	return sources[0], output, cpp + ['-E'], flags
+
+def compiler_identity(compiler):
+	path = shutil.which(compiler) or compiler
+	real = os.path.realpath(path)
+	st = os.stat(real)
+	return '%s:%d:%d' % (real, st.st_size, int(st.st_mtime))
+
+def strip_line_markers(text):
+	# Drop '# 123 "file"' lines; they only carry paths used for diagnostics and debug info
+	return b'\n'.join(line for line in text.split(b'\n') if not line.startswith(b'# '))
+
+def base_prefixes(base_dir):
+	# The project directory as given and as resolved (overlays and checkouts may be reached through symlinks)
+	if not base_dir:
+		return []
+	found = []
+	for path in (os.path.abspath(base_dir), os.path.realpath(base_dir)):
+		if path not in found:
+			found.append(path)
+	return found
+
+def map_path(path, prefixes):
+	# path with a leading project directory replaced by '.'
+	for prefix in prefixes:
+		if path == prefix or path.startswith(prefix + os.sep):
+			return '.' + path[len(prefix):]
+	return path
+
+def map_line_markers(text, prefixes):
+	# Rewrite '# 123 "/project/Marlin/x.h"' to '# 123 "./Marlin/x.h"', leaving the code alone
+	if not prefixes:
+		return text
+	quoted = [(b'"' + p.encode() + os.sep.encode(), b'".' + os.sep.encode()) for p in prefixes]
+	lines = text.split(b'\n')
+	for i, line in enumerate(lines):
+		if line.startswith(b'# '):
+			for old, new in quoted:
+				line = line.replace(old, new)
+			lines[i] = line
+	return b'\n'.join(lines)
+
+def debug_info(flags):
+	# True when the object gets debug info (the last -g flag wins; -g0 turns it off)
+	level = [f for f in flags if f.startswith('-g')]
+	return bool(level) and level[-1] != '-g0'
+
+class ObjectCache:
+	def __init__(self, root, max_size=DEFAULT_MAX_SIZE):
+		self.root = os.path.abspath(os.path.expanduser(root))
+		self.max_size = parse_size(max_size)
+
+	def entry(self, key):
+		return os.path.join(self.root, 'objects', key[:2], key)
+
+	def record(self, event, size=0):
+		# One short O_APPEND write per compile, safe with many compilers running at once
+		os.makedirs(self.root, exist_ok=True)
+		with open(os.path.join(self.root, STATS_FILE), 'a') as f:
+			f.write('%s %d\n' % (event, size))
+
+	def lookup(self, key):
+		obj = self.entry(key) + '.o'
+		if not os.path.isfile(obj):
+			return None
+		os.utime(obj, None)   # mark as recently used for trimming
+		return obj
+
+	def store(self, key, output, stderr, argv, base_dir=None):
+		path = self.entry(key)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		meta = json.dumps({ 'argv': argv, 'cwd': os.getcwd(), 'base_dir': base_dir, 'created': time.time() }).encode()
+		with open(output, 'rb') as f:
+			obj = f.read()
+		for suffix, data in (('.err', stderr), ('.json', meta), ('.o', obj)):
+			fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+			with os.fdopen(fd, 'wb') as f:
+				f.write(data)
+			os.replace(tmp, path + suffix)   # .o last: it is what marks the entry as complete
+
+	def entries(self):
+		# (mtime, size, path without suffix) for every complete entry
+		found = []
+		objects = os.path.join(self.root, 'objects')
+		for dirpath, _, filenames in os.walk(objects):
+			for name in filenames:
+				if name.endswith('.o'):
+					path = os.path.join(dirpath, name)
+					base = path[:-2]
+					size = sum(os.path.getsize(base + s) for s in ('.o', '.err', '.json') if os.path.exists(base + s))
+					found.append((os.path.getmtime(path), size, base))
+		return found
+
+	def trim(self, max_size=None):
+		# Remove least recently used entries until the cache fits; return (entries removed, bytes freed)
+		max_size = self.max_size if max_size is None else max_size
+		entries = sorted(self.entries())
+		total = sum(size for _, size, _ in entries)
+		removed = freed = 0
+		for _, size, base in entries:
+			if total <= max_size:
+				break
+			for suffix in ('.o', '.err', '.json'):
+				try: os.unlink(base + suffix)
+				except OSError: pass
+			total -= size
+			freed += size
+			removed += 1
+		return removed, freed
+
+	def maybe_trim(self):
+		# Called after each store; at most one process trims, at most every TRIM_INTERVAL seconds
+		lock = os.path.join(self.root, TRIM_LOCK)
+		try:
+			if time.time() - os.path.getmtime(lock) < TRIM_INTERVAL:
+				return
+			os.unlink(lock)
+		except OSError:
+			pass
+		try:
+			os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+		except OSError:
+			return
+		self.trim()
+
+	def stats(self):
+		counts = { 'hit': 0, 'miss': 0, 'uncacheable': 0 }
+		saved = 0
+		try:
+			with open(os.path.join(self.root, STATS_FILE)) as f:
+				for line in f:
+					event, _, size = line.partition(' ')
+					counts[event] = counts.get(event, 0) + 1
+					if event == 'hit':
+						saved += int(size or 0)
+		except OSError:
+			pass
+		entries = self.entries()
+		return dict(counts, bytes_saved=saved, entries=len(entries), size=sum(s for _, s, _ in entries), max_size=self.max_size)
+
+def cache_key(argv, info, cwd=None, base_dir=None):
+	cpp, flags = info[2], info[3]
+	pre = subprocess.run(cpp, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+	if pre.returncode:
+		return None
+	prefixes = base_prefixes(base_dir)
+	# The -ffile-prefix-map flag itself names the project directory
+	for prefix in prefixes:
+		flags = [flag.replace(prefix, '.') for flag in flags]
+	digest = hashlib.sha256()
+	digest.update(('%d\0%s\0%s\0' % (CACHE_VERSION, compiler_identity(argv[0]), '\0'.join(flags))).encode())
+	if debug_info(flags):
+		# Line tables and comp_dir come from the line markers and the working directory,
+		# as the compiler maps them
+		digest.update(('%s\0' % map_path(os.path.abspath(cwd or os.getcwd()), prefixes)).encode())
+		digest.update(map_line_markers(pre.stdout, prefixes))
+	else:
+		digest.update(strip_line_markers(pre.stdout))
+	return digest.hexdigest()
+
+def compile_cached(cache, argv, base_dir=None):
+	# Run argv (a compiler command) through the cache; return its exit code
+	info = parse_compile(argv)
+	key = cache_key(argv, info, base_dir=base_dir) if info else None
+	if key is None:
+		cache.record('uncacheable')
+		return subprocess.call(argv)
+	output = info[1]
+	obj = cache.lookup(key)
+	if obj:
+		shutil.copyfile(obj, output)
+		try:
+			with open(obj[:-2] + '.err', 'rb') as f:
+				sys.stderr.buffer.write(f.read())
+		except OSError:
+			pass
+		cache.record('hit', os.path.getsize(obj))
+		return 0
+	result = subprocess.run(argv, stderr=subprocess.PIPE)
+	sys.stderr.buffer.write(result.stderr)
+	if result.returncode == 0 and os.path.isfile(output):
+		cache.store(key, output, result.stderr, argv, base_dir)
+		cache.record('miss', os.path.getsize(output))
+		cache.maybe_trim()
+	return result.returncode
+
+def verify(cache, sample):
+	# Recompile a random sample of entries from their recorded command and compare the objects
+	entries = [base for _, _, base in cache.entries() if os.path.exists(base + '.json')]
+	checked = same = 0
+	for base in random.sample(entries, min(sample, len(entries))):
+		with open(base + '.json') as f:
+			meta = json.load(f)
+		argv = list(meta['argv'])
+		info = parse_compile(argv)
+		if not info or not os.path.isdir(meta['cwd']):
+			continue
+		if cache_key(argv, info, meta['cwd'], meta.get('base_dir')) != os.path.basename(base):
+			print('SKIP   %s (sources changed since it was cached)' % info[0])
+			continue
+		tmp_dir = tempfile.mkdtemp(prefix='objcache-verify-')
+		try:
+			out = os.path.join(tmp_dir, 'verify.o')
+			argv = [out if a == info[1] else ('-o' + out if a == '-o' + info[1] else a) for a in argv]
+			if subprocess.run(argv, cwd=meta['cwd'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode:
+				print('SKIP   %s (no longer compiles)' % info[0])
+				continue
+			checked += 1
+			with open(out, 'rb') as a, open(base + '.o', 'rb') as b:
+				match = a.read() == b.read()
+			same += match
+			print('%s %s' % ('OK    ' if match else 'DIFFER', info[0]))
+		finally:
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+	print('%d of %d recompiled objects are identical to the cached ones' % (same, checked))
+	return 0 if same == checked else 1
+
+def main(argv):
+	command = []
+	if '--' in argv:
+		command = argv[argv.index('--') + 1:]
+		argv = argv[:argv.index('--')]
+	parser = argparse.ArgumentParser(description='Compiler object cache for Marlin builds')
+	parser.add_argument('command', choices=('compile', 'stats', 'trim', 'verify', 'clear'))
+	parser.add_argument('--dir', required=True, help='cache directory')
+	parser.add_argument('--max-size', default=DEFAULT_MAX_SIZE, help='size limit, e.g. 500M or 2G')
+	parser.add_argument('--sample', type=int, default=20, help='entries to recompile for verify')
+	parser.add_argument('--base-dir', default=None, help='project directory, hashed as "." (compile)')
+	args = parser.parse_args(argv)
+	cache = ObjectCache(args.dir, args.max_size)
+
+	if args.command == 'compile':
+		if not command:
+			parser.error('compile needs the compiler command after --')
+		return compile_cached(cache, command, args.base_dir)
+	if args.command == 'stats':
+		s = cache.stats()
+		lookups = s['hit'] + s['miss']
+		print('Object cache %s' % cache.root)
+		print('  hits %d, misses %d (%.0f%% hit rate), not cacheable %d' % (s['hit'], s['miss'], 100.0 * s['hit'] / lookups if lookups else 0, s['uncacheable']))
+		print('  compiled bytes reused %.1f MiB' % (s['bytes_saved'] / 1048576.0))
+		print('  %d entries, %.1f of %.1f MiB' % (s['entries'], s['size'] / 1048576.0, s['max_size'] / 1048576.0))
+		return 0
+	if args.command == 'trim':
+		removed, freed = cache.trim()
+		print('Removed %d entries, %.1f MiB' % (removed, freed / 1048576.0))
+		return 0
+	if args.command == 'verify':
+		return verify(cache, args.sample)
+	shutil.rmtree(cache.root, ignore_errors=True)
+	print('Removed %s' % cache.root)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+#
+# object-cache.py
+# Route C/C++ compiles through objcache.py when an object cache is configured
+#
+# Off unless a cache directory is given, either in platformio.ini:
+#
+#   [env:myenv]                          (or [common])
+#   custom_object_cache      = ~/.cache/marlin-objects
+#   custom_object_cache_size = 2G
+#
+# or with the MARLIN_OBJECT_CACHE (and MARLIN_OBJECT_CACHE_SIZE) environment
+# variables. The cache can be shared by all envs, configs and checkouts:
+# compiles get -ffile-prefix-map=$PROJECT_DIR=. (-fdebug-prefix-map before
+# GCC 8), so objects and their debug info name project files relative to '.',
+# and objcache.py hashes $PROJECT_DIR as '.' (--base-dir).
+# Inspect it with: python buildroot/share/PlatformIO/scripts/objcache.py stats --dir DIR
+#
+import os,subprocess
+Import("env")
+
+def project_option(name, default=''):
+	try:
+		return env.GetProjectOption(name, default)
+	except:
+		return default
+
+cache_dir = project_option('custom_object_cache') or os.environ.get('MARLIN_OBJECT_CACHE', '')
+if cache_dir:
+	cache_size = project_option('custom_object_cache_size') or os.environ.get('MARLIN_OBJECT_CACHE_SIZE', '2G')
+	wrapper = os.path.join(env['PROJECT_DIR'], 'buildroot', 'share', 'PlatformIO', 'scripts', 'objcache.py')
+	prefix = '"$PYTHONEXE" "%s" compile --dir "%s" --max-size %s --base-dir "$PROJECT_DIR" --' % (wrapper, os.path.expanduser(cache_dir), cache_size)
+
+	# Map the project directory to '.' in debug info (and __FILE__), so overlays and checkouts share objects.
+	# The platform sets CC after pre: scripts run, so the flag is picked when the compile line is built.
+	prefix_maps = {}
+	def prefix_map_flag(target, source, env, for_signature):
+		cc = env.subst('$CC')
+		if cc not in prefix_maps:
+			try:
+				version = subprocess.run([cc, '-dumpfullversion', '-dumpversion'], stdout=subprocess.PIPE,
+				                         stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+				major = int(version.strip().split('.')[0])
+			except (OSError, ValueError):
+				major = 0
+			prefix_maps[cc] = '-ffile-prefix-map' if major >= 8 else '-fdebug-prefix-map'
+		return '%s=%s=.' % (prefix_maps[cc], env.subst('$PROJECT_DIR'))
+	env['OBJCACHE_PREFIX_MAP'] = prefix_map_flag
+	env.Append(CCFLAGS=['$OBJCACHE_PREFIX_MAP'])
+
+	for command in ('CCCOM', 'CXXCOM'):
+		env[command] = prefix + ' ' + env[command]
+	print("Object cache:", os.path.expanduser(cache_dir), "(max %s)" % cache_size)
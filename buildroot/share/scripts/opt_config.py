@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+#
+# opt_config.py
+#
+# In-process version of buildroot/bin/opt_set, opt_enable, opt_disable and opt_add.
+#
+# The shell helpers run sed once per option for each of Configuration.h and
+# Configuration_adv.h, so a test script forks hundreds of processes and
+# rewrites both files dozens of times. Here both files are read once, every
+# operation of a batch is applied to the lines in memory with the same
+# regular expressions (and the same quirks) as the sed commands, and each
+# changed file is written once. The buildroot/bin scripts delegate to this
+# file when python3 is available; set OPT_SED=1 to make them use sed.
+#
+# Usage (in the Marlin repository root, like the shell helpers):
+#
+#   opt_config.py set NAME VALUE [NAME VALUE ...]     # opt_set
+#   opt_config.py enable NAME [NAME ...]              # opt_enable
+#   opt_config.py disable NAME [NAME ...]             # opt_disable
+#   opt_config.py add NAME [VALUE ...]                # opt_add
+#   opt_config.py apply [FILE]        # the opt_* lines of FILE (or stdin) in one batch
+#   opt_config.py verify [SCRIPT ...] # compare with the sed helpers on every buildroot/tests script
+#   opt_config.py bench [SCRIPT]      # time the longest (or given) buildroot/tests script both ways
+#
+# Like the shell helpers, an option that can't be found stops the batch with
+# exit code 9 after writing what was already applied.
+#
+import os, re, sys
+
+CONFIG_FILES = ('Configuration.h', 'Configuration_adv.h')
+
+# The files are decoded as Latin-1 (byte-exact) and matched with ASCII
+# classes, which is what sed does in the C locale: \s is [ \t\n\v\f\r]
+# and \b is a boundary of [A-Za-z0-9_].
+ENCODING = 'latin-1'
+DEFINE = re.compile(r'^\s*/*\s*#define\s+(\w+)', re.A)
+WORD = re.compile(r'\w+$', re.A)
+
+class OptionError(Exception):
+	"""An option opt_enable or opt_disable could not find (the shell helpers exit with 9)."""
+	def __init__(self, command, name):
+		super().__init__("ERROR: %s Can't find %s" % (command, name))
+
+def sed_replacement(text):
+	"""
+	Compile text as it would be read inside the replacement of sed's s/// command.
+	Return a list of literal strings and group numbers (0 for &), or None if an
+	unescaped '/' or a newline would end the s command (sed exits with an error).
+	"""
+	parts, literal, i = [], '', 0
+	while i < len(text):
+		c = text[i]
+		if c == '/' or c == '\n':
+			return None
+		if c == '&':
+			parts += [literal, 0]; literal = ''
+		elif c == '\\' and i + 1 < len(text):
+			i += 1
+			c = text[i]
+			if c.isdigit():
+				parts += [literal, int(c)]; literal = ''
+			else:
+				literal += {'n': '\n', 't': '\t'}.get(c, c)
+		else:
+			literal += c
+		i += 1
+	return parts + [literal]
+
+def expand(parts, match):
+	return ''.join(p if isinstance(p, str) else (match.group(p) or '') for p in parts)
+
+class ConfigFile:
+	"""One configuration file as a list of lines, with an index of the #define lines by name."""
+	def __init__(self, path):
+		self.path = path
+		with open(path, encoding=ENCODING, newline='') as f:
+			self.lines = f.read().split('\n')
+		self.changed = False
+		self._index = None
+
+	def candidates(self, name):
+		"""Indexes of the lines that may hold '#define name' (commented out or not)."""
+		if not WORD.match(name):
+			return range(len(self.lines))
+		if self._index is None:
+			self._index = {}
+			for n, line in enumerate(self.lines):
+				m = DEFINE.match(line)
+				if m: self._index.setdefault(m[1], []).append(n)
+		return self._index.get(name, ())
+
+	def replace(self, n, line):
+		if line == self.lines[n]: return
+		self.lines[n] = line
+		self.changed = True
+		if '\n' in line:
+			# sed printed a line holding newlines: from now on they are separate lines
+			self.lines[n:n + 1] = line.split('\n')
+			self._index = None
+
+	def terminate(self):
+		"""
+		Do what the end of each helper's sed script does: 'q' ends the last line with
+		a newline. Return True for an empty file, where sed never gets to '$' and exits 0.
+		"""
+		if self.lines[-1]:
+			self.lines.append('')
+			self.changed = True
+		return len(self.lines) == 1
+
+	def find(self, pattern, name):
+		return any(pattern.match(self.lines[n]) for n in self.candidates(name))
+
+	def prepend(self, line):
+		self.lines.insert(0, line)
+		self.changed = True
+		self._index = None
+
+	def append(self, line):
+		# echo '...' >>file: a file without a final newline gets its last line extended
+		self.lines[-1] += line
+		self.lines.append('')
+		self.changed = True
+		self._index = None
+
+	def save(self):
+		if not self.changed: return
+		# Replace the file like sed -i does: a symlink becomes a file, the mode is kept
+		tmp = '%s.opt_config.tmp' % self.path
+		with open(tmp, 'w', encoding=ENCODING, newline='') as f:
+			f.write('\n'.join(self.lines))
+		try:
+			os.chmod(tmp, os.stat(self.path).st_mode & 0o7777)
+		except OSError:
+			pass
+		os.replace(tmp, self.path)
+		self.changed = False
+
+class Configs:
+	"""Configuration.h and Configuration_adv.h of a Marlin directory, edited in memory."""
+	def __init__(self, marlin_dir='Marlin'):
+		self.dir = marlin_dir
+		self.files = [ConfigFile(os.path.join(marlin_dir, name)) for name in CONFIG_FILES]
+
+	def set(self, name, value):
+		"""opt_set: set every (commented out or not) '#define name' to value, else add it to Configuration.h."""
+		pattern = re.compile(r'^(\s*)/*\s*(#define\s+%s\b) *(.*)$' % re.escape(name), re.A)
+		parts = sed_replacement(value)
+		did = False
+		for config in self.files:
+			if parts is None: break
+			did = config.terminate() or did
+			for n in reversed(list(config.candidates(name))):
+				m = pattern.match(config.lines[n])
+				if m:
+					config.replace(n, '%s%s %s // %s' % (m[1], m[2], expand(parts, m), m[3]))
+					did = True
+		if not did:
+			self.files[0].append('#define %s %s' % (name, value))
+
+	def enable(self, name):
+		"""opt_enable: uncomment '//#define name', keeping the rest of the line aligned."""
+		pattern = re.compile(r'^(\s*)//(\s*)(#define\s+%s\b)( ?)' % re.escape(name), re.A)
+		enabled = re.compile(r'^\s*#define\s+%s\b' % re.escape(name), re.A)
+		did = False
+		for config in self.files:
+			did = config.terminate() or did
+			for n in reversed(list(config.candidates(name))):
+				m = pattern.match(config.lines[n])
+				if m:
+					config.replace(n, m[1] + m[2] + m[3] + m[4] * 3 + config.lines[n][m.end():])
+					did = True
+		if not did and not any(config.find(enabled, name) for config in self.files):
+			raise OptionError('opt_enable', name)
+
+	def disable(self, name):
+		"""opt_disable: comment out '#define name', taking up to two spaces after it to keep alignment."""
+		pattern = re.compile(r'^(\s*)(#define\s+%s\b)' % re.escape(name), re.A)
+		disabled = re.compile(r'^\s*//\s*#define\s+%s\b' % re.escape(name), re.A)
+		did = False
+		for config in self.files:
+			did = config.terminate() or did
+			for n in reversed(list(config.candidates(name))):
+				line = config.lines[n]
+				m = pattern.match(line)
+				if not m: continue
+				# sed matches \(#define X\b\s\?\)\(\s\s\)\? leftmost-longest: of the whitespace
+				# after the name it takes 3 (keeping 1), 2 (keeping none), 1 (keeping it) or 0
+				end = m.end()
+				spaces = len(line[end:]) - len(line[end:].lstrip(' \t\n\v\f\r'))
+				taken = min(spaces, 3)
+				kept = line[end] if taken in (1, 3) else ''
+				config.replace(n, m[1] + '//' + m[2] + kept + line[end + taken:])
+				did = True
+		if not did and not any(config.find(disabled, name) for config in self.files):
+			raise OptionError('opt_disable', name)
+
+	def add(self, *words):
+		"""opt_add: put '#define <words>' on the first line of Configuration.h."""
+		self.files[0].prepend('#define ' + ' '.join(words))
+
+	def save(self):
+		for config in self.files:
+			config.save()
+
+	def run(self, command, args):
+		"""Apply one opt_* command line, like the shell helper of the same name."""
+		if command == 'opt_set':
+			# opt_set loops 'while [[ $# > 1 ]]': an odd last word is ignored
+			for i in range(0, len(args) - 1, 2):
+				self.set(args[i], args[i + 1])
+		elif command == 'opt_enable':
+			for name in args: self.enable(name)
+		elif command == 'opt_disable':
+			for name in args: self.disable(name)
+		elif command == 'opt_add':
+			self.add(*args)
+		else:
+			raise ValueError('not a config command: ' + command)
+
+COMMANDS = ('opt_set', 'opt_enable', 'opt_disable', 'opt_add')
+
+def parse_script(text):
+	"""The commands of a shell script, one (name, args) per command line, continuation lines joined."""
+	import shlex
+	commands = []
+	for line in re.sub(r'\\\n', ' ', text).split('\n'):
+		try:
+			words = shlex.split(line, comments=True)
+		except ValueError:
+			continue
+		if words: commands.append((words[0], words[1:]))
+	return commands
+
+def apply(marlin_dir, commands):
+	"""Run the opt_* commands in one batch, leaving out anything else; save once."""
+	configs = Configs(marlin_dir)
+	try:
+		for command, args in commands:
+			if command in COMMANDS:
+				configs.run(command, args)
+	finally:
+		configs.save()
+
+#
+# verify and bench: the engine against the sed helpers, on the buildroot/tests scripts
+#
+
+def segments(script):
+	"""The config commands of a test script, grouped per exec_test. use_example_configs counts as
+	restore_configs (fetching examples needs the network), pins_set and the rest are left out."""
+	with open(script, encoding='utf-8') as f:
+		commands = parse_script(f.read())
+	found, current = [], []
+	for command, args in commands:
+		if command in ('restore_configs', 'use_example_configs'):
+			current = []
+		elif command in COMMANDS:
+			current.append((command, args))
+		elif command == 'exec_test' and current:
+			found.append(list(current))
+	return found
+
+def _run_shell(bin_dir, workdir, segment, sed):
+	"""Run the buildroot/bin helpers for segment in workdir; return the exit code of the first failure."""
+	import subprocess
+	env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ['PATH'])
+	if sed: env['OPT_SED'] = '1'
+	else: env.pop('OPT_SED', None)
+	for command, args in segment:
+		code = subprocess.run([os.path.join(bin_dir, command)] + args, cwd=workdir, env=env,
+		                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+		if code: return code
+	return 0
+
+def _run_engine(workdir, segment):
+	try:
+		apply(os.path.join(workdir, 'Marlin'), segment)
+	except OptionError:
+		return 9
+	return 0
+
+def _fresh(workdir, pristine):
+	import shutil
+	marlin = os.path.join(workdir, 'Marlin')
+	os.makedirs(marlin, exist_ok=True)
+	for name in CONFIG_FILES:
+		shutil.copyfile(os.path.join(pristine, name), os.path.join(marlin, name))
+
+def _contents(workdir):
+	result = []
+	for name in CONFIG_FILES:
+		with open(os.path.join(workdir, 'Marlin', name), 'rb') as f:
+			result.append(f.read())
+	return result
+
+def _repo_paths():
+	root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+	return os.path.join(root, 'buildroot', 'bin'), os.path.join(root, 'buildroot', 'tests'), os.path.join(root, 'Marlin')
+
+def verify(scripts):
+	"""Compare the engine with sed on every segment of the scripts; return the number of differences."""
+	import tempfile
+	bin_dir, tests_dir, pristine = _repo_paths()
+	scripts = scripts or sorted(os.path.join(tests_dir, name) for name in os.listdir(tests_dir))
+	checked = differences = 0
+	with tempfile.TemporaryDirectory() as tmp:
+		sed_dir, engine_dir = os.path.join(tmp, 'sed'), os.path.join(tmp, 'engine')
+		for script in scripts:
+			for number, segment in enumerate(segments(script), 1):
+				_fresh(sed_dir, pristine); _fresh(engine_dir, pristine)
+				sed_code = _run_shell(bin_dir, sed_dir, segment, sed=True)
+				engine_code = _run_engine(engine_dir, segment)
+				checked += 1
+				if sed_code != engine_code or _contents(sed_dir) != _contents(engine_dir):
+					differences += 1
+					print('DIFFER %s #%d (exit %d with sed, %d with the engine)' % (os.path.basename(script), number, sed_code, engine_code))
+	print('%d segments checked, %d differ' % (checked, differences))
+	return differences
+
+def bench(script, repeat=3):
+	"""Time the config commands of a test script with sed, with the delegating helpers and in one batch."""
+	import tempfile, time
+	bin_dir, tests_dir, pristine = _repo_paths()
+	if not script:
+		script = max((os.path.join(tests_dir, name) for name in os.listdir(tests_dir)), key=lambda p: sum(1 for _ in open(p, encoding='utf-8')))
+	found = segments(script)
+	calls = sum(len(s) for s in found)
+	options = sum(len(args) // (2 if command == 'opt_set' else 1) for s in found for command, args in s)
+	print('%s: %d segments, %d helper calls, %d options' % (os.path.basename(script), len(found), calls, options))
+	runs = (
+		('sed helpers', lambda d, s: _run_shell(bin_dir, d, s, sed=True)),
+		('delegating helpers', lambda d, s: _run_shell(bin_dir, d, s, sed=False)),
+		('in-process batch', _run_engine),
+	)
+	with tempfile.TemporaryDirectory() as tmp:
+		best = {}
+		for label, run in runs:
+			for _ in range(repeat):
+				elapsed = 0.0
+				for segment in found:
+					_fresh(tmp, pristine)
+					started = time.perf_counter()
+					run(tmp, segment)
+					elapsed += time.perf_counter() - started
+				best[label] = min(best.get(label, elapsed), elapsed)
+			print('  %-20s %8.3f s  (%.1fx)' % (label, best[label], best['sed helpers'] / best[label]))
+
+def main(argv=None):
+	argv = sys.argv[1:] if argv is None else argv
+	if not argv:
+		print('usage: opt_config.py set|enable|disable|add|apply|verify|bench ...', file=sys.stderr)
+		return 2
+	command, args = argv[0], argv[1:]
+	if command == 'verify':
+		return 1 if verify(args) else 0
+	if command == 'bench':
+		bench(args[0] if args else None)
+		return 0
+	if command == 'apply':
+		if args:
+			with open(args[0], encoding='utf-8') as f: text = f.read()
+		else:
+			text = sys.stdin.read()
+		commands = parse_script(text)
+	else:
+		commands = [('opt_' + command, args)]
+		if commands[0][0] not in COMMANDS:
+			print('opt_config.py: unknown command %s' % command, file=sys.stderr)
+			return 2
+	try:
+		apply('Marlin', commands)
+	except OptionError as e:
+		print(e, file=sys.stderr)
+		return 9
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
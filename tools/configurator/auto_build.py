@@ -908,6 +908,25 @@ def sys_PIO():
 # end - sys_PIO
 
 
+# append a build to the local build history, .pio/build-history.sqlite
+# (see tools/linux_developers/build/build_history.py)
+def record_build_history(status, seconds, log_text):
+  try:
+    from pathlib import Path
+    sys.path.insert(0, repo_path(os.path.join('tools', 'linux_developers', 'build')))
+    from build_history import BuildHistory, default_path, git_commit
+    commit, dirty = git_commit(REPO_ROOT)
+    firmware = sorted(Path(REPO_ROOT, '.pio', 'build', target_env).glob('firmware*.bin'), key=lambda p: p.stat().st_mtime)
+    BuildHistory(default_path(Path(REPO_ROOT))).record(
+      'auto_build', board_name or target_env, target_env, status, seconds, {'compile': seconds}, log_text,
+      firmware[-1] if firmware and status == 'built' else None, commit=commit, dirty=dirty
+    )
+  except Exception as e:
+    write_to_screen_queue('Could not record the build history: ' + str(e) + '\n')
+
+# end - record_build_history
+
+
 def run_PIO(dummy):
 
   global build_type
@@ -919,6 +938,7 @@ def run_PIO(dummy):
   import sys
 
   print('starting platformio')
+  build_started = time.time()
 
   if build_type == 'build':
     # platformio run -e  target_env
@@ -987,9 +1007,14 @@ def run_PIO(dummy):
     for line in iter(pio_subprocess.stdout.readline, ''):
       line_print(line.replace('\n', ''))
   else:
+    build_log = []
     for line in iter(pio_subprocess.stdout.readline, b''):
       line = line.decode('utf-8')
+      build_log.append(line)
       line_print(line.replace('\n', ''))
+    if build_type == 'build':
+      status = 'built' if pio_subprocess.wait() == 0 else 'failed'
+      record_build_history(status, time.time() - build_started, ''.join(build_log))
 
 # append info used to run PlatformIO
   write_to_screen_queue('\nBoard name: ' + board_name + '\n')  # put build info at the bottom of the screen
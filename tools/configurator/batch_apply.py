@@ -0,0 +1,316 @@
+# batch_apply.py (C) Thinkersbluff, 2025
+'''Apply a flash card objective or a list of define edits to many config/* examples at once.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Edits are written as:
+#   NAME=value    enable NAME and set its value
+#   +NAME         enable NAME (uncomment it)
+#   -NAME         disable NAME (comment it out)
+#   NAME!         flip a true/false value
+#
+# An objective is a flash card (by id or objective text). Flash cards name the
+# defines to change but not the new values, so an objective supplies the list
+# of allowed names and the file to look in first; the values come from the
+# edit list. Edits to names outside the card are rejected.
+#
+# Each define is found with ConfigModel and only its own line is rewritten:
+# indentation, spacing and the trailing comment are kept. Files are written
+# with ConfigFile, so line endings and encoding are preserved and each save is
+# atomic. Multi-line (backslash-continued) defines are reported, not edited.
+#
+# Usage:
+#   python3 batch_apply.py --objective max_print_temp HEATER_0_MAXTEMP=300 --dry-run
+#   python3 batch_apply.py --config 'btt-skr-cr6-*' +BLTOUCH -PROBE_MANUALLY
+#   python3 batch_apply.py --edits-file edits.json --json report.json
+
+import argparse
+import concurrent.futures
+import difflib
+import fnmatch
+import json
+import os
+import re
+import sys
+import time
+
+from config_file import ConfigFile
+from config_search import CONFIG_FILE_NAMES, find_repo_root
+from define_model import ConfigModel, DEFINE_RE, split_comment
+from flash_cards import load_flash_cards
+
+EDIT_RE = re.compile(r'^\s*(?:([+-])\s*([A-Za-z_]\w*)|([A-Za-z_]\w*)\s*(?:(!)|=\s*(.*?)))\s*$')
+SET, ENABLE, DISABLE, TOGGLE = 'set', 'enable', 'disable', 'toggle'
+BOOLEANS = {'true': 'false', 'false': 'true'}
+
+
+class Edit:  # pylint: disable=too-few-public-methods
+    '''One change to one define.'''
+    __slots__ = ('name', 'action', 'value')
+
+    def __init__(self, name, action, value=None):
+        self.name = name
+        self.action = action
+        self.value = value
+
+    def __repr__(self):
+        return {SET: f'{self.name}={self.value}', ENABLE: f'+{self.name}',
+                DISABLE: f'-{self.name}', TOGGLE: f'{self.name}!'}[self.action]
+
+
+def parse_edit(text):
+    '''Parse one edit string; raise ValueError if it is not NAME=value, +NAME, -NAME or NAME!.'''
+    match = EDIT_RE.match(text)
+    if not match:
+        raise ValueError(f'Invalid edit: {text!r} (use NAME=value, +NAME, -NAME or NAME!)')
+    sign, signed_name, name, bang, value = match.groups()
+    if sign:
+        return Edit(signed_name, ENABLE if sign == '+' else DISABLE)
+    if bang:
+        return Edit(name, TOGGLE)
+    return Edit(name, SET, value)
+
+
+def find_card(cards, objective):
+    '''Return the flash card whose id or objective text matches objective.'''
+    for card in cards:
+        if objective in (card.get('id'), card.get('objective')):
+            return card
+    raise ValueError(f'No flash card with id or objective {objective!r}')
+
+
+def check_objective(card, edits):
+    '''Raise ValueError unless edits are non-empty and only touch the card's keywords and related settings.'''
+    allowed = list(card.get('keywords', [])) + list(card.get('related_settings', []))
+    if not edits:
+        raise ValueError(f'Objective {card["objective"]!r} needs values, e.g. {allowed[0] if allowed else "NAME"}=...')
+    outside = [edit.name for edit in edits if edit.name not in allowed]
+    if outside:
+        raise ValueError(f'{", ".join(outside)} not part of objective {card["objective"]!r} ({", ".join(allowed)})')
+
+
+def rewrite_line(text, enabled, value=None):
+    '''Return the #define line text with its enabled state and (optionally) value replaced.'''
+    match = DEFINE_RE.match(text)
+    indent, _, name, args, rest = match.groups()
+    code, _ = split_comment(rest)
+    comment = rest[len(code):]
+    if value is not None:
+        lead = code[:len(code) - len(code.lstrip())] or ' '
+        trail = code[len(code.rstrip()):] or (' ' if comment else '')
+        code = f'{lead}{value}{trail}' if value else trail
+    return f'{indent}{"" if enabled else "//"}#define {name}{args or ""}{code}{comment}'
+
+
+def _plan_edit(model, edit):
+    '''Return (line_num, new_text, warning) for edit in model, or raise ValueError.'''
+    defines = model.by_name.get(edit.name, [])
+    define = model.find(edit.name)
+    if define.end != define.start:
+        raise ValueError(f'{edit.name} spans lines {define.start + 1}-{define.end + 1}; edit it by hand')
+    warning = None
+    if sum(d.enabled for d in defines) > 1:
+        warning = f'{edit.name} is enabled {sum(d.enabled for d in defines)} times; changed line {define.start + 1} only'
+    text = model.lines[define.start]
+    if edit.action == ENABLE:
+        return define.start, rewrite_line(text, True), warning
+    if edit.action == DISABLE:
+        return define.start, rewrite_line(text, False), warning
+    if edit.action == TOGGLE:
+        if define.value.lower() not in BOOLEANS:
+            raise ValueError(f'{edit.name} = {define.value!r} is not true/false')
+        flipped = BOOLEANS[define.value.lower()]
+        return define.start, rewrite_line(text, define.enabled, flipped), warning
+    return define.start, rewrite_line(text, True, edit.value), warning
+
+
+class ConfigReport:  # pylint: disable=too-few-public-methods
+    '''What apply_edits did (or would do) to one config directory.'''
+    def __init__(self, label):
+        self.label = label
+        self.changes = []    # (file name, line number, old text, new text)
+        self.unchanged = []  # edits that were already in place
+        self.errors = []
+        self.warnings = []
+        self.diff = ''
+
+    def as_dict(self):
+        return {'config': self.label,
+                'changes': [{'file': f, 'line': n + 1, 'old': old, 'new': new} for f, n, old, new in self.changes],
+                'unchanged': self.unchanged, 'warnings': self.warnings, 'errors': self.errors}
+
+
+def apply_edits(directory, edits, dry_run=False, label=None, first_file=None):
+    '''Apply edits to the Configuration*.h in directory; return a ConfigReport.
+
+    Nothing is written for a directory where any edit failed.
+    '''
+    report = ConfigReport(label or os.path.basename(directory))
+    edited_files = []
+    file_names = sorted(CONFIG_FILE_NAMES, key=lambda name: name != first_file)
+    remaining = list(edits)
+    for file_name in file_names:
+        path = os.path.join(directory, file_name)
+        if not remaining or not os.path.isfile(path):
+            continue
+        config_file = ConfigFile.load(path)
+        text = '\n'.join(config_file.lines)
+        # Only parse files that mention one of the names
+        if not any(edit.name in text for edit in remaining):
+            continue
+        model = ConfigModel(config_file.lines)
+        changes = {}
+        for edit in list(remaining):
+            if edit.name not in model.by_name:
+                continue
+            remaining.remove(edit)
+            try:
+                line_num, new_text, warning = _plan_edit(model, edit)
+            except ValueError as e:
+                report.errors.append(f'{file_name}: {e}')
+                continue
+            if warning:
+                report.warnings.append(f'{file_name}: {warning}')
+            old_text = changes.get(line_num, config_file.lines[line_num])
+            if new_text == old_text:
+                report.unchanged.append(repr(edit))
+                continue
+            changes[line_num] = new_text
+            model.set_line(line_num, new_text)
+        try:
+            patch = config_file.apply(changes)
+        except ValueError as e:
+            report.errors.append(f'{file_name}: {e}')
+            continue
+        for line_num, old, new in patch:
+            report.changes.append((file_name, line_num, old, new))
+        if patch:
+            before = list(config_file.lines)
+            for line_num, old, _ in patch:
+                before[line_num] = old
+            report.diff += ''.join(difflib.unified_diff(
+                [line + '\n' for line in before], [line + '\n' for line in config_file.lines],
+                f'a/{report.label}/{file_name}', f'b/{report.label}/{file_name}', n=1))
+            edited_files.append(config_file)
+    for edit in remaining:
+        report.errors.append(f'{edit.name} not found')
+    if not dry_run and not report.errors:
+        for config_file in edited_files:
+            config_file.save()
+    return report
+
+
+def select_configs(repo_root, patterns=None):
+    '''{example: directory} for the config/* examples matching any of the fnmatch patterns (default: all).'''
+    config_dir = os.path.join(repo_root, 'config')
+    selected = {}
+    for example in sorted(os.listdir(config_dir)):
+        directory = os.path.join(config_dir, example)
+        if not os.path.isfile(os.path.join(directory, 'Configuration.h')):
+            continue
+        if not patterns or any(fnmatch.fnmatch(example, pattern) for pattern in patterns):
+            selected[example] = directory
+    return selected
+
+
+def apply_to_configs(repo_root, edits, patterns=None, dry_run=False, jobs=None, first_file=None):  # pylint: disable=too-many-arguments
+    '''Apply edits to every selected example in parallel; return ConfigReports in example order.'''
+    configs = select_configs(repo_root, patterns)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {example: pool.submit(apply_edits, directory, edits, dry_run, example, first_file)
+                   for example, directory in configs.items()}
+        reports = []
+        for example, future in futures.items():
+            try:
+                reports.append(future.result())
+            except (OSError, ValueError) as e:
+                report = ConfigReport(example)
+                report.errors.append(str(e))
+                reports.append(report)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply define edits or a flash card objective to config/* examples.')
+    parser.add_argument('edits', nargs='*', help='NAME=value, +NAME, -NAME or NAME!')
+    parser.add_argument('--objective', help='flash card id or objective text the edits belong to')
+    parser.add_argument('--edits-file', help='JSON file: {"objective": ..., "edits": [...], "configs": [...]}')
+    parser.add_argument('--config', dest='configs', action='append', default=None,
+                        help='example name pattern, may be repeated (default: all examples)')
+    parser.add_argument('--dry-run', action='store_true', help='report and show the diff, but do not write files')
+    parser.add_argument('--diff', action='store_true', help='print a unified diff of the changes')
+    parser.add_argument('--json', dest='json_path', help='write the per-config report as JSON to this file')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='parallel workers (default: CPU count)')
+    parser.add_argument('--repo', default=None, help='repository root (default: auto-detect)')
+    # -NAME looks like an option to argparse, so take those edits out first (define names are upper case)
+    argv = sys.argv[1:] if argv is None else list(argv)
+    disables = [arg for arg in argv if re.match(r'^-[A-Z_][A-Z0-9_]*$', arg)]
+    args = parser.parse_intermixed_args([arg for arg in argv if arg not in disables])
+
+    repo_root = args.repo or find_repo_root()
+    if not repo_root:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    edit_texts = list(args.edits) + disables
+    objective = args.objective
+    patterns = args.configs
+    if args.edits_file:
+        with open(args.edits_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        edit_texts += data.get('edits', [])
+        objective = objective or data.get('objective')
+        patterns = patterns or data.get('configs')
+    try:
+        edits = [parse_edit(text) for text in edit_texts]
+        first_file = None
+        if objective:
+            card = find_card(load_flash_cards(), objective)
+            check_objective(card, edits)
+            first_file = card.get('files to edit') or None
+        elif not edits:
+            raise ValueError('Nothing to do: give edits and/or --objective')
+    except ValueError as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    reports = apply_to_configs(repo_root, edits, patterns, args.dry_run, args.jobs, first_file)
+    elapsed = time.perf_counter() - start
+    failed = 0
+    for report in reports:
+        if report.errors:
+            status = 'ERROR' if args.dry_run else 'ERROR (not written)'
+        else:
+            status = ('would change' if args.dry_run else 'changed') if report.changes else 'unchanged'
+        failed += bool(report.errors)
+        print(f'{report.label:<48} {status:<19} {len(report.changes)} line(s)')
+        for file_name, line_num, old, new in report.changes:
+            print(f'    {file_name}:{line_num + 1}: {old.strip()}  ->  {new.strip()}')
+        for message in report.warnings:
+            print(f'    warning: {message}')
+        for message in report.errors:
+            print(f'    error: {message}')
+    if args.diff:
+        print(''.join(report.diff for report in reports), end='')
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'dry_run': args.dry_run, 'edits': [repr(e) for e in edits],
+                       'configs': [report.as_dict() for report in reports]}, f, indent=2)
+    changed = sum(bool(report.changes) for report in reports)
+    print(f'{len(reports)} configs, {changed} {"would change" if args.dry_run else "changed"}, '
+          f'{failed} with errors, {elapsed:.2f} s', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
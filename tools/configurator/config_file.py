@@ -0,0 +1,166 @@
+# config_file.py (C) Thinkersbluff, 2025
+'''Line-level editing and atomic saving of a configuration file.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# ConfigFile keeps the file as loaded: the encoded bytes of every line and the
+# line ending each one had (\n, \r\n, or none on an unterminated last line).
+# Only lines that are edited are decoded into new text and re-encoded, so a
+# saved file is byte-for-byte the original apart from the edited lines.
+#
+# Every call to apply() is one entry in the undo journal: a list of
+# (line_num, old_text, new_text) patches. undo() and revert() only touch the
+# lines named in the journal.
+#
+# save() writes to a temporary file in the target directory, fsyncs it and
+# renames it over the target, so a crash leaves either the old file or the new
+# one, never a truncated Configuration.h.
+
+import codecs
+import logging
+import os
+import shutil
+import tempfile
+
+
+def detect_encoding(data):
+    '''Return the codec name that decodes data: utf-8 (with or without BOM), else latin-1.'''
+    if data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _split_ending(raw):
+    '''Split one raw line (bytes, with its terminator) into (body, ending).'''
+    if raw.endswith(b'\r\n'):
+        return raw[:-2], b'\r\n'
+    if raw.endswith(b'\n') or raw.endswith(b'\r'):
+        return raw[:-1], raw[-1:]
+    return raw, b''
+
+
+class ConfigFile:
+    '''The lines of one configuration file plus the edits made to them.'''
+    def __init__(self, data=b'', path=None):
+        self.path = path
+        self.encoding = detect_encoding(data)
+        self.bom = codecs.BOM_UTF8 if self.encoding == 'utf-8-sig' else b''
+        codec = 'utf-8' if self.bom else self.encoding
+        self._codec = codec
+        self.raw = []        # encoded line bodies, without line endings
+        self.endings = []    # line ending of each line as bytes
+        self.lines = []      # decoded text of each line
+        for raw_line in data[len(self.bom):].splitlines(keepends=True):
+            body, ending = _split_ending(raw_line)
+            self.raw.append(body)
+            self.endings.append(ending)
+            self.lines.append(body.decode(codec))
+        self.original = {}   # line_num -> text as loaded, for every line edited since then
+        self.journal = []    # undo journal: list of [(line_num, old_text, new_text), ...]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read(), path)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def dirty(self):
+        '''Line numbers whose text differs from the file as loaded.'''
+        return {n for n, text in self.original.items() if self.lines[n] != text}
+
+    def _set(self, line_num, text):
+        if line_num not in self.original:
+            self.original[line_num] = self.lines[line_num]
+        self.lines[line_num] = text
+        self.raw[line_num] = text.encode(self._codec)
+
+    def apply(self, changes):
+        '''Apply {line_num: text} as one undoable edit; return the patches actually made.
+        Raises ValueError, changing nothing, if a line has characters the file's encoding cannot hold.'''
+        patch = [(n, self.lines[n], text) for n, text in sorted(changes.items()) if self.lines[n] != text]
+        # Check every line first, so an edit that cannot be written leaves the file unchanged
+        for line_num, _, text in patch:
+            try:
+                text.encode(self._codec)
+            except UnicodeEncodeError as e:
+                raise ValueError(f'Line {line_num + 1}: {text[e.start:e.end]!r} cannot be written to a {self.encoding} file') from e
+        for line_num, _, text in patch:
+            self._set(line_num, text)
+        if patch:
+            self.journal.append(patch)
+        return patch
+
+    def undo(self):
+        '''Undo the last apply(); return {line_num: text} of the restored lines.'''
+        if not self.journal:
+            return {}
+        restored = {}
+        for line_num, old, _ in reversed(self.journal.pop()):
+            self._set(line_num, old)
+            restored[line_num] = old
+        return restored
+
+    def revert(self):
+        '''Restore every edited line to its loaded text; return {line_num: text} of the restored lines.'''
+        restored = {n: text for n, text in self.original.items() if self.lines[n] != text}
+        for line_num, text in restored.items():
+            self._set(line_num, text)
+        self.journal = []
+        return restored
+
+    def to_bytes(self):
+        return self.bom + b''.join(body + ending for body, ending in zip(self.raw, self.endings))
+
+    def save(self, path=None):
+        '''Write the file atomically to path (default: where it was loaded from).'''
+        path = path or self.path
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.to_bytes())
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            else:
+                # mkstemp creates the file 0600; give a new file the mode open() would have
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        if hasattr(os, 'O_DIRECTORY'):
+            # Make the rename itself durable
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        logging.info('Saved %s (%d edited lines, %s, %d undo steps)', path, len(self.dirty), self.encoding, len(self.journal))
+        if path == self.path:
+            # The file on disk now matches, so later edits are measured from here
+            self.original = {}
+        return path
@@ -0,0 +1,295 @@
+# config_search.py (C) Thinkersbluff, 2025
+'''Search the #defines of every config/* example at once.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The index maps every define name to its state and value in each example's
+# Configuration.h and Configuration_adv.h. It is saved to
+# .pio/configurator/define_index.json and refreshed lazily: a file is only
+# re-hashed when its size or mtime changed, and only re-parsed when its sha256
+# changed.
+#
+# Query terms (all terms must match):
+#   BLTOUCH                           define is enabled
+#   !BLTOUCH                          define is disabled or absent
+#   Z_PROBE_OFFSET_RANGE_MIN<-10      enabled and numeric value compares (<, <=, >, >=)
+#   SERIAL_PORT=1  SERIAL_PORT!=1     enabled and value equals / differs
+#   CUSTOM_MACHINE_NAME~CR-6          enabled and value contains text
+#
+# Usage:
+#   python3 config_search.py query BLTOUCH "Z_PROBE_OFFSET_RANGE_MIN<-10"
+#   python3 config_search.py show HEATER_0_MAXTEMP BLTOUCH
+#   python3 config_search.py export --format csv --differing -o matrix.csv
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+
+from define_model import ConfigModel
+
+INDEX_VERSION = 1
+CONFIG_FILE_NAMES = ('Configuration.h', 'Configuration_adv.h')
+TERM_RE = re.compile(r'^(!?)([A-Za-z_]\w*)\s*(<=|>=|!=|<|>|=|~)?\s*(.*)$')
+NUMBER_RE = re.compile(r'^\(?\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)[fFlLuU]*\s*\)?$')
+
+
+def find_repo_root(start=None):
+    '''Walk up from start (default: this file) to the directory holding platformio.ini.'''
+    cur_dir = os.path.abspath(start or os.path.dirname(os.path.abspath(__file__)))
+    while True:
+        if os.path.isfile(os.path.join(cur_dir, 'platformio.ini')):
+            return cur_dir
+        parent = os.path.dirname(cur_dir)
+        if parent == cur_dir:
+            return None
+        cur_dir = parent
+
+
+def as_number(value):
+    '''Return value as a float if it is a plain numeric literal, else None.'''
+    match = NUMBER_RE.match(value.strip())
+    return float(match.group(1)) if match else None
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def parse_defines(path):
+    '''Return {name: [enabled, value]} for path, preferring an enabled occurrence of each name.'''
+    model = ConfigModel.from_file(path)
+    return {name: [define.enabled, define.value] for name, define in
+            ((name, model.find(name)) for name in model.names())}
+
+
+class CrossConfigIndex:
+    '''Define name -> state/value in every config/<example>, cached on disk by file hash.'''
+    def __init__(self, repo_root, cache_path=None):
+        self.repo_root = repo_root
+        self.config_dir = os.path.join(repo_root, 'config')
+        self.cache_path = cache_path or os.path.join(repo_root, '.pio', 'configurator', 'define_index.json')
+        self.files = {}      # "example/Configuration.h" -> {"mtime_ns", "size", "sha256", "defines"}
+        self.by_name = {}    # name -> {example: (enabled, value, file name)}
+        self.configs = []
+        self.stats = {'hashed': 0, 'parsed': 0}
+        self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.files = data.get('files', {})
+        except (OSError, ValueError):
+            self.files = {}
+
+    def _save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self.files}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def example_folders(self):
+        return sorted(f for f in os.listdir(self.config_dir)
+                      if os.path.isfile(os.path.join(self.config_dir, f, 'Configuration.h')))
+
+    def refresh(self):
+        '''Bring the index up to date with the files on disk; only changed files are re-parsed.'''
+        self.stats = {'hashed': 0, 'parsed': 0}
+        seen = {}
+        dirty = False
+        self.configs = self.example_folders()
+        for example in self.configs:
+            for file_name in CONFIG_FILE_NAMES:
+                path = os.path.join(self.config_dir, example, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                rel = f'{example}/{file_name}'
+                entry = self.files.get(rel)
+                if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                    sha = file_sha256(path)
+                    self.stats['hashed'] += 1
+                    if entry is None or entry['sha256'] != sha:
+                        entry = {'sha256': sha, 'defines': parse_defines(path)}
+                        self.stats['parsed'] += 1
+                    entry['mtime_ns'] = stat.st_mtime_ns
+                    entry['size'] = stat.st_size
+                    dirty = True
+                seen[rel] = entry
+        if dirty or set(seen) != set(self.files):
+            self.files = seen
+            self._save_cache()
+        self._build_by_name()
+        return self
+
+    def _build_by_name(self):
+        self.by_name = {}
+        for rel in sorted(self.files):
+            example, file_name = rel.split('/', 1)
+            for name, (enabled, value) in self.files[rel]['defines'].items():
+                configs = self.by_name.setdefault(name, {})
+                # A define that is enabled in either file wins over a commented-out copy
+                if example not in configs or (enabled and not configs[example][0]):
+                    configs[example] = (enabled, value, file_name)
+
+    def state(self, example, name):
+        '''Return (enabled, value, file name) of name in example, or None if it does not appear.'''
+        return self.by_name.get(name, {}).get(example)
+
+    def query(self, terms):
+        '''Return {example: {name: state}} for the examples matching every term.'''
+        checks = [parse_term(term) for term in terms]
+        results = {}
+        for example in self.configs:
+            states = {}
+            for negate, name, op, operand in checks:
+                state = self.state(example, name)
+                if _term_matches(state, op, operand) == negate:
+                    break
+                states[name] = state
+            else:
+                results[example] = states
+        return results
+
+    def matrix(self, names=None, differing=False):
+        '''Return (names, rows) where rows[name][example] is the display value of name.'''
+        if names is None:
+            names = sorted(self.by_name)
+        rows = {}
+        for name in names:
+            row = {example: display_state(self.state(example, name)) for example in self.configs}
+            if differing and len(set(row.values())) <= 1:
+                continue
+            rows[name] = row
+        return list(rows), rows
+
+    def export(self, fmt='csv', names=None, differing=False):
+        '''Return the define matrix as CSV or JSON text.'''
+        names, rows = self.matrix(names, differing)
+        if fmt == 'json':
+            return json.dumps({'configs': self.configs, 'defines': rows}, indent=2)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['define'] + self.configs)
+        for name in names:
+            writer.writerow([name] + [rows[name][example] for example in self.configs])
+        return out.getvalue()
+
+
+def parse_term(term):
+    '''Split a query term into (negate, name, operator, operand).'''
+    match = TERM_RE.match(term.strip())
+    if not match:
+        raise ValueError(f'Invalid query term: {term!r}')
+    negate, name, op, operand = match.groups()
+    if negate and op:
+        raise ValueError(f'Use != instead of ! with a comparison: {term!r}')
+    if op in ('<', '<=', '>', '>=') and as_number(operand) is None:
+        raise ValueError(f'Numeric comparison needs a number: {term!r}')
+    return bool(negate), name, op, operand.strip()
+
+
+def _term_matches(state, op, operand):
+    if state is None or not state[0]:
+        return False
+    if op is None:
+        return True
+    value = state[1]
+    if op == '~':
+        return operand.lower() in value.lower()
+    if op in ('=', '!='):
+        number, expected = as_number(value), as_number(operand)
+        equal = number == expected if number is not None and expected is not None \
+            else ' '.join(value.split()) == ' '.join(operand.split())
+        return equal if op == '=' else not equal
+    number = as_number(value)
+    if number is None:
+        return False
+    expected = as_number(operand)
+    return {'<': number < expected, '<=': number <= expected,
+            '>': number > expected, '>=': number >= expected}[op]
+
+
+def display_state(state):
+    '''Text for one cell of the define matrix.'''
+    if state is None:
+        return ''
+    enabled, value, _ = state
+    if not enabled:
+        return '(disabled)'
+    return value or '(enabled)'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search the #defines of every config/* example.')
+    parser.add_argument('--repo', default=None, help='repository root (default: auto-detect)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    query_parser = sub.add_parser('query', help='list the examples matching every term')
+    query_parser.add_argument('terms', nargs='+')
+    show_parser = sub.add_parser('show', help='show defines across all examples')
+    show_parser.add_argument('names', nargs='+')
+    export_parser = sub.add_parser('export', help='export the define matrix')
+    export_parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    export_parser.add_argument('--names', nargs='*', default=None, help='only these defines')
+    export_parser.add_argument('--differing', action='store_true', help='only defines that differ between examples')
+    export_parser.add_argument('-o', '--output', default=None, help='output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    repo_root = args.repo or find_repo_root()
+    if not repo_root:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    index = CrossConfigIndex(repo_root).refresh()
+    refresh_ms = (time.perf_counter() - start) * 1000
+
+    if args.command == 'query':
+        try:
+            start = time.perf_counter()
+            results = index.query(args.terms)
+            query_ms = (time.perf_counter() - start) * 1000
+        except ValueError as e:
+            print(f'ERROR: {e}', file=sys.stderr)
+            return 2
+        for example, states in results.items():
+            details = ', '.join(f'{name}={display_state(state)}' for name, state in states.items() if state)
+            print(f'{example:<48} {details}')
+        print(f'{len(results)} of {len(index.configs)} configs match '
+              f'(index refresh {refresh_ms:.1f} ms, {index.stats["parsed"]} files parsed; query {query_ms:.2f} ms)', file=sys.stderr)
+    elif args.command == 'show':
+        for name in args.names:
+            print(name)
+            for example in index.configs:
+                print(f'  {example:<48} {display_state(index.state(example, name)) or "(absent)"}')
+    else:
+        text = index.export(args.format, args.names or None, args.differing)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -47,6 +47,8 @@
 #
 
 
+# Imported first so the start-up trace includes the time spent on the other imports
+from startup_trace import StartupTrace
 import os
 import sys
 import tkinter as tk
@@ -58,8 +60,19 @@ import webbrowser
 import shutil
 # Import flash card logic
 from flash_cards import load_flash_cards
+from line_editor import VirtualLineEditor
+from line_index import LineIndex
+from filter_worker import FilterWorker
+from define_model import ConfigModel
+from config_file import ConfigFile
+from define_diff import DefineDiff, describe
+from config_search import CrossConfigIndex, display_state, parse_term
+import ui_latency
+from keyword_map import KeywordMap
 
 APP_VERSION = "v1.0.0"
+FILTER_DEBOUNCE_MS = 150   # wait this long after the last keystroke before filtering
+FILTER_POLL_MS = 15        # how often to check the filter worker for a result
 
 # Setup logging to file
 logging.basicConfig(
@@ -67,6 +80,8 @@ logging.basicConfig(
     level=logging.DEBUG,
     format='%(asctime)s %(levelname)s %(message)s'
 )
+STARTUP_TRACE = StartupTrace()
+STARTUP_TRACE.mark('imports')
 
 # Resolve file paths correctly, whether running as a PyInstaller bundle or as a local app
 def resource_path(relative_path):
@@ -122,13 +137,17 @@ def get_repo_root():
 REPO_ROOT = get_repo_root()
 CONFIG_DIR = os.path.join(REPO_ROOT, 'config')
 MARLIN_CONFIG_PATH = os.path.join(REPO_ROOT, 'Marlin', 'Configuration.h')
+STARTUP_TRACE.mark('repo root (config.json)')
 
-# Find all example folders containing 'cr6' in their name
-example_folders = [
-    f for f in os.listdir(CONFIG_DIR)
-    if os.path.isdir(os.path.join(CONFIG_DIR, f)) and 'cr6' in f
-]
-example_folders.insert(0, 'Select example...')
+# Example folders are scanned after the window is first drawn; see scan_example_folders()
+example_folders = ['Select example...']
+
+def scan_example_folders():
+    '''Find all example folders containing 'cr6' in their name.'''
+    return [
+        f for f in os.listdir(CONFIG_DIR)
+        if os.path.isdir(os.path.join(CONFIG_DIR, f)) and 'cr6' in f
+    ]
 
 class ConfiguratorApp(tk.Tk):
     '''Main application class for the Marlin Configurator GUI.'''
@@ -136,6 +155,9 @@ class ConfiguratorApp(tk.Tk):
         logging.info('ConfiguratorApp __init__ started')
         super().__init__()
         logging.info('Tkinter __init__ started')
+        # Opt-in callback timing (--trace-ui); see ui_latency.py
+        self.latency_monitor = ui_latency.LatencyMonitor(self, APP_VERSION).install() if ui_latency.trace_requested() else None
+        STARTUP_TRACE.mark('Tk root window')
         self.title(f"Marlin Configurator {APP_VERSION}")
         self.geometry('1280x1024')
 
@@ -158,6 +180,7 @@ class ConfiguratorApp(tk.Tk):
         logging.info('example_menu bind complete')
         self.example_desc_label = tk.Label(self.picklist_frame, text='', font=('Arial', 10), fg="grey", anchor='w', justify='left')
         self.example_desc_label.pack(side='left', padx=(10,0))
+        STARTUP_TRACE.mark('picklist frame')
 
         # Main content frame
         self.content_frame = tk.Frame(self)
@@ -218,10 +241,14 @@ class ConfiguratorApp(tk.Tk):
 
         self.workflow_checkboxes = []
         self.workflow_desc_labels = []
-
+        self.workflow_data = []
+        self.workflow_step = 0
+        self.workflow_completed = []
+        STARTUP_TRACE.mark('default envs + workflow frames')
 
         self.flash_cards = load_flash_cards()
         logging.info('flash_cards loaded')
+        STARTUP_TRACE.mark('flash cards (flash_cards.json)')
 
      # Flash card frame
         self.flash_frame = tk.Frame(self.main_row_frame, bd=1, relief='groove', width=420)
@@ -278,48 +305,12 @@ class ConfiguratorApp(tk.Tk):
         self.flash_card_warnings_label.pack(fill='x')
         logging.info('flash_card_warnings_label packed')
 
-        # Load flash cards using the shared function
-        self.flash_cards = load_flash_cards()
-        logging.info('flash_cards loaded')
-
-        # Objective Keywords subframe
+        # Objective Keywords subframe (filled in by update_flash_card_display after the first paint)
         self.keywords_frame = tk.Frame(self.flash_frame)
         logging.info('keywords_frame created')
         self.keywords_frame.pack(fill='x', padx=10, pady=2)
         logging.info('keywords_frame packed')
-        self.update_flash_card_display()
-        logging.info('update_flash_card_display called after all flash card widgets created')
-
-        workflow_json_path = resource_path('workflow.json')
-        with open(workflow_json_path, 'r', encoding='utf-8') as f:
-            self.workflow_data = json.load(f)["workflow"]
-        logging.info('workflow_data loaded')
-        self.workflow_step = 0
-        self.workflow_completed = [False] * len(self.workflow_data)
-
-        for step in self.workflow_data:
-            cb = tk.Checkbutton(
-                self.workflow_frame,
-                text=step['step'],
-                variable=tk.BooleanVar(value=False),
-                font=('Arial', 10),
-                anchor='w',
-                justify='left',
-                wraplength=390  #  to match frame width
-            )
-            cb.pack(fill='x', expand=True, pady=(0,0), anchor='w')
-            self.workflow_checkboxes.append(cb)
-            desc_label = tk.Label(
-                self.workflow_frame,
-                text=step.get('description', ''),
-                font=('Arial', 9),
-                anchor='w',
-                justify='left',
-                wraplength=390,  #  to match frame width
-                fg='gray'
-            )
-            desc_label.pack(fill='x', expand=True, pady=(0,8), anchor='w')
-            self.workflow_desc_labels.append(desc_label)
+        STARTUP_TRACE.mark('flash card panel')
 
         self.workflow_frame.bind('<Configure>', self._on_workflow_configure)
 
@@ -408,6 +399,10 @@ class ConfiguratorApp(tk.Tk):
         logging.info('load_selected_button created')
         self.load_selected_button.pack(side='left', padx=5)
         logging.info('load_selected_button packed')
+        self.compare_example_button = tk.Button(self.controls_frame, text='Compare with Example', command=self.show_define_diff)
+        self.compare_example_button.pack(side='left', padx=5)
+        self.search_configs_button = tk.Button(self.controls_frame, text='Search All Configs', command=self.show_config_search)
+        self.search_configs_button.pack(side='left', padx=5)
 
         # Keyword filter subframe
         self.filter_frame = tk.Frame(self.editor_frame)
@@ -424,7 +419,7 @@ class ConfiguratorApp(tk.Tk):
         self.keyword_entry.pack(side='left', padx=5)
         logging.info('keyword_entry packed')
         # Bind filter to key release for live filtering
-        self.keyword_entry.bind('<KeyRelease>', lambda e: self.apply_keyword_filter())
+        self.keyword_entry.bind('<KeyRelease>', lambda e: self.schedule_keyword_filter())
         logging.info('keyword_entry bound to KeyRelease for live filtering')
         self.view_in_context_button = tk.Button(self.filter_frame, text='View in Context', command=self.view_in_context)
         logging.info('view_in_context_button created')
@@ -438,6 +433,8 @@ class ConfiguratorApp(tk.Tk):
             command=self.apply_keyword_filter
         )
         self.hide_comments_check.pack(side='left', padx=5)
+        self.match_count_label = tk.Label(self.filter_frame, text='', fg='grey')
+        self.match_count_label.pack(side='left', padx=5)
 
         logging.debug('init: keyword_vars=%r', getattr(self, 'keyword_vars', None))
 
@@ -450,6 +447,10 @@ class ConfiguratorApp(tk.Tk):
         logging.info('save_edit_button created')
         self.save_edit_button.pack(side='left', padx=5)
         logging.info('save_edit_button packed')
+        self.undo_edit_button = tk.Button(self.edit_buttons_frame, text='Undo Edit', command=self.undo_edit)
+        self.undo_edit_button.pack(side='left', padx=5)
+        self.revert_edits_button = tk.Button(self.edit_buttons_frame, text='Revert All', command=self.revert_edits)
+        self.revert_edits_button.pack(side='left', padx=5)
         # Removed original Save File button from edit_buttons_frame (now below file label)
         self.build_firmware_button = tk.Button(self.edit_buttons_frame, text='Build Firmware', command=self.build_firmware)
         logging.info('build_firmware_button created')
@@ -464,36 +465,90 @@ class ConfiguratorApp(tk.Tk):
         except Exception:
             logging.exception('Failed to call update_default_envs_label during init')
 
-        # Editor Canvas and scrollbar
-        self.editor_canvas = tk.Canvas(self.editor_frame)
-        logging.info('editor_frame canvas created')
-        self.editor_yscrollbar = tk.Scrollbar(self.editor_frame, orient='vertical', command=self.editor_canvas.yview)
-        logging.info('editor_frame vertical scrollbar created')
-        self.editor_canvas.configure(yscrollcommand=self.editor_yscrollbar.set)
-        self.editor_yscrollbar.pack(side='right', fill='y')
-        logging.info('editor_frame vertical scrollbar packed')
-        self.editor_xscrollbar = tk.Scrollbar(self.editor_frame, orient='horizontal', command=self.editor_canvas.xview)
-        logging.info('editor_frame horizontal scrollbar created')
-        self.editor_canvas.configure(xscrollcommand=self.editor_xscrollbar.set)
-        self.editor_xscrollbar.pack(side='top', fill='x')
-        logging.info('editor_frame horizontal scrollbar packed')
-
-        self.editor_canvas.pack(side='left', fill='both', expand=True)
-        logging.info('editor_frame canvas packed')
-        self.lines_frame = tk.Frame(self.editor_canvas)
-        logging.info('lines_frame created')
-        self.lines_frame_id = self.editor_canvas.create_window((0, 0), window=self.lines_frame, anchor='nw')
-        logging.info('lines_frame_id created')
-
-        self.editor_canvas.bind_all('<MouseWheel>', self._on_editor_mousewheel)
-        self.editor_canvas.bind_all('<Button-4>', self._on_editor_mousewheel)
-        self.editor_canvas.bind_all('<Button-5>', self._on_editor_mousewheel)
+        # Virtualized line editor (only the visible rows get an Entry widget)
+        self.line_editor = VirtualLineEditor(self.editor_frame, on_edit=self._on_entry_edit)
+        logging.info('line_editor created')
+        self.line_editor.pack(side='top', fill='both', expand=True)
+        logging.info('line_editor packed')
+
+        self.line_editor.bind_all('<MouseWheel>', self._on_editor_mousewheel)
+        self.line_editor.bind_all('<Button-4>', self._on_editor_mousewheel)
+        self.line_editor.bind_all('<Button-5>', self._on_editor_mousewheel)
 
         # Initialize editor state variables
-        self.modified_entries = []
-        self.displayed_indices = []
         self.lines = []
         self.base_lines = []
+        self.line_index = LineIndex()
+        self.config_model = ConfigModel()
+        self.config_file = ConfigFile()
+        self.filter_worker = FilterWorker()
+        self.filter_generation = 0
+        self.filter_after_id = None
+        self.filter_poll_id = None
+        self.filter_matched = None
+        STARTUP_TRACE.mark('editor panel')
+
+        # Everything that is not needed to draw the first window is built after it has been drawn.
+        # after_idle() would run before the window is even mapped, so wait for the Map event.
+        self._first_paint_binding = self.bind('<Map>', self._on_map, add='+')
+
+    def _on_map(self, event):
+        '''Once the main window is mapped, draw it and record the time to first paint.'''
+        if event.widget is not self or self._first_paint_binding is None:
+            return
+        self.unbind('<Map>', self._first_paint_binding)
+        self._first_paint_binding = None
+        STARTUP_TRACE.mark('geometry + map')
+        # Widgets redraw in idle callbacks, so this completes the first frame
+        self.update_idletasks()
+        STARTUP_TRACE.mark('first paint (drawing)')
+        STARTUP_TRACE.report('first paint')
+        self.after(1, self._build_deferred)
+
+    def _build_deferred(self):
+        '''Build the panels that are not needed for the first paint.'''
+        example_folders[1:] = scan_example_folders()
+        self.example_menu.config(values=example_folders)
+        STARTUP_TRACE.mark('scan config/ for examples')
+        self._build_workflow_steps()
+        STARTUP_TRACE.mark('workflow steps (workflow.json)')
+        self.update_flash_card_display()
+        logging.info('update_flash_card_display called after all flash card widgets created')
+        STARTUP_TRACE.mark('flash card details + keywords')
+        STARTUP_TRACE.report('deferred panels built')
+
+    def _build_workflow_steps(self):
+        '''Load workflow.json and create a checkbox and description for each step.'''
+        workflow_json_path = resource_path('workflow.json')
+        with open(workflow_json_path, 'r', encoding='utf-8') as f:
+            self.workflow_data = json.load(f)["workflow"]
+        logging.info('workflow_data loaded')
+        self.workflow_step = 0
+        self.workflow_completed = [False] * len(self.workflow_data)
+
+        for step in self.workflow_data:
+            cb = tk.Checkbutton(
+                self.workflow_frame,
+                text=step['step'],
+                variable=tk.BooleanVar(value=False),
+                font=('Arial', 10),
+                anchor='w',
+                justify='left',
+                wraplength=390  #  to match frame width
+            )
+            cb.pack(fill='x', expand=True, pady=(0,0), anchor='w')
+            self.workflow_checkboxes.append(cb)
+            desc_label = tk.Label(
+                self.workflow_frame,
+                text=step.get('description', ''),
+                font=('Arial', 9),
+                anchor='w',
+                justify='left',
+                wraplength=390,  #  to match frame width
+                fg='gray'
+            )
+            desc_label.pack(fill='x', expand=True, pady=(0,8), anchor='w')
+            self.workflow_desc_labels.append(desc_label)
 
     def _on_workflow_configure(self, event):  # pylint: disable=unused-argument
         self.workflow_canvas.configure(scrollregion=self.workflow_canvas.bbox('all'))
@@ -504,9 +559,9 @@ class ConfiguratorApp(tk.Tk):
 
     def _on_editor_mousewheel(self, event):
         if event.num == 5 or event.delta == -120:
-            self.editor_canvas.yview_scroll(1, 'units')
+            self.line_editor.scroll(1)
         elif event.num == 4 or event.delta == 120:
-            self.editor_canvas.yview_scroll(-1, 'units')
+            self.line_editor.scroll(-1)
 
     def on_config_file_select(self, value=None):
         '''Handle config file dropdown selection: only set the file to be loaded, do not load it.'''
@@ -596,57 +651,31 @@ class ConfiguratorApp(tk.Tk):
     def show_lines(self, highlight_line_num=None, scroll_to_index=None):
         '''Display lines in the editor area, filtered by match attribute if present. Optionally highlight a line and scroll to a given index.'''
         logging.info('show_lines called')
-        if self.lines_frame is None:
-            return
-        # Clear previous widgets
-        for widget in self.lines_frame.winfo_children():
-            if widget != self.filter_frame:
-                widget.destroy()
-        self.modified_entries = []
-        self.displayed_indices = []
         # Always use self.base_lines for filtering and editing
-        if self.base_lines and any('match' in line for line in self.base_lines):
-            lines_to_display = [line for line in self.base_lines if line.get('match', True)]
-        elif self.base_lines:
-            lines_to_display = self.base_lines
+        source = self.base_lines if self.base_lines else self.lines
+        if any('match' in line for line in source):
+            rows = [i for i, line in enumerate(source) if line.get('match', True)]
         else:
-            lines_to_display = self.lines
-        logging.info("Displaying %d lines, first line_num: %s", len(lines_to_display), lines_to_display[0]['line_num'] if lines_to_display else 'None')
-        max_lines = 200  # Limit for testing large files
-        for idx, line in enumerate(lines_to_display[:max_lines]):
-            entry = tk.Entry(self.lines_frame, width=120)
-            entry.bind('<KeyRelease>', self._on_entry_edit)
-            entry.insert(0, line["content"])
-            entry.pack(fill='x', padx=2, pady=1)
-            self.modified_entries.append(entry)
-            self.displayed_indices.append(line.get('line_num', idx))
-            # Highlight if needed
-            if highlight_line_num is not None and line.get('line_num', idx) == highlight_line_num:
-                entry.config(bg='yellow')
-        self.lines_frame.update_idletasks()
-        self.editor_canvas.config(scrollregion=self.editor_canvas.bbox(self.lines_frame_id))
-        self.update_idletasks()
+            rows = list(range(len(source)))
+        logging.info("Displaying %d lines, first line_num: %s", len(rows), source[rows[0]]['line_num'] if rows else 'None')
+        self.line_editor.set_rows(source, rows, highlight_line_num=highlight_line_num)
         # Scroll so that the highlighted line is in the desired position
         if highlight_line_num is not None:
-            try:
-                idx = [line.get('line_num', i) for i, line in enumerate(lines_to_display[:max_lines])].index(highlight_line_num)
-                if scroll_to_index is not None:
-                    total = len(lines_to_display[:max_lines])
-                    frac = max(0, min(1, (idx - scroll_to_index) / max(1, total)))
-                    self.after(10, lambda: self.editor_canvas.yview_moveto(frac))
-                else:
-                    self.after(10, lambda: self.canvas.yview_moveto(0))
-            except Exception as e:  # pylint: disable=broad-exception-caught
-                logging.warning('Could not scroll to highlighted line: %s', e)
-        else:
-            self.after(10, lambda: self.editor_canvas.yview_moveto(0))
+            self.line_editor.scroll_to_line(highlight_line_num, offset=scroll_to_index or 0)
 
-    def _on_entry_edit(self, event):  # pylint: disable=unused-argument
+    def _on_entry_edit(self, line):  # pylint: disable=unused-argument
         self.unsaved_edits = True
 
+    def schedule_keyword_filter(self):
+        '''Filter after typing pauses for FILTER_DEBOUNCE_MS, so fast typing only runs the last query.'''
+        if self.filter_after_id is not None:
+            self.after_cancel(self.filter_after_id)
+        self.filter_after_id = self.after(FILTER_DEBOUNCE_MS, self.apply_keyword_filter)
+
     def apply_keyword_filter(self):
         '''Filter displayed lines based on keywords, text input, and hide comments option.'''
         logging.info('apply_keyword_filter called')
+        self.filter_after_id = None
         if not self.base_lines:
             return
         keywords = [kw for kw, var in getattr(self, 'keyword_vars', []) if var.get()]
@@ -655,51 +684,60 @@ class ConfiguratorApp(tk.Tk):
         # Promote to INFO so visible in frozen logs
         logging.info('apply_keyword_filter: active_keywords=%r filter_text=%r hide_comments=%r base_lines=%d', keywords, filter_text, hide_comments, len(self.base_lines))
 
-        # Ensure we explicitly set 'match' on every base line so show_lines uses the filter
-        for line in self.base_lines:
-            match = True
-            if keywords:
-                match = any(kw.lower() in line["content"].lower() for kw in keywords)
-            if filter_text:
-                match = match and (filter_text in line["content"].lower())
-            if hide_comments:
-                stripped = line["content"].strip()
-                # Hide lines that start with // or * or /* or are empty or only whitespace
-                if stripped.startswith("//") or stripped.startswith("*") or stripped.startswith("/*") or stripped == "":
-                    match = False
-            line['match'] = match
-
-        # Diagnostic summary: how many lines matched and a small sample of matched line numbers
-        try:
-            matched_indices = [ln.get('line_num') for ln in self.base_lines if ln.get('match')]
-            matched_count = len(matched_indices)
-            sample = matched_indices[:10]
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            logging.exception('Error computing matched indices: %s', e)
-            matched_count = 0
-            sample = []
-        logging.info('apply_keyword_filter: matched_count=%d sample_line_nums=%r', matched_count, sample)
-
-        self.show_lines()
+        # The query runs on the filter worker; _poll_keyword_filter applies the newest result
+        self.filter_generation = self.filter_worker.submit(self.line_index, keywords, filter_text, hide_comments)
+        if self.filter_matched is not None:
+            self.match_count_label.config(text=f'{len(self.filter_matched)} matching lines (filtering...)')
+        else:
+            self.match_count_label.config(text='filtering...')
+        if self.filter_poll_id is None:
+            self.filter_poll_id = self.after(FILTER_POLL_MS, self._poll_keyword_filter)
+
+    def _poll_keyword_filter(self):
+        '''Sample the filter worker's result queue until the newest query has been applied.'''
+        self.filter_poll_id = None
+        result = self.filter_worker.poll()
+        if result is not None:
+            _, matched, rows = result
+            if matched is None:
+                self.match_count_label.config(text='filter failed')
+                messagebox.showerror('Filter Failed', f'The keyword filter failed:\n{rows}\n\nSee the log for details.')
+            else:
+                self._apply_filter_result(matched, rows)
+        elif self.filter_worker.pending(self.filter_generation):
+            self.filter_poll_id = self.after(FILTER_POLL_MS, self._poll_keyword_filter)
+
+    def _apply_filter_result(self, matched, rows):
+        '''Update the 'match' flags that changed and show the new rows.'''
+        if self.filter_matched is None:
+            changed = range(len(self.base_lines))
+        else:
+            changed = matched ^ self.filter_matched
+        for i in changed:
+            self.base_lines[i]['match'] = i in matched
+        logging.info('apply_keyword_filter: matched_count=%d changed=%d sample_line_nums=%r', len(matched), len(changed), rows[:10])
+        self.match_count_label.config(text=f'{len(matched)} matching lines')
+        if self.filter_matched != matched:
+            self.filter_matched = matched
+            self.line_editor.set_rows(self.base_lines, rows)
 
     def view_in_context(self):
         '''Show +/- 99 lines around the selected line, scroll to selected line, and highlight it.'''
         logging.info('view_in_context called')
-        # Find which entry has focus
-        selected_idx = None
-        for i, entry in enumerate(self.modified_entries):
-            if entry == self.focus_get():
-                selected_idx = i
-                break
-        if selected_idx is None:
+        # Find which line's entry has focus
+        line_num = self.line_editor.focused_line_num()
+        if line_num is None:
             messagebox.showinfo('No Selection', 'Please click on a line to select it before using View in Context.')
             return
-        # Get the line number in the full file
-        if selected_idx >= len(self.displayed_indices):
-            messagebox.showerror('Error', 'Selected line index out of range.')
-            return
-        line_num = self.displayed_indices[selected_idx]
         logging.info('view_in_context: selected line_num=%s', line_num)
+        self.show_line_in_context(line_num)
+
+    def show_line_in_context(self, line_num):
+        '''Display +/- 99 lines around line_num with line_num highlighted.'''
+        # A filter result arriving later must not replace the context view
+        self.filter_worker.cancel()
+        self.filter_matched = None
+        self.match_count_label.config(text='')
         # Set all lines to display False, then set +/- 99 to True
         for line in self.base_lines:
             line['match'] = False
@@ -736,17 +774,22 @@ class ConfiguratorApp(tk.Tk):
             file_path = self.config_files[idx]
         logging.info('load_config_file called with file_path: %s', file_path)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                file_lines = f.readlines()
+            self.config_file = ConfigFile.load(file_path)
             self.lines = [
-                {"line_num": i, "content": line.rstrip('\n'), "display": True, "edited": False}
-                for i, line in enumerate(file_lines)
+                {"line_num": i, "content": line, "display": True, "edited": False}
+                for i, line in enumerate(self.config_file.lines)
             ]
             self.base_lines = self.lines.copy()
+            self.filter_worker.cancel()
+            self.filter_matched = None
+            self.line_index = LineIndex(self.lines)
+            self.config_model = ConfigModel(line['content'] for line in self.lines)
             self.show_lines()
             self.current_file_label.config(text=file_path)
             self.opened_config_path = file_path
             logging.info('load_config_file: opened_config_path set -> %s', self.opened_config_path)
+            # Keyword links exclude the opened file and search its directory, so refresh them once it is set
+            self._refresh_keyword_states()
             # If the actual loaded filename differs from the selected target, highlight the edit label in red
             try:
                 expected = self.selected_config_file.get()
@@ -806,32 +849,97 @@ class ConfiguratorApp(tk.Tk):
 
     def save_edit(self):
         """
-        Save edits from displayed lines into self.base_lines and self.lines, marking edited lines.
-        Only lines currently displayed and changed will be updated and marked as edited.
+        Save pending edits from the line model into self.base_lines and self.lines, marking edited lines.
+        Only lines that were changed in the editor will be updated and marked as edited.
         """
         if not self.unsaved_edits:
             logging.info('save_edit called but no unsaved edits (self.unsaved_edits=%r)', self.unsaved_edits)
             messagebox.showinfo('No Edits', 'There are no unsaved edits to save.')
             return
         logging.info('save_edit called')
-        if not self.base_lines or not self.modified_entries or not self.displayed_indices:
+        if not self.base_lines:
             messagebox.showwarning('No file loaded', 'No file is loaded or no lines are displayed.')
             return
-        for i, idx in enumerate(self.displayed_indices):
-            entry_val = self.modified_entries[i].get()
-            # Update base_lines
-            for line in self.base_lines:
-                if line.get('line_num', None) == idx:
-                    if line['content'] != entry_val:
-                        line['content'] = entry_val
-                        line['edited'] = True
-            # Update lines (full file)
-            if idx < len(self.lines):
-                if self.lines[idx]['content'] != entry_val:
-                    self.lines[idx]['content'] = entry_val
-                    self.lines[idx]['edited'] = True
+        # base_lines and lines share the same line dicts, so one pass updates both
+        changes = {line['line_num']: line['pending'] for line in self.lines if 'pending' in line}
+        try:
+            patch = self.config_file.apply(changes)
+        except ValueError as e:
+            # Keep the pending edits so the offending characters can be corrected
+            messagebox.showerror('Cannot Save Edits', str(e))
+            logging.error('save_edit: %s', e)
+            return
+        for line in self.lines:
+            line.pop('pending', None)
+        self._apply_line_changes({line_num: new for line_num, _, new in patch})
+        self.unsaved_edits = False
         messagebox.showinfo('Edits Saved', 'Your edits have been saved to the full file. Use Save File to write the complete file.')
-        logging.info('Edits saved to lines')
+        logging.info('Edits saved to lines: %d lines changed, %d undo steps', len(patch), len(self.config_file.journal))
+
+    def _apply_line_changes(self, changes):
+        '''Push {line_num: text} from the config file into the line dicts, search index and define model.'''
+        changed_names = set()
+        for line_num, text in changes.items():
+            line = self.lines[line_num]
+            line['content'] = text
+            line.pop('pending', None)
+            line['edited'] = text != self.config_file.original.get(line_num, text)
+            with self.filter_worker.lock:
+                self.line_index.update_line(line_num, text)
+            changed_names |= self.config_model.edit_line(line_num, text)
+        self._refresh_keyword_states()
+        self._refresh_define_diffs(changed_names)
+        self.line_editor.render()
+
+    def undo_edit(self):
+        '''Undo the most recent Save Edit.'''
+        logging.info('undo_edit called')
+        if not self.config_file.journal:
+            messagebox.showinfo('Undo', 'There are no saved edits to undo.')
+            return
+        restored = self.config_file.undo()
+        self._apply_line_changes(restored)
+        logging.info('undo_edit restored %d lines, %d undo steps left', len(restored), len(self.config_file.journal))
+
+    def revert_edits(self):
+        '''Discard every edit made since the file was loaded or last saved.'''
+        logging.info('revert_edits called')
+        if not self.config_file.journal and not self.unsaved_edits:
+            messagebox.showinfo('Revert', 'There are no edits to revert.')
+            return
+        if not messagebox.askyesno('Revert All', 'Discard all edits made since the file was loaded or saved?'):
+            return
+        for line in self.lines:
+            line.pop('pending', None)
+        self.unsaved_edits = False
+        restored = self.config_file.revert()
+        self._apply_line_changes(restored)
+        logging.info('revert_edits restored %d lines', len(restored))
+
+    def _clear_editor(self):
+        '''Reset the file picklist and empty the editor, as done after a file is saved.'''
+        self.selected_config_file.set("")
+        try:
+            # Ensure combobox display clears as well
+            self.config_file_menu.set("")
+        except Exception:
+            logging.debug('Could not clear config_file_menu display')
+        self.opened_config_path = None
+        self.edit_label.config(text='Edit Marlin/(select file) (filtered by keyword):')
+        try:
+            self.edit_label.config(fg='black')
+        except Exception:
+            pass
+        self.current_file_label.config(text='')
+        self.lines = []
+        self.base_lines = []
+        self.filter_worker.cancel()
+        self.filter_matched = None
+        self.line_index = LineIndex()
+        self.config_model = ConfigModel()
+        self.config_file = ConfigFile()
+        self.show_lines()
+        self._refresh_keyword_states()
 
     def save_with_prompt(self):
         '''Prompt user to save changes to the currently selected file or as a new file.'''
@@ -860,29 +968,10 @@ class ConfiguratorApp(tk.Tk):
         idx = self.config_file_names.index(selected_name)
         file_path = self.config_files[idx]
         try:
-            content = '\n'.join(line['content'] for line in self.lines)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            self.config_file.save(file_path)
             messagebox.showinfo('Saved', f'Configuration updated: {file_path}')
             # Reset file picklist and clear editor after saving
-            self.selected_config_file.set("")
-            try:
-                # Ensure combobox display clears as well
-                self.config_file_menu.set("")
-            except Exception:
-                logging.debug('Could not clear config_file_menu display')
-            self.opened_config_path = None
-            self.edit_label.config(text='Edit Marlin/(select file) (filtered by keyword):')
-            try:
-                self.edit_label.config(fg='black')
-            except Exception:
-                pass
-            self.current_file_label.config(text='')
-            self.lines = []
-            self.base_lines = []
-            self.modified_entries = []
-            self.displayed_indices = []
-            self.show_lines()
+            self._clear_editor()
         except PermissionError as e:
             messagebox.showerror('Error', f'Permission denied: {e}')
             logging.error('Permission denied in save_base_config: %s', e)
@@ -907,28 +996,10 @@ class ConfiguratorApp(tk.Tk):
                 messagebox.showerror('Error', 'Cannot overwrite example config files.')
                 return
             try:
-                content = '\n'.join(line['content'] for line in self.lines)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                self.config_file.save(file_path)
                 messagebox.showinfo('Saved', f'Configuration saved as {file_path}')
                 # Reset file picklist and clear editor after saving
-                self.selected_config_file.set("")
-                try:
-                    self.config_file_menu.set("")
-                except Exception:
-                    logging.debug('Could not clear config_file_menu display')
-                self.opened_config_path = None
-                self.edit_label.config(text='Edit Marlin/(select file) (filtered by keyword):')
-                try:
-                    self.edit_label.config(fg='black')
-                except Exception:
-                    pass
-                self.current_file_label.config(text='')
-                self.lines = []
-                self.base_lines = []
-                self.modified_entries = []
-                self.displayed_indices = []
-                self.show_lines()
+                self._clear_editor()
             except PermissionError as e:
                 messagebox.showerror('Error', f'Permission denied: {e}')
                 logging.error('Permission denied in save_as_config: %s', e)
@@ -936,6 +1007,178 @@ class ConfiguratorApp(tk.Tk):
                 messagebox.showerror('Error', f'Failed to save: {e}')
                 logging.exception('Unexpected error in save_as_config')
 
+    def _model_for(self, path):
+        '''Return the define model of path, using the loaded (possibly edited) file if it is open.'''
+        if self.lines and self.opened_config_path and os.path.abspath(self.opened_config_path) == os.path.abspath(path):
+            return self.config_model
+        return ConfigModel.from_file(path)
+
+    def show_define_diff(self):
+        '''Show how Marlin/Configuration*.h differ from the selected example, define by define.'''
+        logging.info('show_define_diff called')
+        folder = self.selected_example.get()
+        if not folder or folder == 'Select example...':
+            messagebox.showerror('Error', 'Please select a valid printer configuration example.')
+            return
+        diffs = {}
+        for path in self.config_files:
+            name = os.path.basename(path)
+            example_path = os.path.join(CONFIG_DIR, folder, name)
+            try:
+                diffs[name] = DefineDiff(self._model_for(path), ConfigModel.from_file(example_path))
+            except OSError as e:
+                messagebox.showerror('Error', f'Could not read {e.filename}: {e.strerror}')
+                logging.error('show_define_diff could not read file: %s', e)
+                return
+        self.define_diffs = diffs
+        self.define_diff_example = folder
+        if getattr(self, 'diff_window', None) is None or not self.diff_window.winfo_exists():
+            self.diff_window = tk.Toplevel(self)
+            self.diff_window.geometry('1000x600')
+            self.diff_summary_label = tk.Label(self.diff_window, text='', font=('Arial', 10, 'bold'), anchor='w', justify='left')
+            self.diff_summary_label.pack(fill='x', padx=10, pady=(8, 2))
+            columns = ('file', 'change', 'name', 'marlin', 'example')
+            self.diff_tree = ttk.Treeview(self.diff_window, columns=columns, show='headings')
+            for column, heading, width in zip(columns, ('File', 'Change', 'Define', 'Marlin/', 'Example'), (140, 110, 230, 250, 250)):
+                self.diff_tree.heading(column, text=heading)
+                self.diff_tree.column(column, width=width, anchor='w')
+            diff_scrollbar = tk.Scrollbar(self.diff_window, orient='vertical', command=self.diff_tree.yview)
+            self.diff_tree.configure(yscrollcommand=diff_scrollbar.set)
+            diff_scrollbar.pack(side='right', fill='y')
+            self.diff_tree.pack(fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+            self.diff_tree.bind('<Double-1>', self._on_diff_row_open)
+        self._populate_define_diff()
+
+    def _refresh_define_diffs(self, names):
+        '''Re-diff only the given define names of the loaded file, if a diff against it is shown.'''
+        for diff in getattr(self, 'define_diffs', {}).values():
+            if diff.left is self.config_model:
+                diff.refresh(names)
+                self._populate_define_diff()
+
+    def _populate_define_diff(self):
+        if getattr(self, 'diff_window', None) is None or not self.diff_window.winfo_exists():
+            return
+        self.diff_window.title(f'Marlin/ vs config/{self.define_diff_example}')
+        self.diff_tree.delete(*self.diff_tree.get_children())
+        totals = []
+        for name, diff in self.define_diffs.items():
+            for entry in diff.changes():
+                line_num = entry.left.start if entry.left else '-'
+                self.diff_tree.insert('', 'end', values=(name, entry.kind, entry.name, describe(entry.left), describe(entry.right)), tags=(name, str(line_num)))
+            for block in diff.moved:
+                for entry in block:
+                    self.diff_tree.insert('', 'end', values=(name, entry.kind, entry.name, describe(entry.left), describe(entry.right)), tags=(name, str(entry.left.start)))
+            counts = diff.summary()
+            totals.append(f"{name}: {', '.join(f'{count} {kind}' for kind, count in counts.items() if count) or 'no differences'}")
+        self.diff_summary_label.config(text='\n'.join(totals))
+
+    def _on_diff_row_open(self, event):  # pylint: disable=unused-argument
+        '''Jump to the double-clicked define if its Marlin/ file is the one loaded in the editor.'''
+        selection = self.diff_tree.selection()
+        if not selection:
+            return
+        tags = self.diff_tree.item(selection[0], 'tags')
+        if len(tags) < 2 or tags[1] == '-':
+            return
+        name, line_num = tags[0], int(tags[1])
+        if self.define_diffs[name].left is not self.config_model:
+            messagebox.showinfo('Load File', f'Load Marlin/{name} in the editor to jump to this define.')
+            return
+        self.show_line_in_context(line_num)
+
+    def show_config_search(self):
+        '''Open the window that searches the defines of every config/* example at once.'''
+        logging.info('show_config_search called')
+        if getattr(self, 'search_window', None) is not None and self.search_window.winfo_exists():
+            self.search_window.lift()
+            return
+        self.search_window = tk.Toplevel(self)
+        self.search_window.title('Search All Configs')
+        self.search_window.geometry('1000x600')
+        query_frame = tk.Frame(self.search_window)
+        query_frame.pack(fill='x', padx=10, pady=(8, 2))
+        tk.Label(query_frame, text='Query:').pack(side='left')
+        self.search_query = tk.StringVar()
+        query_entry = tk.Entry(query_frame, textvariable=self.search_query, width=70)
+        query_entry.pack(side='left', padx=5)
+        query_entry.bind('<Return>', lambda e: self.run_config_search())
+        tk.Button(query_frame, text='Search', command=self.run_config_search).pack(side='left', padx=5)
+        tk.Button(query_frame, text='Export Matrix...', command=self.export_config_matrix).pack(side='left', padx=5)
+        tk.Label(self.search_window, text='e.g.  BLTOUCH  !NEOPIXEL_LED  Z_PROBE_OFFSET_RANGE_MIN<-10  SERIAL_PORT=1  CUSTOM_MACHINE_NAME~CR-6',
+                 fg='grey', anchor='w').pack(fill='x', padx=10)
+        self.search_summary_label = tk.Label(self.search_window, text='', anchor='w')
+        self.search_summary_label.pack(fill='x', padx=10)
+        columns = ('config', 'values')
+        self.search_tree = ttk.Treeview(self.search_window, columns=columns, show='headings')
+        for column, heading, width in zip(columns, ('Config example', 'Matching defines'), (320, 640)):
+            self.search_tree.heading(column, text=heading)
+            self.search_tree.column(column, width=width, anchor='w')
+        search_scrollbar = tk.Scrollbar(self.search_window, orient='vertical', command=self.search_tree.yview)
+        self.search_tree.configure(yscrollcommand=search_scrollbar.set)
+        search_scrollbar.pack(side='right', fill='y')
+        self.search_tree.pack(fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+        self.search_tree.bind('<Double-1>', self._on_search_row_open)
+        query_entry.focus_set()
+
+    def _config_index(self):
+        '''Return the cross-config define index, refreshed for any example file changed on disk.'''
+        if getattr(self, 'config_index', None) is None:
+            self.config_index = CrossConfigIndex(REPO_ROOT)
+        self.config_index.refresh()
+        logging.info('Config index refreshed: %s', self.config_index.stats)
+        return self.config_index
+
+    def run_config_search(self):
+        '''Run the query typed in the search window against every config example.'''
+        terms = self.search_query.get().split()
+        if not terms:
+            return
+        try:
+            index = self._config_index()
+            results = index.query(terms)
+        except ValueError as e:
+            messagebox.showerror('Error', str(e), parent=self.search_window)
+            return
+        except OSError as e:
+            messagebox.showerror('Error', f'Could not read config examples: {e}', parent=self.search_window)
+            logging.error('run_config_search failed: %s', e)
+            return
+        self.search_tree.delete(*self.search_tree.get_children())
+        for example, states in results.items():
+            values = ', '.join(f'{name}={display_state(state)}' for name, state in states.items() if state)
+            self.search_tree.insert('', 'end', values=(example, values))
+        self.search_summary_label.config(text=f'{len(results)} of {len(index.configs)} config examples match')
+
+    def export_config_matrix(self):
+        '''Save the define-by-example matrix as CSV or JSON.'''
+        path = filedialog.asksaveasfilename(parent=self.search_window, title='Export define matrix',
+                                            defaultextension='.csv', filetypes=[('CSV', '*.csv'), ('JSON', '*.json')])
+        if not path:
+            return
+        # Only the defines named in the query, or every define that differs between examples
+        try:
+            names = [parse_term(term)[1] for term in self.search_query.get().split()] or None
+            text = self._config_index().export('json' if path.lower().endswith('.json') else 'csv', names, differing=names is None)
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write(text)
+            logging.info('Define matrix exported to %s', path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror('Error', f'Failed to export: {e}', parent=self.search_window)
+            logging.error('export_config_matrix failed: %s', e)
+
+    def _on_search_row_open(self, event):  # pylint: disable=unused-argument
+        '''Select the double-clicked example in the printer configuration picklist.'''
+        selection = self.search_tree.selection()
+        if not selection:
+            return
+        example = self.search_tree.item(selection[0], 'values')[0]
+        if example not in example_folders:
+            messagebox.showinfo('Config Example', f'{example} is not offered in the printer configuration list.', parent=self.search_window)
+            return
+        self.example_menu.set(example)
+        self.on_example_select(example)
+
     def on_objective_select(self, value):
         '''Handle selection of an objective flash card.'''
         # Temporary debug: log both the incoming value and current StringVar for investigation
@@ -1072,20 +1315,79 @@ class ConfiguratorApp(tk.Tk):
         for widget in self.keywords_frame.winfo_children():
             widget.destroy()
         self.keyword_vars = []  # Reset keyword_vars for new objective
+        self.keyword_checks = []
         selected = self.selected_objective.get()
         card = next((c for c in self.flash_cards if c['objective'] == selected), None)
         keywords = card.get('keywords', []) if card else []
         if keywords:
             tk.Label(self.keywords_frame, text='Recommended keywords:', font=('Arial', 10, 'bold'), fg='navy').pack(anchor='w')
             for kw in keywords:
+                row = tk.Frame(self.keywords_frame)
+                row.pack(fill='x')
                 var = tk.BooleanVar(value=False)
-                cb = tk.Checkbutton(self.keywords_frame, text=kw, variable=var, font=('Arial', 10), anchor='w', command=self.apply_keyword_filter)
-                cb.pack(anchor='w')
+                cb = tk.Checkbutton(row, text=kw, variable=var, font=('Arial', 10), anchor='w', command=self.apply_keyword_filter)
+                cb.pack(side='left', anchor='w')
+                jump = tk.Label(row, text='', font=('Arial', 9, 'underline'), fg='blue', cursor='hand2')
+                jump.pack(side='left', padx=(4, 0))
+                jump.bind('<Button-1>', lambda e, kw=kw: self.jump_to_keyword(kw))
                 self.keyword_vars.append((kw, var))
+                self.keyword_checks.append((kw, cb, jump))
+            self._refresh_keyword_states()
             logging.info('update_flash_card_keywords: keywords=%r keyword_vars_count=%d', keywords, len(self.keyword_vars))
         else:
             tk.Label(self.keywords_frame, text='No keywords for this objective.', font=('Arial', 10), fg='gray').pack(anchor='w')
 
+    def _refresh_keyword_states(self):
+        '''Show the state of each recommended keyword's #define in the loaded file, and where to jump to.'''
+        for kw, cb, jump in getattr(self, 'keyword_checks', []):
+            define = self.config_model.find(kw)
+            if define is None:
+                cb.config(text=kw)
+            elif define.enabled:
+                cb.config(text=f'{kw} = {define.value}' if define.value else f'{kw} (enabled)')
+            else:
+                cb.config(text=f'{kw} (disabled)')
+            if define is not None:
+                jump.config(text=f'line {define.start + 1}', fg='blue')
+            else:
+                spans = self._keyword_spans(kw)
+                jump.config(text=f'in {spans[0][0]}' if spans else 'not found', fg='blue' if spans else 'gray')
+
+    def _keyword_directory(self):
+        '''The directory whose config files keyword jumps use: the loaded file's, else Marlin/.'''
+        if self.lines and self.opened_config_path:
+            return os.path.dirname(os.path.abspath(self.opened_config_path))
+        return os.path.dirname(MARLIN_CONFIG_PATH)
+
+    def _keyword_spans(self, kw):
+        '''Locations of kw's define in the config files next to the loaded file, other than the loaded file.'''
+        if getattr(self, 'keyword_map', None) is None:
+            self.keyword_map = KeywordMap(REPO_ROOT)
+        loaded = os.path.basename(self.opened_config_path) if self.lines and self.opened_config_path else None
+        return [span for span in self.keyword_map.locate(self._keyword_directory(), kw) if span[0] != loaded]
+
+    def jump_to_keyword(self, kw):
+        '''Show the #define of a flash card keyword in context, loading the file that holds it if needed.'''
+        logging.info('jump_to_keyword called for %s', kw)
+        define = self.config_model.find(kw) if self.lines else None
+        if define is not None:
+            self.show_line_in_context(define.start)
+            return
+        spans = self._keyword_spans(kw)
+        if not spans:
+            messagebox.showinfo('Keyword', f'{kw} is not defined in {self._keyword_directory()}.')
+            return
+        file_name, start, _, _ = spans[0]
+        if (self.unsaved_edits or self.config_file.journal) and not messagebox.askyesno(
+                'Unsaved Edits', f'{kw} is in {file_name}. Discard your unsaved edits and load it?'):
+            return
+        path = os.path.join(self._keyword_directory(), file_name)
+        if file_name in self.config_file_names:
+            self.selected_config_file.set(file_name)
+        self.load_config_file(path)
+        if self.opened_config_path == path and self.lines:
+            self.show_line_in_context(start)
+
     def on_example_select(self, value):
         '''Handle selection of a configuration example (i.e. target printer).'''
         # Temporary debug: log incoming widget value and current StringVar for diagnosis in frozen build
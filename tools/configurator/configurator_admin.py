@@ -10,6 +10,8 @@ import re
 import webbrowser
 import json
 import logging
+from keyword_map import KeywordMap, BASE_TARGET, card_keywords, check_cards
+from config_search import find_repo_root
 
 # Setup logging to file (same format as configurator.py)
 logging.basicConfig(
@@ -306,6 +308,8 @@ class FlashCardEditor(tk.Toplevel):
         self.geometry("600x500")
         self.cards = self.load_cards()
         self.index = 0 if self.cards else -1
+        repo_root = get_repo_root() or find_repo_root()
+        self.keyword_map = KeywordMap(repo_root) if repo_root and os.path.isdir(repo_root) else None
         self.create_widgets()
         self.show_card()
 
@@ -358,6 +362,8 @@ class FlashCardEditor(tk.Toplevel):
                 entry.grid(row=i, column=1, sticky="w", pady=2)
                 self.fields[field] = entry
         frame.grid_columnconfigure(1, weight=1)
+        self.missing_label = tk.Label(frame, text="", fg="red", anchor="w", justify="left")
+        self.missing_label.grid(row=len(field_list), column=1, sticky="w")
         # Navigation and actions
         nav = tk.Frame(self)
         nav.pack(pady=10)
@@ -366,6 +372,7 @@ class FlashCardEditor(tk.Toplevel):
         tk.Button(nav, text="Add New", command=self.add_card).pack(side="left", padx=5)
         tk.Button(nav, text="Delete", command=self.delete_card).pack(side="left", padx=5)
         tk.Button(nav, text="Save", command=self.save_current_and_all).pack(side="left", padx=5)
+        tk.Button(nav, text="Check Keywords", command=self.check_keywords).pack(side="left", padx=5)
         tk.Button(nav, text="Close", command=self.destroy).pack(side="left", padx=5)
 
     def show_card(self):
@@ -389,6 +396,30 @@ class FlashCardEditor(tk.Toplevel):
                 widget.delete(0, tk.END)
                 widget.insert(0, val)
         self.title(f"Flash Card Editor ({self.index+1}/{len(self.cards)})")
+        self.show_missing_keywords(card)
+
+    def show_missing_keywords(self, card):
+        '''Flag the keywords of card that are no longer defined in Marlin/.'''
+        if self.keyword_map is None:
+            self.missing_label.config(text="Repository root not set: keywords not checked.")
+            return
+        base = self.keyword_map.targets()[BASE_TARGET]
+        missing = [name for name in card_keywords([card]) if not self.keyword_map.locate(base, name)]
+        self.missing_label.config(text=f"Not defined in Marlin/: {', '.join(missing)}" if missing else "")
+
+    def check_keywords(self):
+        '''Report every card keyword that is missing from Marlin/ or from a config example.'''
+        logging.info('check_keywords called')
+        if self.keyword_map is None:
+            messagebox.showerror("Error", "Repository root is not set in config.json.")
+            return
+        try:
+            lines = check_cards(self.cards, self.keyword_map)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not read config files: {e}")
+            return
+        logging.info('check_keywords: %d report lines, %d files parsed', len(lines), self.keyword_map.parsed)
+        TextWindow("Flash Card Keyword Check", "\n".join(lines) if lines else "All flash card keywords were found.")
 
     def save_current_and_all(self):
         '''Save the current flash card and all changes.'''
@@ -0,0 +1,248 @@
+# define_diff.py (C) Thinkersbluff, 2025
+'''Compare two configuration files define by define, ignoring comment and whitespace noise.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Defines are matched by name. A name that appears more than once (for example
+# in both branches of an #if) is matched occurrence by occurrence and compared
+# on its enabled state and whitespace-normalised value, so after an edit
+# DefineDiff only recomputes the entries for the names that changed. Move
+# detection compares the order of the names common to both files. After an
+# edit it only runs again if a changed name's defines now sit at different
+# positions among the left file's defines; otherwise the order is the same
+# and only the moved entries of the changed names are refreshed.
+#
+# Usage:
+#   python3 define_diff.py ../../Marlin/Configuration.h ../../config/cr6-se-v4.5.3-mb/Configuration.h
+#   python3 define_diff.py --check LEFT.h RIGHT.h   # incremental refresh == fresh diff, edit by edit
+
+import bisect
+import difflib
+import sys
+
+from define_model import ConfigModel
+
+ONLY_LEFT = 'only in left'
+ONLY_RIGHT = 'only in right'
+ENABLED = 'enabled in left'
+DISABLED = 'disabled in left'
+VALUE = 'value changed'
+MOVED = 'moved'
+
+
+def define_key(define):
+    '''The parts of a define that a user cares about when comparing configs, ignoring whitespace.'''
+    enabled, value = define.key()
+    return (enabled, ' '.join(value.split()))
+
+
+class DiffEntry:  # pylint: disable=too-few-public-methods
+    '''One difference between the left and right file.'''
+    __slots__ = ('name', 'kind', 'left', 'right')
+
+    def __init__(self, name, kind, left, right):
+        self.name = name
+        self.kind = kind
+        self.left = left      # Define in the left file, or None
+        self.right = right    # Define in the right file, or None
+
+    def __repr__(self):
+        return f'<DiffEntry {self.kind} {self.name}>'
+
+
+def _compare_name(name, left_defines, right_defines):
+    '''Return the DiffEntry list for one define name.'''
+    entries = []
+    for i in range(max(len(left_defines), len(right_defines))):
+        left = left_defines[i] if i < len(left_defines) else None
+        right = right_defines[i] if i < len(right_defines) else None
+        if right is None:
+            entries.append(DiffEntry(name, ONLY_LEFT, left, None))
+        elif left is None:
+            entries.append(DiffEntry(name, ONLY_RIGHT, None, right))
+        elif define_key(left) != define_key(right):
+            if left.enabled != right.enabled:
+                entries.append(DiffEntry(name, ENABLED if left.enabled else DISABLED, left, right))
+            else:
+                entries.append(DiffEntry(name, VALUE, left, right))
+    return entries
+
+
+class DefineDiff:
+    '''Define-level diff between two ConfigModels, refreshed incrementally.'''
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.by_name = {}     # name -> list of DiffEntry (changes only)
+        self.moved = []       # list of blocks, each a list of DiffEntry of kind MOVED
+        self._order_key = None
+        self._positions = {}  # name -> indexes of its defines in left.defines, when moves were last computed
+        self._define_count = 0
+        self._moved_at = []   # (DiffEntry, index in left.defines) for every moved entry
+        self.refresh()
+
+    def refresh(self, names=None):
+        '''Recompute the diff for names (all names if None) and re-check moves if the order changed.
+
+        names must cover every define of the left file that was edited since the last refresh.
+        '''
+        full = names is None
+        if full:
+            self.by_name = {}
+            names = set(self.left.by_name) | set(self.right.by_name)
+        for name in names:
+            entries = _compare_name(name, self.left.by_name.get(name, []), self.right.by_name.get(name, []))
+            if entries:
+                self.by_name[name] = entries
+            else:
+                self.by_name.pop(name, None)
+        if full or self._order_may_have_changed(names):
+            self._refresh_moves()
+        else:
+            self._refresh_moved_entries(names)
+        return self
+
+    def _left_positions(self, name):
+        return tuple(bisect.bisect_left(self.left.starts, d.start) for d in self.left.by_name.get(name, []))
+
+    def _order_may_have_changed(self, names):
+        '''Whether the defines of names moved among the left file's defines.
+
+        The defines of other names were not edited and keep their relative order, so if every
+        define of names is at the same index as before, the sequence of names is unchanged.
+        '''
+        if len(self.left.defines) != self._define_count:
+            return True
+        return any(self._left_positions(name) != self._positions.get(name, ()) for name in names)
+
+    def _refresh_moved_entries(self, names=None):
+        '''Point the moved entries of names (all if None) at the current, re-parsed defines.'''
+        for entry, index in self._moved_at:
+            if names is None or entry.name in names:
+                entry.left = self.left.defines[index]
+                entry.right = self.right.find(entry.name)
+
+    def _refresh_moves(self):
+        self._define_count = len(self.left.defines)
+        positions = {}
+        common = []   # index in left.defines of every define whose name is also in the right file
+        for index, define in enumerate(self.left.defines):
+            positions.setdefault(define.name, []).append(index)
+            if define.name in self.right.by_name:
+                common.append(index)
+        self._positions = {name: tuple(indexes) for name, indexes in positions.items()}
+        left_order = [self.left.defines[index].name for index in common]
+        right_order = [d.name for d in self.right.defines if d.name in self.left.by_name]
+        order_key = (hash(tuple(left_order)), hash(tuple(right_order)))
+        if order_key == self._order_key:
+            self._refresh_moved_entries()
+            return
+        self._order_key = order_key
+        self.moved = []
+        self._moved_at = []
+        matcher = difflib.SequenceMatcher(None, left_order, right_order, autojunk=False)
+        in_place = set()
+        for block in matcher.get_matching_blocks():
+            in_place.update(range(block.a, block.a + block.size))
+        block = []
+        for i, index in enumerate(common):
+            if i in in_place:
+                if block:
+                    self.moved.append(block)
+                    block = []
+                continue
+            define = self.left.defines[index]
+            entry = DiffEntry(define.name, MOVED, define, self.right.find(define.name))
+            block.append(entry)
+            self._moved_at.append((entry, index))
+        if block:
+            self.moved.append(block)
+
+    def changes(self):
+        '''All non-move differences, in left-file order followed by right-only defines.'''
+        entries = [entry for name_entries in self.by_name.values() for entry in name_entries]
+        def order(entry):
+            if entry.left is not None:
+                return (0, entry.left.start)
+            return (1, entry.right.start)
+        return sorted(entries, key=order)
+
+    def summary(self):
+        counts = {}
+        for entry in self.changes():
+            counts[entry.kind] = counts.get(entry.kind, 0) + 1
+        counts[MOVED] = sum(len(block) for block in self.moved)
+        return counts
+
+
+def describe(define):
+    '''Short text for a define, as shown in the diff panel.'''
+    if define is None:
+        return '(absent)'
+    prefix = '' if define.enabled else '//'
+    return f'{prefix}#define {define.name} {define.value}'.rstrip()
+
+
+def _snapshot(diff):
+    changes = [(e.kind, e.name, describe(e.left), describe(e.right)) for e in diff.changes()]
+    moved = [[(e.name, describe(e.left), describe(e.right)) for e in block] for block in diff.moved]
+    return changes, moved
+
+
+def check_incremental(left_path, right_path, edits=300, seed=1):
+    '''Edit left line by line, refreshing a DefineDiff with ConfigModel.edit_line() names, and compare
+    it with a freshly built DefineDiff after every edit. Returns the number of mismatches.'''
+    import random  # pylint: disable=import-outside-toplevel
+    left, right = ConfigModel.from_file(left_path), ConfigModel.from_file(right_path)
+    diff = DefineDiff(left, right)
+    rng = random.Random(seed)
+    # Edits that change /* */ or #if scope for everything below them, then random define edits
+    scoped = [i for i, text in enumerate(left.lines) if text.strip() in ('*/', '#endif') or text.lstrip().startswith(('/*', '#if'))]
+    plan = [(i, '#define SWITCHING_NOZZLE 42') for i in scoped[:10]]
+    plan += [(i, '/**') for i in rng.sample(left.starts, 5)]
+    plan += [(i, f'#if ENABLED({rng.choice(left.defines).name})') for i in rng.sample(left.starts, 5)]
+    while len(plan) < edits:
+        line_num = rng.choice(left.starts)
+        text = left.lines[line_num]
+        plan.append((line_num, text.replace('//', '', 1) if text.lstrip().startswith('//') else '//' + text.lstrip()))
+    failed = 0
+    for line_num, text in plan:
+        original = left.lines[line_num]
+        for new_text in (text, original):   # make the edit, then undo it
+            diff.refresh(left.edit_line(line_num, new_text))
+            if _snapshot(diff) != _snapshot(DefineDiff(left, right)):
+                failed += 1
+                print(f'FAIL line {line_num + 1}: {original!r} -> {new_text!r}')
+    print(f'{len(plan)} edits (and their undos) checked, {failed} failed')
+    return failed
+
+
+def main(argv):
+    if len(argv) == 4 and argv[1] == '--check':
+        return 1 if check_incremental(argv[2], argv[3]) else 0
+    if len(argv) != 3:
+        print('usage: define_diff.py [--check] LEFT.h RIGHT.h')
+        return 2
+    diff = DefineDiff(ConfigModel.from_file(argv[1]), ConfigModel.from_file(argv[2]))
+    for entry in diff.changes():
+        line = entry.left.start + 1 if entry.left else entry.right.start + 1
+        print(f'{entry.kind:<16} {entry.name:<36} L{line:<6} {describe(entry.left)}  ->  {describe(entry.right)}')
+    for block in diff.moved:
+        names = ', '.join(entry.name for entry in block)
+        print(f'{MOVED:<16} {names}')
+    print(diff.summary())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,290 @@
+# define_model.py (C) Thinkersbluff, 2025
+'''A parsed model of the #define lines in a Marlin configuration file.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# ConfigModel records, for every #define in Configuration.h / Configuration_adv.h:
+#   - name, enabled (#define) or disabled (//#define), value and trailing comment
+#   - the section it lives in (the last "// @section" marker and "//=== Title ===" banner)
+#   - the stack of #if/#ifdef/#ifndef/#elif/#else conditions around it
+#   - its line span (first and last line, following backslash continuations)
+#
+# The scope state (section, banner, #if stack, inside a /* */ comment) is kept
+# for the start of every line. After an edit only the edited lines are parsed
+# again, starting from the stored state, and parsing stops as soon as the state
+# matches what was there before. Defines after the edit are only renumbered.
+
+import bisect
+import re
+
+DEFINE_RE = re.compile(r'^(\s*)(//\s*)?#define\s+([A-Za-z_]\w*)(\([^)]*\))?(.*)$')
+DIRECTIVE_RE = re.compile(r'^\s*#\s*(if|ifdef|ifndef|elif|else|endif)\b\s*(.*)$')
+SECTION_RE = re.compile(r'^\s*//\s*@section\s+(.*\S)')
+BANNER_RE = re.compile(r'^\s*//=+\s*([^=].*?)\s*=+\s*$')
+
+
+def split_comment(text):
+    '''Split text into (code, comment) at the first // that is not inside a string or char literal.'''
+    quote = None
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == '\\':
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif text.startswith('//', i):
+            return text[:i], text[i + 2:].strip()
+        i += 1
+    return text, ''
+
+
+class Define:  # pylint: disable=too-many-instance-attributes, too-few-public-methods
+    '''One #define (enabled or commented out) and where it lives in the file.'''
+    __slots__ = ('name', 'enabled', 'value', 'comment', 'args', 'indent',
+                 'section', 'banner', 'conditions', 'start', 'end')
+
+    def __init__(self, name, enabled, value, comment, args, indent, section, banner, conditions, start, end):  # pylint: disable=too-many-arguments
+        self.name = name
+        self.enabled = enabled
+        self.value = value
+        self.comment = comment
+        self.args = args
+        self.indent = indent
+        self.section = section
+        self.banner = banner
+        self.conditions = conditions
+        self.start = start
+        self.end = end
+
+    def key(self):
+        '''The parts of a define that matter when comparing two configs.'''
+        return (self.enabled, self.value)
+
+    def __repr__(self):
+        state = '#define' if self.enabled else '//#define'
+        return f'<Define {state} {self.name} {self.value!r} lines {self.start}-{self.end}>'
+
+
+class _State:  # pylint: disable=too-few-public-methods
+    '''Scope at the start of a line.'''
+    __slots__ = ('section', 'banner', 'conditions', 'in_comment')
+
+    def __init__(self, section='', banner='', conditions=(), in_comment=False):
+        self.section = section
+        self.banner = banner
+        self.conditions = conditions
+        self.in_comment = in_comment
+
+    def as_tuple(self):
+        return (self.section, self.banner, self.conditions, self.in_comment)
+
+
+def _step_block_comment(text, in_comment):
+    '''Return whether a /* */ comment is still open after text.'''
+    code = text if in_comment else split_comment(text)[0]
+    pos = 0
+    while True:
+        if in_comment:
+            end = code.find('*/', pos)
+            if end < 0:
+                return True
+            in_comment = False
+            pos = end + 2
+        else:
+            start = code.find('/*', pos)
+            if start < 0:
+                return False
+            in_comment = True
+            pos = start + 2
+
+
+def _apply_directive(conditions, directive, arg):
+    arg = split_comment(arg)[0].strip()
+    if directive == 'if':
+        return conditions + (arg,)
+    if directive == 'ifdef':
+        return conditions + (f'defined({arg})',)
+    if directive == 'ifndef':
+        return conditions + (f'!defined({arg})',)
+    if not conditions:
+        return conditions  # unbalanced #elif/#else/#endif, ignore it
+    if directive == 'elif':
+        return conditions[:-1] + (arg,)
+    if directive == 'else':
+        return conditions[:-1] + (f'!({conditions[-1]})',)
+    return conditions[:-1]  # endif
+
+
+class ConfigModel:
+    '''Defines of one configuration file, indexed by name and by line.'''
+    def __init__(self, lines=()):
+        self.lines = [line.rstrip('\r\n') for line in lines]
+        self.states = []     # _State at the start of each line (None inside a continuation), plus one past the end
+        self.defines = []    # Define objects ordered by start line
+        self.starts = []     # start line of each entry in self.defines, for bisect
+        self.by_name = {}    # name -> list of Define, in file order
+        self.removed = []    # Define objects the last update_lines() replaced or dropped
+        self._parse_all()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return cls(f.read().splitlines())
+
+    def _parse_range(self, first, stop, state):
+        '''Parse lines from first until at least stop, starting from state.
+
+        Returns (defines, states, next_state, next_line). A define that continues
+        past stop is followed to its end, so next_line may be greater than stop.
+        Continuation lines get a state of None.
+        '''
+        defines = []
+        states = []
+        line_num = first
+        while line_num < stop:
+            text = self.lines[line_num]
+            states.append(state)
+            section, banner, conditions, in_comment = state.as_tuple()
+            end = line_num
+            if not in_comment:
+                match = DEFINE_RE.match(text)
+                if match:
+                    # Follow backslash continuations to find the full span
+                    body = match.group(5)
+                    while self.lines[end].endswith('\\') and end + 1 < len(self.lines):
+                        end += 1
+                        body = body[:-1] if body.endswith('\\') else body
+                        body += ' ' + self.lines[end].strip()
+                        states.append(None)
+                    value, comment = split_comment(body)
+                    defines.append(Define(
+                        name=match.group(3),
+                        enabled=match.group(2) is None,
+                        value=value.strip(),
+                        comment=comment,
+                        args=match.group(4) or '',
+                        indent=match.group(1),
+                        section=section,
+                        banner=banner,
+                        conditions=conditions,
+                        start=line_num,
+                        end=end))
+                else:
+                    directive = DIRECTIVE_RE.match(text)
+                    if directive:
+                        conditions = _apply_directive(conditions, directive.group(1), directive.group(2))
+                    else:
+                        marker = SECTION_RE.match(text)
+                        if marker:
+                            section = marker.group(1)
+                        else:
+                            title = BANNER_RE.match(text)
+                            if title:
+                                banner = title.group(1)
+            in_comment = _step_block_comment(' '.join(self.lines[line_num:end + 1]), in_comment)
+            state = _State(section, banner, conditions, in_comment)
+            line_num = end + 1
+        return defines, states, state, line_num
+
+    def _parse_all(self):
+        self.defines, states, state, _ = self._parse_range(0, len(self.lines), _State())
+        self.states = states + [state]
+        self._rebuild_indexes()
+
+    def _rebuild_indexes(self):
+        self.starts = [d.start for d in self.defines]
+        self.by_name = {}
+        for define in self.defines:
+            self.by_name.setdefault(define.name, []).append(define)
+
+    def update_lines(self, first, last, new_lines):
+        '''Replace lines[first:last + 1] with new_lines and reparse only what changed.
+
+        Returns the list of Define objects that were (re)created by the reparse. The old
+        Define objects it replaced, including any that a change of #if or /* */ scope
+        dropped further down, are left in self.removed.
+        '''
+        new_lines = [line.rstrip('\r\n') for line in new_lines]
+        delta = len(new_lines) - (last + 1 - first)
+        # Start at the beginning of a define whose continuation reaches into the edit
+        while first > 0 and self.lines[first - 1].endswith('\\'):
+            first -= 1
+            new_lines.insert(0, self.lines[first])
+        old_states = self.states
+        self.lines[first:last + 1] = new_lines
+        lo = bisect.bisect_left(self.starts, first)
+        hi = bisect.bisect_right(self.starts, last)
+        # Reparse the edited lines, then keep going until the scope state converges
+        state = old_states[first]
+        created = []
+        states = []
+        pos = first
+        stop = first + len(new_lines)
+        while True:
+            defines, range_states, state, pos = self._parse_range(pos, stop, state)
+            created.extend(defines)
+            states.extend(range_states)
+            if pos >= len(self.lines):
+                break
+            old_state = old_states[pos - delta]
+            if old_state is not None and old_state.as_tuple() == state.as_tuple():
+                break
+            stop = pos + 1
+        if pos >= len(self.lines):
+            old_stop = len(old_states) - 1
+            self.states = old_states[:first] + states + [state]
+        else:
+            old_stop = pos - delta
+            self.states = old_states[:first] + states + old_states[old_stop:]
+        # Old defines up to old_stop were replaced by the reparse; later ones only move
+        kept_after = [d for d in self.defines[hi:] if d.start >= old_stop]
+        self.removed = self.defines[lo:len(self.defines) - len(kept_after)]
+        for define in kept_after:
+            define.start += delta
+            define.end += delta
+        self.defines = self.defines[:lo] + created + kept_after
+        self._rebuild_indexes()
+        return created
+
+    def set_line(self, line_num, text):
+        '''Replace a single line and reparse it.'''
+        return self.update_lines(line_num, line_num, [text])
+
+    def edit_line(self, line_num, text):
+        '''Replace a single line; return the names of every define the reparse created, changed or dropped.'''
+        created = self.set_line(line_num, text)
+        return {d.name for d in created} | {d.name for d in self.removed}
+
+    def find(self, name):
+        '''Return the define called name, preferring an enabled one, or None.'''
+        defines = self.by_name.get(name)
+        if not defines:
+            return None
+        for define in defines:
+            if define.enabled:
+                return define
+        return defines[0]
+
+    def define_at(self, line_num):
+        '''Return the define whose line span contains line_num, or None.'''
+        pos = bisect.bisect_right(self.starts, line_num) - 1
+        if pos >= 0 and self.defines[pos].end >= line_num:
+            return self.defines[pos]
+        return None
+
+    def names(self):
+        return self.by_name.keys()
@@ -0,0 +1,90 @@
+# filter_worker.py (C) Thinkersbluff, 2025
+'''Runs keyword filter queries on a background thread.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The Tk main thread never waits for a filter. It submits a request and carries
+# on; the worker thread computes the matching lines and puts the result into a
+# queue that the main thread samples with after(), the same way auto_build.py
+# hands platformio output to its window.
+#
+# Every request gets a generation number. Submitting a new request (or calling
+# cancel()) makes all older generations stale: the worker skips stale requests
+# still waiting in its queue and drops results that went stale while it was
+# computing them, so only the newest query ever reaches the UI. A query that
+# raises still produces a result, with matched None and the error in place of
+# the rows, so the UI stops waiting for it.
+#
+# The LineIndex is shared with the main thread. Anything that modifies it must
+# hold FilterWorker.lock, which the worker holds while it runs a query.
+
+import logging
+import queue
+import threading
+
+
+class FilterWorker:
+    '''One daemon thread that evaluates LineIndex.filter() requests, newest first.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='filter-worker', daemon=True)
+        self.thread.start()
+
+    def submit(self, index, keywords, text, hide_comments):
+        '''Queue a query and return its generation number.'''
+        self.generation += 1
+        self.requests.put((self.generation, index, tuple(keywords), text, hide_comments))
+        return self.generation
+
+    def cancel(self):
+        '''Make every outstanding request stale.'''
+        self.generation += 1
+
+    def pending(self, generation):
+        '''True while the result for generation may still arrive.'''
+        return generation == self.generation
+
+    def poll(self):
+        '''Return (generation, matched, rows) of the newest current result, or None.
+        matched is None if the query failed; rows is then the error message.'''
+        latest = None
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result[0] == self.generation:
+                latest = result
+        return latest
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            # Skip straight to the newest request when keystrokes arrived faster than we could filter
+            while not self.requests.empty():
+                request = self.requests.get_nowait()
+            generation, index, keywords, text, hide_comments = request
+            if generation != self.generation:
+                continue
+            try:
+                with self.lock:
+                    matched = index.filter(keywords, text, hide_comments)
+                rows = sorted(matched)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.exception('Filter worker failed for keywords=%r text=%r', keywords, text)
+                matched, rows = None, f'{type(e).__name__}: {e}'
+            if generation == self.generation:
+                self.results.put((generation, matched, rows))
@@ -0,0 +1,137 @@
+# keyword_map.py (C) Thinkersbluff, 2025
+'''Where each flash card keyword is defined, in Marlin/ and in every config/* example.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# For every Configuration.h / Configuration_adv.h the map keeps the line spans
+# of every #define name (enabled or commented out), taken from ConfigModel.
+# A file is only parsed again when its size or mtime changes, so looking up a
+# keyword is a dictionary access and a refresh after an edit costs one file.
+# Spans are kept for all names, not just today's keywords, so editing the
+# flash cards never forces a reparse.
+#
+# Usage (lists the flash card keywords that are missing anywhere):
+#   python3 keyword_map.py [--repo ROOT]
+
+import argparse
+import os
+import re
+import sys
+
+from define_model import ConfigModel
+from flash_cards import load_flash_cards
+from config_search import CONFIG_FILE_NAMES, find_repo_root
+
+NAME_RE = re.compile(r'^[A-Za-z_]\w*$')
+BASE_TARGET = 'Marlin'
+
+
+def card_keywords(cards):
+    '''Define names used by the flash cards (keywords, then related settings), in first-seen order.'''
+    names = []
+    for card in cards:
+        for name in list(card.get('keywords', [])) + list(card.get('related_settings', [])):
+            name = name.strip()
+            if NAME_RE.match(name) and name not in names:
+                names.append(name)
+    return names
+
+
+class KeywordMap:
+    '''Define name -> [(file name, start line, end line, enabled)] for each config directory.'''
+    def __init__(self, repo_root):
+        self.repo_root = repo_root
+        self.files = {}     # path -> {"mtime_ns", "size", "spans": {name: [(start, end, enabled), ...]}}
+        self.parsed = 0     # files parsed by the last refresh
+
+    def targets(self):
+        '''{label: directory} for Marlin/ and every config/<example> with a Configuration.h.'''
+        targets = {BASE_TARGET: os.path.join(self.repo_root, 'Marlin')}
+        config_dir = os.path.join(self.repo_root, 'config')
+        for example in sorted(os.listdir(config_dir)):
+            directory = os.path.join(config_dir, example)
+            if os.path.isfile(os.path.join(directory, 'Configuration.h')):
+                targets[f'config/{example}'] = directory
+        return targets
+
+    def refresh(self, directories=None):
+        '''Re-parse the config files in directories (default: all targets) that changed on disk.'''
+        self.parsed = 0
+        for directory in directories or self.targets().values():
+            for file_name in CONFIG_FILE_NAMES:
+                self._refresh_file(os.path.join(directory, file_name))
+        return self
+
+    def _refresh_file(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.files.pop(path, None)
+            return None
+        entry = self.files.get(path)
+        if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            model = ConfigModel.from_file(path)
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                     'spans': {name: [(d.start, d.end, d.enabled) for d in defines]
+                               for name, defines in model.by_name.items()}}
+            self.files[path] = entry
+            self.parsed += 1
+        return entry
+
+    def locate(self, directory, name):
+        '''Spans of name in directory as [(file name, start, end, enabled)], enabled ones first.'''
+        found = []
+        for file_name in CONFIG_FILE_NAMES:
+            entry = self._refresh_file(os.path.join(directory, file_name))
+            if entry:
+                found.extend((file_name, start, end, enabled) for start, end, enabled in entry['spans'].get(name, ()))
+        return sorted(found, key=lambda span: not span[3])
+
+
+def check_cards(cards, keyword_map):
+    '''Return report lines for flash card keywords that are missing from Marlin/ or from examples.'''
+    targets = keyword_map.refresh().targets()
+    lines = []
+    for card in cards:
+        names = card_keywords([card])
+        if not names:
+            continue
+        problems = []
+        for name in names:
+            absent = [label for label, directory in targets.items() if not keyword_map.locate(directory, name)]
+            if BASE_TARGET in absent:
+                problems.append(f'  {name}: not found in Marlin/ (also missing from {len(absent) - 1} of {len(targets) - 1} examples)')
+            elif absent:
+                problems.append(f'  {name}: missing from {", ".join(absent)}')
+        if problems:
+            lines.append(f'{card.get("objective", "(no objective)")}:')
+            lines.extend(problems)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check that flash card keywords still exist as #defines.')
+    parser.add_argument('--repo', default=None, help='repository root (default: auto-detect)')
+    parser.add_argument('--cards', default=None, help='flash_cards.json to check')
+    args = parser.parse_args(argv)
+    repo_root = args.repo or find_repo_root()
+    if not repo_root:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    lines = check_cards(load_flash_cards(args.cards), KeywordMap(repo_root))
+    print('\n'.join(lines) if lines else 'All flash card keywords were found.')
+    return 1 if lines else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
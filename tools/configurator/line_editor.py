@@ -0,0 +1,185 @@
+# line_editor.py (C) Thinkersbluff, 2025
+'''A virtualized, scrollable line editor for large configuration files.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Only the rows that fit in the viewport (plus a few overscan rows) ever get a
+# tk.Entry. Scrolling re-binds the pooled entries to different lines instead of
+# creating and destroying widgets, so the cost of a refresh does not depend on
+# the size of the file or on how many lines match the current filter.
+#
+# The editor never owns any text. Each row shows a line dict from the
+# configurator's line model ({"line_num", "content", "edited", ...}); typing
+# stores the new text in that dict under 'pending' until Save Edit promotes it.
+
+import bisect
+import logging
+import tkinter as tk
+
+OVERSCAN_ROWS = 4
+ENTRY_WIDTH = 120
+ROW_PADY = 1
+
+
+class VirtualLineEditor(tk.Frame):  # pylint: disable=too-many-ancestors, too-many-instance-attributes
+    '''Scrollable editor that recycles a small pool of Entry widgets.'''
+    def __init__(self, master, on_edit=None, overscan=OVERSCAN_ROWS, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_edit = on_edit
+        self.overscan = overscan
+        self.lines = []       # the line model, shared with the caller
+        self.rows = []        # indices into self.lines that are displayed, ascending
+        self.first_row = 0    # index into self.rows shown in the top slot
+        self.visible_rows = 1
+        self.highlight_line_num = None
+        self.entries = []     # pooled Entry widgets, one per slot
+        self.slot_rows = []   # index into self.lines bound to each slot, or None
+
+        self.yscrollbar = tk.Scrollbar(self, orient='vertical', command=self._on_yscroll)
+        self.yscrollbar.pack(side='right', fill='y')
+        self.xscrollbar = tk.Scrollbar(self, orient='horizontal')
+        self.xscrollbar.pack(side='top', fill='x')
+        self.canvas = tk.Canvas(self, highlightthickness=0)
+        self.canvas.pack(side='left', fill='both', expand=True)
+        self.xscrollbar.config(command=self.canvas.xview)
+        self.canvas.configure(xscrollcommand=self.xscrollbar.set)
+        self.rows_frame = tk.Frame(self.canvas)
+        self.rows_frame_id = self.canvas.create_window((0, 0), window=self.rows_frame, anchor='nw')
+        self.default_bg = None
+        self.row_height = self._measure_row_height()
+        self.canvas.bind('<Configure>', self._on_resize)
+
+    def _measure_row_height(self):
+        '''Create the first pooled entry and use it to size every row.'''
+        entry = self._new_entry()
+        self.default_bg = entry.cget('bg')
+        return max(1, entry.winfo_reqheight() + 2 * ROW_PADY)
+
+    def _new_entry(self):
+        entry = tk.Entry(self.rows_frame, width=ENTRY_WIDTH)
+        entry.bind('<KeyRelease>', self._on_entry_edit)
+        entry.grid(row=len(self.entries), column=0, sticky='ew', padx=2, pady=ROW_PADY)
+        self.entries.append(entry)
+        self.slot_rows.append(None)
+        return entry
+
+    def _ensure_pool(self, count):
+        '''Grow the pool to at least count entries; never shrinks, so widgets are reused.'''
+        while len(self.entries) < count:
+            self._new_entry()
+
+    def _on_resize(self, event):
+        visible = max(1, event.height // self.row_height)
+        if visible != self.visible_rows or len(self.entries) < visible + self.overscan:
+            self.visible_rows = visible
+            self._ensure_pool(visible + self.overscan)
+            self.first_row = self._clamp(self.first_row)
+            self.render()
+
+    def _clamp(self, first_row):
+        return max(0, min(first_row, len(self.rows) - self.visible_rows))
+
+    def set_rows(self, lines, rows, highlight_line_num=None):
+        '''Display rows (ascending indices into lines) without recreating any widgets.'''
+        self.lines = lines
+        self.rows = rows
+        self.highlight_line_num = highlight_line_num
+        self.first_row = 0
+        self.render()
+
+    def render(self):
+        '''Bind each pooled entry to the line it should currently show.'''
+        for slot, entry in enumerate(self.entries):
+            pos = self.first_row + slot
+            if pos < len(self.rows):
+                idx = self.rows[pos]
+                line = self.lines[idx]
+                text = line.get('pending', line['content'])
+                if self.slot_rows[slot] != idx or entry.get() != text:
+                    entry.delete(0, 'end')
+                    entry.insert(0, text)
+                    self.slot_rows[slot] = idx
+                bg = 'yellow' if line.get('line_num') == self.highlight_line_num else self.default_bg
+                if entry.cget('bg') != bg:
+                    entry.config(bg=bg)
+                if not entry.winfo_manager():
+                    entry.grid()
+            elif self.slot_rows[slot] is not None or entry.winfo_manager():
+                entry.delete(0, 'end')
+                entry.grid_remove()
+                self.slot_rows[slot] = None
+        self._update_scrollbars()
+
+    def _update_scrollbars(self):
+        total = len(self.rows)
+        if total:
+            self.yscrollbar.set(self.first_row / total, min(1.0, (self.first_row + self.visible_rows) / total))
+        else:
+            self.yscrollbar.set(0.0, 1.0)
+        self.canvas.configure(scrollregion=(0, 0, self.rows_frame.winfo_reqwidth(), self.rows_frame.winfo_reqheight()))
+
+    def _on_yscroll(self, action, amount, what=None):
+        '''Scrollbar callback: translate moveto/scroll requests into a new first row.'''
+        if action == 'moveto':
+            first_row = int(float(amount) * len(self.rows))
+        elif what == 'pages':
+            first_row = self.first_row + int(amount) * self.visible_rows
+        else:
+            first_row = self.first_row + int(amount)
+        self.scroll_to_row(first_row)
+
+    def scroll(self, units):
+        '''Scroll by a number of rows (negative scrolls up).'''
+        self.scroll_to_row(self.first_row + units)
+
+    def scroll_to_row(self, first_row):
+        first_row = self._clamp(first_row)
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.render()
+
+    def scroll_to_line(self, line_num, offset=0):
+        '''Scroll so that line_num is shown offset rows below the top of the viewport.'''
+        # line_num is the line's index in the model, so self.rows can be bisected directly
+        pos = bisect.bisect_left(self.rows, line_num)
+        if pos < len(self.rows) and self.rows[pos] == line_num:
+            self.scroll_to_row(pos - offset)
+        else:
+            logging.warning('scroll_to_line: line %s is not displayed', line_num)
+
+    def focused_line_num(self):
+        '''Return the line_num of the line whose entry has keyboard focus, or None.'''
+        focus = self.focus_get()
+        for slot, entry in enumerate(self.entries):
+            if entry is focus and self.slot_rows[slot] is not None:
+                idx = self.slot_rows[slot]
+                return self.lines[idx].get('line_num', idx)
+        return None
+
+    def _on_entry_edit(self, event):
+        '''Store the entry text in the line model as a pending edit.'''
+        try:
+            slot = self.entries.index(event.widget)
+        except ValueError:
+            return
+        idx = self.slot_rows[slot]
+        if idx is None:
+            return
+        line = self.lines[idx]
+        value = event.widget.get()
+        if value != line['content']:
+            line['pending'] = value
+        else:
+            line.pop('pending', None)
+        if self.on_edit:
+            self.on_edit(line)
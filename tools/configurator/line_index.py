@@ -0,0 +1,172 @@
+# line_index.py (C) Thinkersbluff, 2025
+'''An inverted token index over the lines of a loaded configuration file.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The keyword filter matches a keyword anywhere inside a line (plain substring
+# match, case-insensitive). The index keeps that behaviour but avoids scanning
+# every line on every keystroke:
+#   - each line is lowercased once, when the file is loaded or edited
+#   - each identifier-like token maps to the set of lines that contain it
+#   - comment/blank flags used by "Hide Comments" are computed once
+# A query is split into tokens; each query token is looked up against the token
+# vocabulary (substring match, cached), the posting lists are intersected, and
+# only the surviving candidate lines are checked with a real substring test.
+#
+# Run this file directly to benchmark it against the plain scan:
+#   python3 line_index.py ../../Marlin/Configuration_adv.h
+
+import re
+import sys
+import time
+
+TOKEN_RE = re.compile(r'[a-z0-9_]+')
+
+
+def is_comment_or_blank(content):
+    '''True for lines hidden by "Hide Comments": //, *, /* comments and empty lines.'''
+    stripped = content.strip()
+    return stripped.startswith("//") or stripped.startswith("*") or stripped.startswith("/*") or stripped == ""
+
+
+class LineIndex:
+    '''Lowercased text, token postings and comment/blank flags for a list of line dicts.'''
+    def __init__(self, lines=()):
+        self.lower = []
+        self.hidden = []          # comment or blank, per line
+        self.postings = {}        # token -> set of line numbers
+        self._vocab_cache = {}    # query token -> set of vocabulary tokens containing it
+        for line in lines:
+            self._add(len(self.lower), line['content'])
+
+    def __len__(self):
+        return len(self.lower)
+
+    def _add(self, line_num, content):
+        lower = content.lower()
+        self.lower.append(lower)
+        self.hidden.append(is_comment_or_blank(content))
+        for token in set(TOKEN_RE.findall(lower)):
+            self.postings.setdefault(token, set()).add(line_num)
+
+    def update_line(self, line_num, content):
+        '''Re-index a single edited line.'''
+        old_tokens = set(TOKEN_RE.findall(self.lower[line_num]))
+        lower = content.lower()
+        new_tokens = set(TOKEN_RE.findall(lower))
+        self.lower[line_num] = lower
+        self.hidden[line_num] = is_comment_or_blank(content)
+        for token in old_tokens - new_tokens:
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.discard(line_num)
+                if not posting:
+                    del self.postings[token]
+        for token in new_tokens - old_tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                self.postings[token] = {line_num}
+                # A new vocabulary word may satisfy queries that are already cached
+                for query_token, vocab in self._vocab_cache.items():
+                    if query_token in token:
+                        vocab.add(token)
+            else:
+                posting.add(line_num)
+
+    def _vocab_matching(self, query_token):
+        vocab = self._vocab_cache.get(query_token)
+        if vocab is None:
+            vocab = {token for token in self.postings if query_token in token}
+            self._vocab_cache[query_token] = vocab
+        return vocab
+
+    def candidates(self, text):
+        '''Lines that may contain text, or None when the query has no tokens to look up.'''
+        query_tokens = sorted(set(TOKEN_RE.findall(text)), key=len, reverse=True)
+        if not query_tokens:
+            return None
+        result = None
+        for query_token in query_tokens:
+            lines = set()
+            for token in self._vocab_matching(query_token):
+                lines.update(self.postings.get(token, ()))
+            result = lines if result is None else result & lines
+            if not result:
+                break
+        return result
+
+    def search(self, text):
+        '''Line numbers whose lowercased content contains text (already lowercased).'''
+        candidates = self.candidates(text)
+        if candidates is None:
+            return {i for i, lower in enumerate(self.lower) if text in lower}
+        if TOKEN_RE.fullmatch(text):
+            # A single token query matched through the vocabulary is already exact
+            return candidates
+        return {i for i in candidates if text in self.lower[i]}
+
+    def filter(self, keywords=(), text='', hide_comments=False):
+        '''Line numbers matching the configurator filter: any keyword, and the text, and not hidden.'''
+        result = None
+        if keywords:
+            result = set()
+            for kw in keywords:
+                result |= self.search(kw.lower())
+        if text:
+            matched = self.search(text)
+            result = matched if result is None else result & matched
+        if result is None:
+            result = set(range(len(self.lower)))
+        if hide_comments:
+            result = {i for i in result if not self.hidden[i]}
+        return result
+
+
+def _scan_filter(lines, keywords, text, hide_comments):
+    '''The original per-refresh scan, kept for the benchmark below.'''
+    result = set()
+    for i, line in enumerate(lines):
+        match = True
+        if keywords:
+            match = any(kw.lower() in line["content"].lower() for kw in keywords)
+        if text:
+            match = match and (text in line["content"].lower())
+        if hide_comments and is_comment_or_blank(line["content"]):
+            match = False
+        if match:
+            result.add(i)
+    return result
+
+
+def benchmark(path, query='watch_temp_period', keywords=('THERMAL_PROTECTION', 'WATCH_')):
+    '''Print per-keystroke filter latency for the scan and the index on path.'''
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [{"line_num": i, "content": line.rstrip('\n')} for i, line in enumerate(f)]
+    start = time.perf_counter()
+    index = LineIndex(lines)
+    print(f'{path}: {len(lines)} lines, {len(index.postings)} tokens, index built in {(time.perf_counter() - start) * 1000:.1f} ms')
+    print(f'{"keystroke":<20} {"matches":>8} {"scan ms":>9} {"index ms":>9}')
+    for n in range(1, len(query) + 1):
+        text = query[:n]
+        start = time.perf_counter()
+        expected = _scan_filter(lines, keywords, text, True)
+        scan_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        got = index.filter(keywords, text, True)
+        index_ms = (time.perf_counter() - start) * 1000
+        assert got == expected, f'index mismatch for {text!r}'
+        print(f'{text!r:<20} {len(got):>8} {scan_ms:>9.3f} {index_ms:>9.3f}')
+
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else '../../Marlin/Configuration_adv.h')
@@ -0,0 +1,74 @@
+# startup_trace.py (C) Thinkersbluff, 2025
+'''Phase timings for configurator start-up.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# configurator.py imports this module first, so PROCESS_START is taken before
+# tkinter and the other imports are loaded. Each mark() records the time spent
+# since the previous mark under a phase name (imports, widget construction,
+# file I/O, ...). The time to first paint is always written to the debug log;
+# the full phase table is written to configurator_startup.log when tracing is
+# turned on with --trace-startup or CONFIGURATOR_TRACE_STARTUP=1.
+
+import logging
+import os
+import sys
+import time
+
+PROCESS_START = time.perf_counter()
+FIRST_PAINT_TARGET_MS = 1000
+TRACE_LOG = 'configurator_startup.log'
+
+
+def trace_requested():
+    return '--trace-startup' in sys.argv or os.environ.get('CONFIGURATOR_TRACE_STARTUP', '') not in ('', '0')
+
+
+class StartupTrace:
+    '''Named start-up phases and their durations in milliseconds.'''
+    def __init__(self, enabled=None, start=PROCESS_START):
+        self.enabled = trace_requested() if enabled is None else enabled
+        self.start = start
+        self.last = start
+        self.phases = []    # (name, duration ms, ms since start)
+        self.reported = 0   # phases already written to the trace file
+
+    def mark(self, name):
+        '''Close the current phase and call it name.'''
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000, (now - self.start) * 1000))
+        self.last = now
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def report(self, title, path=TRACE_LOG):
+        '''Log the total so far and, when tracing, write the phase table to path.'''
+        total = self.elapsed_ms()
+        if title == 'first paint':
+            level = logging.WARNING if total > FIRST_PAINT_TARGET_MS else logging.INFO
+            logging.log(level, 'Startup: first paint after %.0f ms (target %d ms)', total, FIRST_PAINT_TARGET_MS)
+        else:
+            logging.info('Startup: %s after %.0f ms', title, total)
+        if not self.enabled:
+            return total
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(f'--- {time.strftime("%Y-%m-%d %H:%M:%S")} {title}: {total:.1f} ms'
+                        f'{f" (target {FIRST_PAINT_TARGET_MS} ms)" if title == "first paint" else ""}\n')
+                for name, duration, at in self.phases[self.reported:]:
+                    f.write(f'{duration:9.1f} ms  @{at:9.1f} ms  {name}\n')
+            self.reported = len(self.phases)
+        except OSError as e:
+            logging.error('Could not write startup trace %s: %s', path, e)
+        return total
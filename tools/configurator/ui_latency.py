@@ -0,0 +1,217 @@
+# ui_latency.py (C) Thinkersbluff, 2025
+'''Opt-in measurement of how long the configurator's Tk callbacks take.'''
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Turn it on with --trace-ui or CONFIGURATOR_TRACE_UI=1.
+#
+# Every Python callback that Tk runs (button commands, bind() handlers such as
+# <KeyRelease> and <<ComboboxSelected>>, after() callbacks, variable traces)
+# goes through tkinter.CallWrapper, so timing CallWrapper.__call__ covers them
+# all without touching the code that registers them.
+#
+# - A heartbeat after() timer measures main-loop lag: how late it fires.
+# - A watchdog thread grabs the main thread's stack when a callback has been
+#   running for more than STACK_AFTER_MS, so a slow event shows where it was
+#   stuck, not just that it was slow.
+# - Every REPORT_INTERVAL_MS, and at exit, configurator_latency.log (next to
+#   configurator_debug.log) is rewritten with a histogram of the last
+#   WINDOW_EVENTS callbacks, per-callback totals, the lag histogram and the
+#   SLOWEST_N slowest events. The header carries the app version, so reports
+#   from two releases can be compared side by side.
+#
+# Callbacks that open a modal dialog (messagebox, file dialogs) include the
+# time the dialog was open; their captured stack shows the dialog call.
+
+import atexit
+import bisect
+import collections
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+import traceback
+
+LATENCY_LOG = 'configurator_latency.log'
+HEARTBEAT_MS = 100
+STACK_AFTER_MS = 100
+REPORT_INTERVAL_MS = 30000
+WINDOW_EVENTS = 5000
+SLOWEST_N = 20
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def trace_requested():
+    return '--trace-ui' in sys.argv or os.environ.get('CONFIGURATOR_TRACE_UI', '') not in ('', '0')
+
+
+def callback_name(wrapper):
+    '''A readable, stable name for the function behind a CallWrapper.'''
+    func = wrapper.func
+    name = getattr(func, '__qualname__', None) or type(func).__name__
+    if name.endswith('after.<locals>.callit'):
+        # Misc.after wraps the real callback but copies its __name__
+        name = f'after:{func.__name__}'
+    elif '<lambda>' in name:
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            name = f'{name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}'
+    widget = getattr(wrapper.widget, '_w', '')
+    return f'{name} [{widget}]' if widget and widget != '.' else name
+
+
+def histogram(values):
+    '''Counts of values per BUCKETS_MS bucket; the last bucket is everything above.'''
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(BUCKETS_MS, value)] += 1
+    return counts
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencyMonitor:  # pylint: disable=too-many-instance-attributes
+    '''Times Tk callbacks and main-loop lag and writes a rolling report.'''
+    def __init__(self, root, version='', path=LATENCY_LOG):
+        self.root = root
+        self.version = version
+        self.path = path
+        self.started = time.time()
+        self.events = collections.deque(maxlen=WINDOW_EVENTS)   # (name, ms)
+        self.lags = collections.deque(maxlen=WINDOW_EVENTS)     # ms late per heartbeat
+        self.totals = {}     # name -> [count, total ms, max ms]
+        self.slowest = []    # min-heap of (ms, seq, wall time, name, stack)
+        self.active = []     # [name, start, stack] for the callbacks running now, outermost first
+        self.seq = 0
+        self.ignore = {'after:_heartbeat', 'after:write_report'}
+        self._original_call = None
+        self._expected = None
+        self._main_thread = threading.get_ident()
+        self._stop = threading.Event()
+
+    def install(self):
+        '''Start timing every Tk callback, the heartbeat, the watchdog and periodic reports.'''
+        if self._original_call is not None:
+            return self
+        self._original_call = original = tk.CallWrapper.__call__
+        monitor = self
+
+        def timed_call(wrapper, *args):
+            name = callback_name(wrapper)
+            if name in monitor.ignore:
+                return original(wrapper, *args)
+            event = [name, time.perf_counter(), None]
+            monitor.active.append(event)
+            try:
+                return original(wrapper, *args)
+            finally:
+                monitor.active.pop()
+                monitor.record(name, (time.perf_counter() - event[1]) * 1000, event[2])
+
+        tk.CallWrapper.__call__ = timed_call
+        self._expected = time.perf_counter() + HEARTBEAT_MS / 1000
+        self.root.after(HEARTBEAT_MS, self._heartbeat)
+        self.root.after(REPORT_INTERVAL_MS, self.write_report)
+        threading.Thread(target=self._watchdog, name='ui-latency-watchdog', daemon=True).start()
+        atexit.register(self.uninstall)
+        logging.info('UI latency instrumentation enabled, reporting to %s', os.path.abspath(self.path))
+        return self
+
+    def uninstall(self):
+        '''Restore tkinter and write the final report.'''
+        if self._original_call is None:
+            return
+        tk.CallWrapper.__call__ = self._original_call
+        self._original_call = None
+        self._stop.set()
+        self.write_report(reschedule=False)
+
+    def record(self, name, ms, stack=None):
+        self.events.append((name, ms))
+        total = self.totals.setdefault(name, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += ms
+        total[2] = max(total[2], ms)
+        if len(self.slowest) < SLOWEST_N or ms > self.slowest[0][0]:
+            self.seq += 1
+            item = (ms, self.seq, time.strftime('%H:%M:%S'), name, stack or '')
+            if len(self.slowest) < SLOWEST_N:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heapreplace(self.slowest, item)
+        if ms >= STACK_AFTER_MS:
+            logging.info('Slow UI callback: %s took %.0f ms', name, ms)
+
+    def _heartbeat(self):
+        now = time.perf_counter()
+        self.lags.append(max(0.0, (now - self._expected) * 1000))
+        self._expected = now + HEARTBEAT_MS / 1000
+        self.root.after(HEARTBEAT_MS, self._heartbeat)
+
+    def _watchdog(self):
+        '''Capture the main thread's stack for callbacks that run longer than STACK_AFTER_MS.'''
+        while not self._stop.wait(STACK_AFTER_MS / 2000):
+            active = self.active[:1]
+            if not active or active[0][2] is not None:
+                continue
+            event = active[0]
+            if (time.perf_counter() - event[1]) * 1000 < STACK_AFTER_MS:
+                continue
+            frame = sys._current_frames().get(self._main_thread)  # pylint: disable=protected-access
+            if frame is not None:
+                event[2] = ''.join(traceback.format_stack(frame))
+
+    def report(self):
+        '''The report text.'''
+        uptime = time.time() - self.started
+        durations = [ms for _, ms in self.events]
+        lines = [f'Configurator {self.version} UI latency report, {time.strftime("%Y-%m-%d %H:%M:%S")}, up {uptime:.0f} s',
+                 '',
+                 f'Callbacks (last {len(durations)}): p50 {percentile(durations, 0.5):.1f} ms, '
+                 f'p95 {percentile(durations, 0.95):.1f} ms, max {max(durations, default=0):.1f} ms',
+                 f'Main-loop lag (heartbeat every {HEARTBEAT_MS} ms, last {len(self.lags)}): '
+                 f'p50 {percentile(self.lags, 0.5):.1f} ms, p95 {percentile(self.lags, 0.95):.1f} ms, '
+                 f'max {max(self.lags, default=0):.1f} ms',
+                 '',
+                 f'{"bucket":>12} {"callbacks":>10} {"lag":>10}']
+        labels = [f'<= {b} ms' for b in BUCKETS_MS] + [f'> {BUCKETS_MS[-1]} ms']
+        for label, events, lags in zip(labels, histogram(durations), histogram(self.lags)):
+            lines.append(f'{label:>12} {events:>10} {lags:>10}')
+        lines += ['', f'{"count":>7} {"total ms":>10} {"mean ms":>8} {"max ms":>8}  callback (top 30 by total time)']
+        for name, (count, total, worst) in sorted(self.totals.items(), key=lambda item: -item[1][1])[:30]:
+            lines.append(f'{count:>7} {total:>10.1f} {total / count:>8.1f} {worst:>8.1f}  {name}')
+        lines += ['', f'Slowest {len(self.slowest)} callbacks:']
+        for ms, _, when, name, stack in sorted(self.slowest, reverse=True):
+            lines.append(f'{ms:9.1f} ms at {when}  {name}')
+            if stack:
+                lines.extend('    ' + line for line in stack.rstrip().splitlines())
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, reschedule=True):
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.report())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error('Could not write UI latency report %s: %s', self.path, e)
+        if reschedule and self._original_call is not None:
+            self.root.after(REPORT_INTERVAL_MS, self.write_report)
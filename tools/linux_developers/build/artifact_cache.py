@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of firmware builds, used by build_configs.py.
+
+A config's cache key is the SHA-256 of everything its firmware is built from:
+
+  - the example's Configuration.h, Configuration_adv.h and
+    platformio-environment.txt
+  - the Marlin/ and buildroot/ sources: their git tree hashes at HEAD plus the
+    uncommitted diff and untracked files (Marlin/Configuration*.h are left out,
+    builds use the example's copies)
+  - platformio.ini and ini/*.ini
+  - the toolchain: 'platformio --version' and the installed package versions
+
+Each entry under .pio/artifact-cache/<key[:2]>/<key>/ holds the firmware
+binary, the platformio-build.log of the build that made it and meta.json.
+Entries are written to a temporary directory and renamed into place, so an
+interrupted build never leaves a half-written entry behind.
+
+Usage:
+  ./artifact_cache.py list              # entries, newest use first
+  ./artifact_cache.py prune --keep 50   # keep the 50 most recently used
+  ./artifact_cache.py clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+CACHE_VERSION = 1
+SOURCE_PATHS = ('Marlin', 'buildroot')
+EXCLUDED_SOURCES = ('Marlin/Configuration.h', 'Marlin/Configuration_adv.h')
+KEY_FILES = ('Configuration.h', 'Configuration_adv.h', 'platformio-environment.txt')
+BUILD_LOG = 'platformio-build.log'
+META = 'meta.json'
+
+
+def _git(repo_root, *args):
+    return subprocess.run(['git', *args], cwd=repo_root, stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, check=True).stdout
+
+
+def _hash_files(digest, repo_root, paths):
+    for rel in paths:
+        digest.update(rel.encode() + b'\0')
+        digest.update(hashlib.sha256((repo_root / rel).read_bytes()).digest())
+
+
+def source_fingerprint(repo_root):
+    """Hash of the Marlin/ and buildroot/ sources as they are on disk now."""
+    digest = hashlib.sha256()
+    excludes = [f':(exclude){path}' for path in EXCLUDED_SOURCES]
+    try:
+        for path in SOURCE_PATHS:
+            digest.update(_git(repo_root, 'rev-parse', f'HEAD:{path}'))
+        digest.update(_git(repo_root, 'diff', '--binary', 'HEAD', '--', *SOURCE_PATHS, *excludes))
+        untracked = _git(repo_root, 'ls-files', '-z', '--others', '--exclude-standard', '--', *SOURCE_PATHS, *excludes)
+        _hash_files(digest, repo_root, sorted(p.decode() for p in untracked.split(b'\0') if p))
+    except (OSError, subprocess.CalledProcessError):
+        # Not a git checkout (e.g. a source archive): hash every file instead
+        files = sorted(str(p.relative_to(repo_root)) for path in SOURCE_PATHS
+                       for p in (repo_root / path).rglob('*') if p.is_file())
+        _hash_files(digest, repo_root, [f for f in files if f not in EXCLUDED_SOURCES])
+    return digest.hexdigest()
+
+
+def ini_fingerprint(repo_root):
+    """Hash of platformio.ini and every ini/*.ini."""
+    digest = hashlib.sha256()
+    files = ['platformio.ini'] + sorted(str(p.relative_to(repo_root)) for p in (repo_root / 'ini').glob('*.ini'))
+    _hash_files(digest, repo_root, files)
+    return digest.hexdigest()
+
+
+def config_key(config_dir, shared):
+    """The cache key of one config directory, given the shared (source, ini, toolchain) inputs."""
+    parts = dict(shared, version=CACHE_VERSION)
+    for name in KEY_FILES:
+        parts[name] = hashlib.sha256((config_dir / name).read_bytes()).hexdigest()
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class ArtifactCache:
+    """Firmware binaries and build logs by cache key, with hit/miss counts for this run."""
+    def __init__(self, root):
+        self.root = Path(root)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        return self.root / key[:2] / key
+
+    def lookup(self, key):
+        """(firmware path, build log path) for key, or None; a hit marks the entry as just used."""
+        entry = self._entry(key)
+        try:
+            meta = json.loads((entry / META).read_text(encoding='utf-8'))
+            firmware = entry / meta['firmware']
+            if firmware.is_file():
+                meta['last_used'] = time.time()
+                (entry / META).write_text(json.dumps(meta, indent=2), encoding='utf-8')
+                with self._lock:
+                    self.hits += 1
+                return firmware, entry / BUILD_LOG
+        except (OSError, ValueError, KeyError):
+            pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key, firmware, build_log, **meta):
+        """Add the firmware and build log of a successful build under key."""
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f'.{key[:8]}.', dir=entry.parent))
+        try:
+            shutil.copy2(firmware, tmp / firmware.name)
+            shutil.copy2(build_log, tmp / BUILD_LOG)
+            meta.update(key=key, firmware=firmware.name, created=time.time(), last_used=time.time())
+            (tmp / META).write_text(json.dumps(meta, indent=2), encoding='utf-8')
+            if entry.exists():
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return f'{self.hits} hits, {self.misses} misses ({self.hit_rate():.0%} hit rate)'
+
+    def entries(self):
+        """meta.json of every entry, most recently used first."""
+        found = []
+        for meta_file in self.root.glob(f'??/*/{META}'):
+            try:
+                meta = json.loads(meta_file.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            meta['size'] = sum(p.stat().st_size for p in meta_file.parent.iterdir())
+            found.append(meta)
+        return sorted(found, key=lambda meta: -meta.get('last_used', 0))
+
+    def prune(self, keep):
+        """Remove all but the keep most recently used entries; return how many were removed."""
+        removed = self.entries()[keep:]
+        for meta in removed:
+            shutil.rmtree(self._entry(meta['key']), ignore_errors=True)
+        return len(removed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or trim the firmware artifact cache.')
+    parser.add_argument('command', choices=('list', 'prune', 'clear'))
+    parser.add_argument('--keep', type=int, default=50, help='entries kept by prune (default: 50)')
+    parser.add_argument('--cache-dir', default=None, help='cache directory (default: .pio/artifact-cache)')
+    args = parser.parse_args(argv)
+    if args.cache_dir:
+        cache = ArtifactCache(args.cache_dir)
+    else:
+        from build_configs import find_repo_root  # pylint: disable=import-outside-toplevel
+        repo_root = find_repo_root()
+        if repo_root is None:
+            print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+            return 1
+        cache = ArtifactCache(repo_root / '.pio' / 'artifact-cache')
+
+    if args.command == 'list':
+        entries = cache.entries()
+        for meta in entries:
+            used = time.strftime('%Y-%m-%d %H:%M', time.localtime(meta.get('last_used', 0)))
+            print(f'{meta["key"][:12]}  {used}  {meta["size"] / 1024:8.0f} KiB  {meta.get("config", "?")} ({meta.get("env", "?")})')
+        print(f'{len(entries)} entries, {sum(m["size"] for m in entries) / 1048576:.1f} MiB')
+    elif args.command == 'prune':
+        print(f'Removed {cache.prune(args.keep)} entries')
+    else:
+        shutil.rmtree(cache.root, ignore_errors=True)
+        print(f'Removed {cache.root}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
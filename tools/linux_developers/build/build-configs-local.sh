@@ -57,6 +57,15 @@ done
 
 echo ""
 
+# Append a build to the local history in .pio/build-history.sqlite (see build_history.py)
+# Usage: record_history CONFIG ENV STATUS SECONDS [FIRMWARE]
+record_history() {
+    command -v python3 >/dev/null 2>&1 || return 0
+    python3 "$SCRIPT_DIR/build_history.py" record --source "build-configs-local.sh" --config "$1" --env "$2" \
+        --status "$3" --seconds "$4" --phase "compile=$4" --log "$BUILD_OUT_FILE" ${5:+--firmware "$5"} \
+        || echo "WARNING: Could not record $1 in the build history"
+}
+
 build_config() {
     local config_name="$1"
     local config_dir="$REPO_ROOT/config/$config_name"
@@ -91,15 +100,26 @@ build_config() {
         BUILD_OUT_FILE="$build_output_dir/platformio-build.log"
         echo "[DEBUG] Running platformio for $config_name (platform_env: $platform_env)" | tee "$BUILD_OUT_FILE"
         sed -i "s/^default_envs = .*/default_envs = $platform_env/" "$REPO_ROOT/platformio.ini"
-        platformio run -e "$platform_env" --target clean >> "$BUILD_OUT_FILE" 2>&1
-        platformio run -e "$platform_env" >> "$BUILD_OUT_FILE" 2>&1
-        local firmware_file=$(ls -1t "$REPO_ROOT/.pio/build/$platform_env"/firmware*.bin 2>/dev/null | head -n1)
+        # Per-config build directory: reuse objects instead of '--target clean'
+        local config_build_dir="$REPO_ROOT/.pio/config-builds/$config_name"
+        local build_stamp="$(cat "$REPO_ROOT/platformio.ini" "$REPO_ROOT"/ini/*.ini | sha256sum | cut -d' ' -f1) $(platformio --version)"
+        if [ "$(cat "$config_build_dir/.config-build-stamp" 2>/dev/null)" != "$build_stamp" ]; then
+            rm -rf "$config_build_dir"
+        fi
+        mkdir -p "$config_build_dir"
+        echo "$build_stamp" > "$config_build_dir/.config-build-stamp"
+        local build_started=$SECONDS
+        PLATFORMIO_BUILD_DIR="$config_build_dir" platformio run -e "$platform_env" >> "$BUILD_OUT_FILE" 2>&1
+        local build_seconds=$((SECONDS - build_started))
+        local firmware_file=$(ls -1t "$config_build_dir/$platform_env"/firmware*.bin 2>/dev/null | head -n1)
         if [ -z "$firmware_file" ]; then
             echo "ERROR: No firmware binary found for $config_name. See $BUILD_OUT_FILE for build output." | tee -a "$BUILD_OUT_FILE"
+            record_history "$config_name" "$platform_env" failed "$build_seconds"
             return 1
         fi
         cp "$firmware_file" "$firmware_dir/"
         echo "Firmware copied: $(basename "$firmware_file")" | tee -a "$BUILD_OUT_FILE"
+        record_history "$config_name" "$platform_env" built "$build_seconds" "$firmware_file"
     else
         echo "DRY RUN: Would build $config_name with platform $platform_env"
     fi
@@ -11,6 +11,8 @@
 #   - Scans all valid config/* directories for buildable configurations
 #   - Backs up and restores your own Marlin/Configuration*.h files
 #   - Copies config-specific Configuration.h/adv.h and builds with PlatformIO (via podman)
+#   - Keeps a build directory per config in .pio/config-builds/ so unchanged
+#     objects are reused instead of running '--target clean' every time
 #   - Captures all build output and errors with timestamps
 #   - Packages firmware and (optionally) touchscreen firmware for each config
 #   - Creates per-build logs, checksums, and ZIP archives for easy release
@@ -133,6 +135,15 @@ for config in "${CONFIGS[@]}"; do
 done
 echo ""
 
+# Append a build to the local history in .pio/build-history.sqlite (see build_history.py)
+# Usage: record_history CONFIG ENV STATUS SECONDS [FIRMWARE]
+record_history() {
+    command -v python3 >/dev/null 2>&1 || return 0
+    python3 "$SCRIPT_DIR/build_history.py" record --source "build-configs.sh" --config "$1" --env "$2" \
+        --status "$3" --seconds "$4" --phase "compile=$4" --log "$BUILD_OUT_FILE" ${5:+--firmware "$5"} \
+        || echo "WARNING: Could not record $1 in the build history"
+}
+
 build_config() {
     local config_name="$1"
     local config_dir="$REPO_ROOT/config/$config_name"
@@ -215,6 +226,7 @@ build_config() {
         echo "[DEBUG] Starting podman build for $config_name (platform_env: $platform_env)"
         BUILD_OUT_FILE="$build_output_dir/platformio-build.log"
         echo "[DEBUG] Invoking podman-compose for $config_name, output will be logged to $BUILD_OUT_FILE"
+        local build_started=$SECONDS
 
     # Write the build script to a temp file in $REPO_ROOT for robust execution (always mounted in container)
     BUILD_SCRIPT="$REPO_ROOT/podman-build-script.sh"
@@ -237,7 +249,16 @@ if [ -z "\$PLATFORM_ENV" ]; then
     echo "ERROR: PLATFORM_ENV is not set. Aborting build."
     exit 2
 fi
-platformio run -e "\$PLATFORM_ENV" --target clean
+# Each config keeps its own build directory, so objects compiled for it are
+# reused next time instead of cleaning the env shared by every config.
+# The directory is wiped when the ini files or PlatformIO version change.
+export PLATFORMIO_BUILD_DIR="/code/.pio/config-builds/$config_name"
+BUILD_STAMP="\$(cat platformio.ini ini/*.ini | sha256sum | cut -d' ' -f1) \$(platformio --version)"
+if [ "\$(cat "\$PLATFORMIO_BUILD_DIR/.config-build-stamp" 2>/dev/null)" != "\$BUILD_STAMP" ]; then
+    rm -rf "\$PLATFORMIO_BUILD_DIR"
+fi
+mkdir -p "\$PLATFORMIO_BUILD_DIR"
+echo "\$BUILD_STAMP" > "\$PLATFORMIO_BUILD_DIR/.config-build-stamp"
 platformio run -e "\$PLATFORM_ENV"
 echo 'Build completed successfully'
 EOF
@@ -248,25 +269,29 @@ EOF
             return 1
         fi
     podman-compose -f "$SCRIPT_DIR/podman/compose.yaml" run --rm -e PLATFORM_ENV="$platform_env" marlin bash "/code/podman-build-script.sh" &> "$BUILD_OUT_FILE"
+        BUILD_RESULT=$?
         rm -f "$BUILD_SCRIPT"
+        local build_seconds=$((SECONDS - build_started))
 
-        BUILD_RESULT=$?
         echo "[DEBUG] podman build finished for $config_name with exit code $BUILD_RESULT"
         cat "$BUILD_OUT_FILE"
         if [ $BUILD_RESULT -ne 0 ]; then
             echo "ERROR: Build failed for $config_name. See $BUILD_OUT_FILE for details."
+            record_history "$config_name" "$platform_env" failed "$build_seconds"
             return 1
         fi
 
         # Copy the most recent firmware*.bin file (handles timestamped names)
-        local firmware_file=$(ls -1t "$REPO_ROOT/.pio/build/$platform_env"/firmware*.bin 2>/dev/null | head -n1)
+        local firmware_file=$(ls -1t "$REPO_ROOT/.pio/config-builds/$config_name/$platform_env"/firmware*.bin 2>/dev/null | head -n1)
         if [ -z "$firmware_file" ]; then
             echo "ERROR: No firmware binary found for $config_name. See $BUILD_OUT_FILE for build output."
+            record_history "$config_name" "$platform_env" failed "$build_seconds"
             return 1
         fi
 
         cp "$firmware_file" "$firmware_dir/"
         echo "Firmware copied: $(basename "$firmware_file")"
+        record_history "$config_name" "$platform_env" built "$build_seconds" "$firmware_file"
     else
         echo "DRY RUN: Would build $config_name with platform $platform_env"
     fi
@@ -276,11 +301,8 @@ EOF
 
     if [ "$has_touchscreen" = true ]; then
         if [ "$TOUCHSCREEN_AVAILABLE" = true ] && [ "$DRY_RUN" != "true" ]; then
-            echo "Creating DWIN_SET.zip from touchscreen firmware..."
-            # Create ZIP file of DWIN_SET folder
-            local dwin_zip="$display_dir/DWIN_SET.zip"
-            (cd "$(dirname "$DWIN_SET_PATH")" && zip -r "$(basename "$dwin_zip")" "$(basename "$DWIN_SET_PATH")")
-            mv "$(dirname "$DWIN_SET_PATH")/DWIN_SET.zip" "$dwin_zip"
+            # DWIN_SET.zip is created once, before the build loop
+            cp "$DWIN_SET_ZIP" "$display_dir/DWIN_SET.zip"
             echo "Display firmware packaged: DWIN_SET.zip"
         elif [ "$DRY_RUN" = "true" ]; then
             echo "DRY RUN: Would create DWIN_SET.zip from $DWIN_SET_PATH"
@@ -327,16 +349,8 @@ IconFile=https://github.com/favicon.ico
 IconIndex=0
 EOF
 
-    # Create ZIP file with all contents of build_output_dir at the root
-    local zip_file="$OUTPUT_DIR/$RELEASE_NAME-$config_name-$TIMESTAMP.zip"
-    (cd "$build_output_dir" && zip -r "$zip_file" .)
-
-    # Generate SHA256
-    local sha256=$(sha256sum "$zip_file" | cut -d' ' -f1)
-    echo "$sha256  $(basename "$zip_file")" >> "$OUTPUT_DIR/checksums.txt"
-
-    echo "Created: $(basename "$zip_file")"
-    echo "SHA256: $sha256"
+    # Zipped after the build loop, together with the other configs
+    BUILT_DIRS+=("$build_output_dir")
     fi
     
     echo "Completed: $config_name"
@@ -353,7 +367,15 @@ ORIG_CONFIG_ADV_H_BAK="$REPO_ROOT/Marlin/Configuration_adv.h.userbak"
 cp "$ORIG_CONFIG_H" "$ORIG_CONFIG_H_BAK"
 cp "$ORIG_CONFIG_ADV_H" "$ORIG_CONFIG_ADV_H_BAK"
 
+# Zip the touchscreen DWIN_SET once; every config with a touchscreen gets a copy
+DWIN_SET_ZIP="$OUTPUT_DIR/.DWIN_SET.zip"
+if [ "$TOUCHSCREEN_AVAILABLE" = true ] && [ "$DRY_RUN" != "true" ]; then
+    echo "Creating DWIN_SET.zip from touchscreen firmware..."
+    (cd "$(dirname "$DWIN_SET_PATH")" && zip -qr "$DWIN_SET_ZIP" "$(basename "$DWIN_SET_PATH")")
+fi
+
 # Main build loop
+BUILT_DIRS=()
 if [ -n "$SINGLE_BUILD" ]; then
     echo "Building single configuration: $SINGLE_BUILD"
     build_config "$SINGLE_BUILD"
@@ -369,3 +391,21 @@ echo "Restoring user's original Marlin/Configuration*.h files..."
 cp "$ORIG_CONFIG_H_BAK" "$ORIG_CONFIG_H"
 cp "$ORIG_CONFIG_ADV_H_BAK" "$ORIG_CONFIG_ADV_H"
 rm -f "$ORIG_CONFIG_H_BAK" "$ORIG_CONFIG_ADV_H_BAK"
+
+# Package every successful build: per-config ZIPs, checksums.txt and
+# release-manifest.json, built concurrently by package_release.py
+if [ ${#BUILT_DIRS[@]} -gt 0 ]; then
+    if command -v python3 >/dev/null 2>&1; then
+        python3 "$SCRIPT_DIR/package_release.py" "$OUTPUT_DIR" "${BUILT_DIRS[@]}" --release "$RELEASE_NAME"
+    else
+        for build_output_dir in "${BUILT_DIRS[@]}"; do
+            zip_file="$build_output_dir.zip"
+            (cd "$build_output_dir" && zip -qr "$zip_file" .)
+            sha256=$(sha256sum "$zip_file" | cut -d' ' -f1)
+            echo "$sha256  $(basename "$zip_file")" >> "$OUTPUT_DIR/checksums.txt"
+            echo "Created: $(basename "$zip_file")"
+            echo "SHA256: $sha256"
+        done
+    fi
+fi
+rm -f "$DWIN_SET_ZIP"
@@ -0,0 +1,681 @@
+#!/usr/bin/env python3
+"""
+Parallel version of build-configs.sh: builds several config/* examples at once.
+
+build-configs.sh copies each example's Configuration*.h over Marlin/ and
+builds in the repository itself, so only one config can build at a time.
+This script gives every config its own overlay project under .pio/overlays/:
+
+  .pio/overlays/<config>/
+    platformio.ini, ini, buildroot   -> symlinks to the repository
+    Marlin/                          real directories, one symlink per source
+                                     file, plus copies of the example's
+                                     Configuration.h and Configuration_adv.h
+    .pio/                            this config's own PlatformIO build output
+
+Marlin/ is mirrored as directories of file symlinks (not one symlink to the
+directory) because MarlinConfigPre.h includes "../../Configuration.h": the
+relative path has to walk back up through the overlay, not the repository.
+The sources are shared, nothing in them is written, and your own
+Marlin/Configuration*.h are never touched. All links are relative, so the
+overlays also work inside the container, where the repository is /code.
+
+Because the build directory belongs to one config, its objects are reused
+from run to run instead of running '--target clean' first: only what the
+config or the sources changed is recompiled. A stamp in the build directory
+records the environment, ini files and toolchain it was built with; if any
+of them changed, the directory is wiped first. --max-build-size evicts the
+least recently used build directories once they add up to more than the cap.
+
+With --package-mirror (or $MARLIN_PACKAGE_MIRROR set) the packages come from
+the local mirror made by package_mirror.py: each environment is unpacked from
+it before the builds, and PlatformIO runs with its core and libdeps
+directories pointed there, so nothing is downloaded.
+
+Builds run in parallel with a core-aware limit: by default half the CPUs'
+worth of configs at once, and each build gets an equal share of the CPUs for
+its compiler jobs. The output tree is the same as build-configs.sh:
+
+  .pio/build-output/<release>-<config>-<timestamp>/   (firmware, logs, configs)
+  .pio/build-output/<release>-<config>-<timestamp>.zip
+  .pio/build-output/checksums.txt
+
+Usage:
+  ./build_configs.py [release-name] [config ...] [--dry-run] [--runner podman|session|local]
+                     [--containers N] [-j BUILDS] [--build-jobs JOBS] [--touchscreen PATH]
+
+Examples:
+  ./build_configs.py v2.1.3.2                          # Build all, podman
+  ./build_configs.py test-build cr6-se-v4.5.3-mb       # Build one config
+  ./build_configs.py test-build --runner local -j 3    # Host PlatformIO, 3 at once
+  ./build_configs.py test-build --runner session       # Reuse long-lived containers
+  ./build_configs.py test-build --dry-run              # Show what would be built
+  ./build_configs.py test-build --package-mirror       # Offline, from .pio/package-mirror
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import queue
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from artifact_cache import ArtifactCache, config_key, ini_fingerprint, source_fingerprint
+from build_history import BuildHistory, default_path as history_path, git_commit
+from package_mirror import MIRROR_ENV, MirrorError, PackageMirror, default_root as mirror_root, env_prefix, runner_path
+from package_release import Packager, zip_directory
+
+CONFIG_FILES = ('Configuration.h', 'Configuration_adv.h')
+BUILD_STAMP = '.config-build-stamp'
+REQUIRED_FILES = CONFIG_FILES + ('platformio-environment.txt',)
+SHARED_ENTRIES = ('platformio.ini', 'ini', 'buildroot')
+CONTAINER_ROOT = PurePosixPath('/code')
+TOOLCHAIN_COMMANDS = [['platformio', '--version'], ['platformio', 'pkg', 'list', '--global']]
+TOUCHSCREEN_URL = 'https://github.com/CR6Community/CR-6-touchscreen'
+REPOSITORY_URL = 'https://github.com/Thinkersbluff/CR6Community-Marlin_TB'
+
+log = logging.getLogger('build_configs')
+
+
+def find_repo_root(start=None):
+    """Return the repository root (the directory with platformio.ini) containing start, or None."""
+    current = Path(start or __file__).resolve()
+    for directory in [current] + list(current.parents):
+        if (directory / 'platformio.ini').is_file() and (directory / '.git').exists():
+            return directory
+    return None
+
+
+def cpu_count():
+    """CPUs this process may run on (respects taskset/cgroup affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def job_limits(config_count, builds=None, build_jobs=None):
+    """(configs built at once, compiler jobs per build) for this machine."""
+    cpus = cpu_count()
+    builds = builds or max(1, cpus // 2)
+    builds = max(1, min(builds, config_count or 1))
+    build_jobs = build_jobs or max(1, cpus // builds)
+    return builds, build_jobs
+
+
+def url_shortcut(url):
+    return f'[InternetShortcut]\nURL={url}\nIconFile=https://github.com/favicon.ico\nIconIndex=0\n'
+
+
+def scan_configs(repo_root):
+    """Names of config/* directories that have every file a build needs, warning about the rest."""
+    configs = []
+    for config_dir in sorted(p for p in (repo_root / 'config').iterdir() if p.is_dir()):
+        missing = [name for name in REQUIRED_FILES if not (config_dir / name).is_file()]
+        if missing:
+            log.warning('WARNING: Skipping %s - missing %s', config_dir.name, missing[0])
+        else:
+            configs.append(config_dir.name)
+    return configs
+
+
+def platform_env(config_dir):
+    return (config_dir / 'platformio-environment.txt').read_text(encoding='utf-8').strip()
+
+
+def _link(source, link):
+    """Point link at source with a relative symlink, leaving a correct link alone."""
+    target = os.path.relpath(source, link.parent)
+    if link.is_symlink():
+        if os.readlink(link) == target:
+            return
+        link.unlink()
+    elif link.is_dir():
+        shutil.rmtree(link)
+    elif link.exists():
+        link.unlink()
+    link.symlink_to(target)
+
+
+def _copy_if_changed(source, dest):
+    """Copy source to dest unless dest already has the same bytes (keeps its mtime for incremental builds)."""
+    data = source.read_bytes()
+    if dest.is_symlink():
+        dest.unlink()
+    elif dest.is_file() and dest.read_bytes() == data:
+        return
+    dest.write_bytes(data)
+
+
+def _sync_tree(source, dest, overrides):
+    """Mirror source into dest as directories of file symlinks; files in overrides are copied instead."""
+    expected = set()
+    for dirpath, _, filenames in os.walk(source):
+        rel_dir = Path(dirpath).relative_to(source)
+        (dest / rel_dir).mkdir(parents=True, exist_ok=True)
+        expected.add(rel_dir)
+        for name in filenames:
+            rel = rel_dir / name
+            expected.add(rel)
+            if rel in overrides:
+                _copy_if_changed(overrides[rel], dest / rel)
+            else:
+                _link(Path(dirpath) / name, dest / rel)
+    # Drop whatever was deleted from the sources since the last run
+    for dirpath, dirnames, filenames in os.walk(dest, topdown=False):
+        rel_dir = Path(dirpath).relative_to(dest)
+        for name in filenames + [d for d in dirnames if (Path(dirpath) / d).is_symlink()]:
+            if rel_dir / name not in expected:
+                (Path(dirpath) / name).unlink()
+        if rel_dir not in expected:
+            os.rmdir(dirpath)
+
+
+def materialize(repo_root, overlay, config_dir):
+    """Create or refresh the overlay project for one config; return the overlay path."""
+    overlay.mkdir(parents=True, exist_ok=True)
+    for name in SHARED_ENTRIES:
+        _link(repo_root / name, overlay / name)
+    overrides = {Path(name): config_dir / name for name in CONFIG_FILES}
+    _sync_tree(repo_root / 'Marlin', overlay / 'Marlin', overrides)
+    return overlay
+
+
+def tree_size(path):
+    """Bytes used by the files under path, not following symlinks."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def prune_build_dirs(overlay_root, max_bytes):
+    """Delete the least recently built overlay build directories until they fit in max_bytes; return their names."""
+    build_dirs = []
+    for build_dir in overlay_root.glob('*/.pio/build'):
+        stamp = build_dir / BUILD_STAMP
+        used = stamp.stat().st_mtime if stamp.exists() else 0
+        build_dirs.append((used, build_dir, tree_size(build_dir)))
+    total = sum(size for _, _, size in build_dirs)
+    evicted = []
+    for _, build_dir, size in sorted(build_dirs, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(build_dir, ignore_errors=True)
+        total -= size
+        evicted.append(build_dir.parent.parent.name)
+    return evicted
+
+
+class LocalRunner:
+    """Runs PlatformIO on the host, like build-configs-local.sh."""
+    name = 'local'
+
+    def __init__(self, repo_root):
+        self.root = repo_root
+
+    def run(self, project, commands, log_file):
+        """Run each argv in commands in repo-relative project dir, stopping at the first failure."""
+        for argv in commands:
+            log_file.write(f'$ {shlex.join(argv)}\n')
+            log_file.flush()
+            result = subprocess.run(argv, cwd=self.root / project, stdout=log_file,
+                                    stderr=subprocess.STDOUT, check=False)
+            if result.returncode:
+                return result.returncode
+        return 0
+
+    def output(self, commands):
+        """Run each argv in commands in the repository; return (exit code, combined stdout)."""
+        text = []
+        for argv in commands:
+            try:
+                result = subprocess.run(argv, cwd=self.root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        universal_newlines=True, check=False)
+            except OSError:
+                return 127, ''
+            text.append(result.stdout)
+            if result.returncode:
+                return result.returncode, ''.join(text)
+        return 0, ''.join(text)
+
+
+class ComposeRunner:
+    """Runs PlatformIO in a fresh 'marlin' container per call, like build-configs.sh."""
+    name = 'podman'
+
+    def __init__(self, repo_root, compose_file=None):
+        self.root = repo_root
+        self.compose_file = Path(compose_file or repo_root / 'compose.yaml')
+
+    def _argv(self, project, commands, trace=True):
+        script = ' && '.join(shlex.join(argv) for argv in commands)
+        return ['podman-compose', '-f', str(self.compose_file), 'run', '--rm', 'marlin', 'bash', '-c',
+                f'{"set -x; " if trace else ""}cd {shlex.quote(str(CONTAINER_ROOT / project))} && {script}']
+
+    def run(self, project, commands, log_file):
+        argv = self._argv(project, commands)
+        log_file.write(f'$ {shlex.join(argv)}\n')
+        log_file.flush()
+        return subprocess.run(argv, cwd=self.root, stdout=log_file, stderr=subprocess.STDOUT,
+                              check=False).returncode
+
+    def output(self, commands):
+        try:
+            result = subprocess.run(self._argv('.', commands, trace=False), cwd=self.root, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, universal_newlines=True, check=False)
+        except OSError:
+            return 127, ''
+        return result.returncode, result.stdout
+
+
+class SessionRunner:
+    """Runs PlatformIO with 'podman exec' in a pool of long-lived 'marlin' containers.
+
+    ComposeRunner pays container start-up and teardown for every call and
+    loses whatever the container cached outside the mounted volumes. Here the
+    containers are started once per run (same compose service, volumes and
+    environment) and every build is exec'd into a free one, so ~/.platformio
+    and in-container caches stay warm from config to config.
+
+    Start-up of each container is timed together with its first exec, and a
+    second exec measures the cost of an exec on a warm container; the
+    difference is reported as the time saved per call.
+    """
+    name = 'session'
+
+    def __init__(self, repo_root, compose_file=None, containers=1):
+        self.root = repo_root
+        self.compose_file = Path(compose_file or repo_root / 'compose.yaml')
+        self.size = max(1, containers)
+        self.names = []
+        self.free = queue.Queue()
+        self.start_seconds = []    # start-up + first exec of each container
+        self.exec_seconds = []     # a warm 'podman exec true'
+        self.calls = {}            # project -> calls made
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the containers; return self."""
+        for index in range(self.size):
+            name = f'marlin-build-{os.getpid()}-{index}'
+            started = time.monotonic()
+            subprocess.run(['podman-compose', '-f', str(self.compose_file), 'run', '-d', '--name', name,
+                            'marlin', 'sleep', 'infinity'], cwd=self.root, stdout=subprocess.DEVNULL, check=True)
+            self.names.append(name)
+            subprocess.run(['podman', 'exec', name, 'true'], check=True)
+            self.start_seconds.append(time.monotonic() - started)
+            started = time.monotonic()
+            subprocess.run(['podman', 'exec', name, 'true'], check=True)
+            self.exec_seconds.append(time.monotonic() - started)
+            self.free.put(name)
+        log.info('Started %d build container(s): %s (start-up %.1f s, exec %.2f s)',
+                 self.size, ', '.join(self.names), self.start_seconds[0], self.exec_seconds[0])
+        return self
+
+    def close(self):
+        """Remove the containers."""
+        if self.names:
+            subprocess.run(['podman', 'rm', '-f', '-t', '0', *self.names],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            self.names = []
+
+    def saved_per_call(self):
+        """Estimated seconds saved by one exec instead of one fresh container."""
+        if not self.start_seconds:
+            return 0.0
+        return max(0.0, sum(self.start_seconds) / len(self.start_seconds) - sum(self.exec_seconds) / len(self.exec_seconds))
+
+    def saved(self, project):
+        return self.calls.get(str(project), 0) * self.saved_per_call()
+
+    def _exec(self, project, commands, **kwargs):
+        name = self.free.get()
+        try:
+            with self._lock:
+                self.calls[str(project)] = self.calls.get(str(project), 0) + 1
+            script = ' && '.join(shlex.join(argv) for argv in commands)
+            argv = ['podman', 'exec', '-w', str(CONTAINER_ROOT / project), name, 'bash', '-c', script]
+            return subprocess.run(argv, cwd=self.root, check=False, **kwargs)
+        finally:
+            self.free.put(name)
+
+    def run(self, project, commands, log_file):
+        log_file.write(f'$ {" && ".join(shlex.join(argv) for argv in commands)}\n')
+        log_file.flush()
+        return self._exec(project, commands, stdout=log_file, stderr=subprocess.STDOUT).returncode
+
+    def output(self, commands):
+        result = self._exec('.', commands, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        return result.returncode, result.stdout
+
+
+class BuildPlan:  # pylint: disable=too-many-instance-attributes
+    """Everything shared by the builds of one release run."""
+    def __init__(self, repo_root, release, runner, build_jobs,  # pylint: disable=too-many-arguments
+                 dry_run=False, touchscreen=None, cache=None, clean=False, history=None, mirror=None):
+        self.repo_root = repo_root
+        self.release = release
+        self.runner = runner
+        self.build_jobs = build_jobs
+        self.dry_run = dry_run
+        self.timestamp = time.strftime('%Y-%m-%d-%H-%M')
+        self.output_dir = repo_root / '.pio' / 'build-output'
+        self.overlay_root = repo_root / '.pio' / 'overlays'
+        self.dwin_set = Path(touchscreen or repo_root / '..' / 'CR-6-Touchscreen') / 'src' / 'DWIN' / 'DWIN_SET'
+        self.dwin_zip = None
+        self.cache = cache
+        self.cache_inputs = {}
+        self.clean = clean
+        self.toolchain = None
+        self.packager = None
+        self.history = None if dry_run else history
+        self.commit = git_commit(repo_root) if self.history else (None, None)
+        self.mirror = mirror
+        self.pio_prefix = []
+        if mirror:
+            self.pio_prefix = env_prefix(mirror.environment(runner_path(runner, repo_root, mirror.core_dir),
+                                                            runner_path(runner, repo_root, mirror.libdeps_dir)))
+
+    def pio(self, *args):
+        """A platformio argv, pointed at the package mirror if there is one."""
+        return self.pio_prefix + ['platformio', *args]
+
+    def prepare(self):
+        """Clean the output directory and zip the touchscreen DWIN_SET once for every config."""
+        if self.output_dir.exists():
+            log.info('Cleaning previous build output...')
+            shutil.rmtree(self.output_dir)
+        self.output_dir.mkdir(parents=True)
+        if not self.dry_run:
+            self.packager = Packager(self.output_dir, cpu_count(), self.release)
+        if self.dwin_set.is_dir():
+            log.info('DWIN_SET folder located at: %s', self.dwin_set)
+            if not self.dry_run:
+                self.dwin_zip = self.output_dir / '.DWIN_SET.zip'
+                zip_directory(self.dwin_set, self.dwin_zip, prefix='DWIN_SET')
+        else:
+            log.info('DWIN_SET folder not found at: %s, will create URL shortcut instead', self.dwin_set)
+
+    def preinstall(self, configs):
+        """Install each PlatformIO environment's packages once, before builds share them concurrently.
+        With a package mirror they are unpacked from it instead."""
+        done = set()
+        for config in configs:
+            env = platform_env(self.repo_root / 'config' / config)
+            if env in done:
+                continue
+            done.add(env)
+            if self.mirror:
+                unpacked, present = self.mirror.hydrate(env)
+                log.info('Package mirror: %s: %d packages unpacked, %d already present', env, unpacked, present)
+                continue
+            project = materialize(self.repo_root, self.overlay_root / config, self.repo_root / 'config' / config)
+            log.info('Installing PlatformIO packages for %s...', env)
+            with open(project / 'platformio-install.log', 'w', encoding='utf-8') as log_file:
+                if self.runner.run(project.relative_to(self.repo_root), [self.pio('pkg', 'install', '-e', env)], log_file):
+                    log.warning('WARNING: Package install for %s failed, see %s', env, log_file.name)
+
+    def prepare_cache(self):
+        """Fingerprint the inputs all configs share; without a toolchain version nothing is reused."""
+        if self.dry_run and not self.cache:
+            return
+        result, toolchain = self.runner.output([self.pio_prefix + argv for argv in TOOLCHAIN_COMMANDS])
+        if result or not toolchain.strip():
+            log.warning('WARNING: Could not read the PlatformIO toolchain version, '
+                        'building clean and without the artifact cache')
+            self.cache = None
+            return
+        self.toolchain = hashlib.sha256(toolchain.encode()).hexdigest()
+        if self.cache:
+            self.cache_inputs = {'sources': source_fingerprint(self.repo_root), 'ini': ini_fingerprint(self.repo_root),
+                                 'toolchain': self.toolchain}
+            log.info('Artifact cache: %s', self.cache.root)
+
+    def _reuse_build_dir(self, project, env):
+        """Whether project's build directory may be reused; wipes it when its stamp does not match."""
+        if self.clean or not self.toolchain:
+            return False
+        build_dir = project / '.pio' / 'build'
+        stamp = json.dumps({'env': env, 'ini': ini_fingerprint(self.repo_root), 'toolchain': self.toolchain}, sort_keys=True)
+        stamp_file = build_dir / BUILD_STAMP
+        if build_dir.exists() and not (stamp_file.is_file() and stamp_file.read_text(encoding='utf-8') == stamp):
+            log.info('%s: build directory is from another environment or toolchain, starting clean', project.name)
+            shutil.rmtree(build_dir)
+        build_dir.mkdir(parents=True, exist_ok=True)
+        stamp_file.write_text(stamp, encoding='utf-8')   # also marks the directory as just used
+        return True
+
+    def _record(self, config, env, status, started, phases, build_log=None, firmware=None):
+        """Add the build to the history database, if there is one."""
+        if not self.history:
+            return
+        log_text = build_log.read_text(encoding='utf-8', errors='replace') if build_log and build_log.is_file() else None
+        try:
+            self.history.record('build_configs', config, env, status, time.monotonic() - started, phases, log_text,
+                                firmware, cached=status == 'cached', commit=self.commit[0], dirty=self.commit[1])
+        except sqlite3.Error as error:
+            log.warning('WARNING: Could not record %s in the build history: %s', config, error)
+
+    def build(self, config):
+        """Build and package one config; return (config, status, seconds, zip path or None)."""
+        started = time.monotonic()
+        phases = {}
+        config_dir = self.repo_root / 'config' / config
+        env = platform_env(config_dir)
+        if not env:
+            log.error('ERROR: platformio-environment.txt in %s is empty or invalid.', config_dir)
+            return config, 'failed', 0.0, None
+        build_output_dir = self.output_dir / f'{self.release}-{config}-{self.timestamp}'
+        firmware_dir = build_output_dir / 'Firmware' / 'Motherboard firmware'
+        display_dir = build_output_dir / 'Firmware' / 'Display Firmware'
+        config_copy_dir = build_output_dir / 'configs'
+        for directory in (firmware_dir, display_dir, config_copy_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        phase = time.monotonic()
+        key = config_key(config_dir, self.cache_inputs) if self.cache else None
+        cached = self.cache.lookup(key) if self.cache else None
+        phases['cache lookup'] = time.monotonic() - phase
+        if self.dry_run:
+            log.info('DRY RUN: Would %s %s with platform %s', 'reuse cached' if cached else 'build', config, env)
+        elif cached:
+            shutil.copy2(cached[0], firmware_dir)
+            shutil.copy2(cached[1], build_output_dir / 'platformio-build.log')
+            log.info('%s: firmware reused from cache: %s (key %s)', config, cached[0].name, key[:12])
+        else:
+            phase = time.monotonic()
+            project = materialize(self.repo_root, self.overlay_root / config, config_dir)
+            build_log = build_output_dir / 'platformio-build.log'
+            log.info('=== Building %s (platform_env: %s, %d jobs) ===', config, env, self.build_jobs)
+            commands = [self.pio('run', '-e', env, '-j', str(self.build_jobs))]
+            if not self._reuse_build_dir(project, env):
+                commands.insert(0, self.pio('run', '-e', env, '-j', str(self.build_jobs), '--target', 'clean'))
+            phases['overlay'] = time.monotonic() - phase
+            phase = time.monotonic()
+            with open(build_log, 'w', encoding='utf-8') as log_file:
+                result = self.runner.run(project.relative_to(self.repo_root), commands, log_file)
+            phases['compile'] = time.monotonic() - phase
+            firmware = sorted((project / '.pio' / 'build' / env).glob('firmware*.bin'), key=lambda p: p.stat().st_mtime)
+            if result or not firmware:
+                tail = build_log.read_text(encoding='utf-8', errors='replace').splitlines()[-30:]
+                log.error('ERROR: Build failed for %s (exit code %d). See %s for details.\n%s',
+                          config, result, build_log, '\n'.join(tail))
+                self._record(config, env, 'failed', started, phases, build_log)
+                return config, 'failed', time.monotonic() - started, None
+            shutil.copy2(firmware[-1], firmware_dir)
+            log.info('%s: firmware copied: %s', config, firmware[-1].name)
+            if self.cache:
+                phase = time.monotonic()
+                self.cache.store(key, firmware[-1], build_log, config=config, env=env)
+                phases['cache store'] = time.monotonic() - phase
+
+        for header in config_dir.glob('*.h'):
+            shutil.copy2(header, config_copy_dir)
+        self._package_display(config_dir, display_dir)
+        description = config_dir / 'description.txt'
+        if description.is_file():
+            shutil.copy2(description, build_output_dir)
+        else:
+            (build_output_dir / 'description.txt').write_text(
+                f'Configuration: {config}\nPlatform: {env}\nBuilt: {self.timestamp}\n', encoding='utf-8')
+        if self.dry_run:
+            return config, 'dry-run', time.monotonic() - started, None
+
+        (build_output_dir / 'CR6Community-Marlin-Repository.url').write_text(url_shortcut(REPOSITORY_URL), encoding='utf-8')
+        self.packager.submit(build_output_dir, config=config, env=env, firmware='cache' if cached else 'build')
+        firmware_copy = next(firmware_dir.glob('*.bin'), None)
+        self._record(config, env, 'cached' if cached else 'built', started, phases,
+                     build_output_dir / 'platformio-build.log', firmware_copy)
+        log.info('Completed: %s, packaging %s.zip', config, build_output_dir.name)
+        return config, 'cached' if cached else 'built', time.monotonic() - started, build_output_dir.name
+
+    def _package_display(self, config_dir, display_dir):
+        no_touchscreen = config_dir / 'no-touchscreen.txt'
+        if self.dry_run:
+            return
+        if no_touchscreen.is_file():
+            shutil.copy2(no_touchscreen, display_dir)
+        elif self.dwin_zip:
+            shutil.copy2(self.dwin_zip, display_dir / 'DWIN_SET.zip')
+        else:
+            (display_dir / 'CR-6-Touchscreen-Download.url').write_text(url_shortcut(TOUCHSCREEN_URL), encoding='utf-8')
+
+    def finish(self, results):
+        """Wait for packaging, which writes checksums.txt and the manifest in config order, and drop the shared DWIN_SET.zip."""
+        if self.packager:
+            for artifact in self.packager.close(order=[name for _, _, _, name in results if name]):
+                log.info('Created: %s (%.0f KiB, SHA256 %s)', artifact['name'], artifact['size'] / 1024, artifact['sha256'])
+        if self.dwin_zip and self.dwin_zip.exists():
+            self.dwin_zip.unlink()
+
+
+def select(repo_root, requested):
+    """The configs to build: the requested ones, or every buildable one not marked no-autobuild."""
+    available = scan_configs(repo_root)
+    if requested:
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise SystemExit(f'ERROR: Not a buildable configuration: {", ".join(unknown)}')
+        return list(requested)
+    selected = []
+    for config in available:
+        if (repo_root / 'config' / config / 'no-autobuild.txt').is_file():
+            log.info('Skipping %s (marked no-autobuild)', config)
+        else:
+            selected.append(config)
+    return selected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build config/* examples in parallel, each in its own overlay.')
+    parser.add_argument('release', nargs='?', default='test-build', help='release name used in output names')
+    parser.add_argument('configs', nargs='*', help='configs to build (default: all without no-autobuild.txt)')
+    parser.add_argument('--dry-run', action='store_true', help='show what would be built without building')
+    parser.add_argument('--touchscreen', default=None, help='path to the CR-6-Touchscreen repository')
+    parser.add_argument('--runner', choices=('podman', 'session', 'local'), default='podman',
+                        help='build in a fresh podman-compose container per build (default), in long-lived '
+                             'containers (session) or with the host PlatformIO (local)')
+    parser.add_argument('--containers', type=int, default=None,
+                        help='containers kept running by the session runner (default: one per parallel build)')
+    parser.add_argument('--compose-file', default=None, help='compose file for the podman runner')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='configs to build at once (default: CPUs / 2)')
+    parser.add_argument('--clean', action='store_true', help="run '--target clean' before every build")
+    parser.add_argument('--max-build-size', type=float, default=None, metavar='GB',
+                        help='evict least recently used per-config build directories above this size')
+    parser.add_argument('--no-cache', action='store_true', help='always build, do not read or write the artifact cache')
+    parser.add_argument('--cache-dir', default=None, help='artifact cache directory (default: .pio/artifact-cache)')
+    parser.add_argument('--build-jobs', type=int, default=None, help='compiler jobs per build (default: CPUs / builds)')
+    parser.add_argument('--no-history', action='store_true',
+                        help='do not record the builds in .pio/build-history.sqlite (see build_history.py)')
+    parser.add_argument('--package-mirror', nargs='?', const='', default=None, metavar='DIR',
+                        help=f'build offline from the package mirror (see package_mirror.py; '
+                             f'default: ${MIRROR_ENV} or .pio/package-mirror)')
+    args = parser.parse_intermixed_args(argv)
+
+    repo_root = find_repo_root()
+    if repo_root is None:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    (repo_root / '.pio').mkdir(exist_ok=True)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S',
+                        handlers=[logging.StreamHandler(),
+                                  logging.FileHandler(repo_root / '.pio' / 'build-configs.log', 'w', encoding='utf-8')])
+
+    configs = select(repo_root, args.configs)
+    builds, build_jobs = job_limits(len(configs), args.jobs, args.build_jobs)
+    if args.runner == 'local':
+        runner = LocalRunner(repo_root)
+    elif args.runner == 'session':
+        runner = SessionRunner(repo_root, args.compose_file, args.containers or builds)
+    else:
+        runner = ComposeRunner(repo_root, args.compose_file)
+    cache = None if args.no_cache else ArtifactCache(args.cache_dir or repo_root / '.pio' / 'artifact-cache')
+    history = None if args.no_history else BuildHistory(history_path(repo_root))
+    mirror = None
+    if args.package_mirror is not None or os.environ.get(MIRROR_ENV):
+        mirror = PackageMirror(args.package_mirror or mirror_root(repo_root))
+        log.info('Package mirror: %s', mirror.root)
+    try:
+        plan = BuildPlan(repo_root, args.release, runner, build_jobs, args.dry_run, args.touchscreen, cache,
+                         args.clean, history, mirror)
+    except MirrorError as error:
+        log.error('ERROR: %s', error)
+        return 1
+    log.info('=== CR6 Community Firmware Build: %s, %s ===', args.release, plan.timestamp)
+    log.info('Building %d configurations, %d at a time with %d compiler jobs each (%s runner, %d CPUs)',
+             len(configs), builds, build_jobs, runner.name, cpu_count())
+
+    started = time.monotonic()
+    plan.prepare()
+    try:
+        if isinstance(runner, SessionRunner) and (plan.cache or not args.dry_run):
+            runner.start()
+        if not args.dry_run:
+            try:
+                plan.preinstall(configs)
+            except MirrorError as error:
+                log.error('ERROR: %s', error)
+                return 1
+        plan.prepare_cache()
+        with ThreadPoolExecutor(max_workers=builds) as pool:
+            results = list(pool.map(plan.build, configs))
+    finally:
+        if isinstance(runner, SessionRunner):
+            runner.close()
+    plan.finish(results)
+    if args.max_build_size is not None:
+        evicted = prune_build_dirs(plan.overlay_root, int(args.max_build_size * 1024 ** 3))
+        if evicted:
+            log.info('Evicted build directories over %.1f GB: %s', args.max_build_size, ', '.join(evicted))
+
+    log.info('=== Summary (%.0f s) ===', time.monotonic() - started)
+    for config, status, seconds, _ in results:
+        saved = runner.saved(Path('.pio', 'overlays', config)) if isinstance(runner, SessionRunner) else 0
+        log.info('  %-8s %6.0f s  %s%s', status, seconds, config, f' (session saved ~{saved:.1f} s)' if saved else '')
+    if isinstance(runner, SessionRunner) and runner.calls:
+        total = sum(runner.calls.values())
+        log.info('Container session: %d calls, ~%.1f s saved per call, ~%.0f s in total',
+                 total, runner.saved_per_call(), total * runner.saved_per_call())
+    if plan.cache:
+        log.info('Artifact cache: %s', plan.cache.summary())
+    failed = [config for config, status, _, _ in results if status == 'failed']
+    log.info('Build output available in: %s', plan.output_dir)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
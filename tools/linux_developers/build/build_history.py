@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Local history of firmware builds, kept in .pio/build-history.sqlite.
+
+.pio/build-output is wiped by every build-configs run, so nothing would
+remember how long a config took to build or how big its firmware was.
+build_configs.py, build-configs.sh, tools/configurator/auto_build.py and
+tools/linux_developers/test/run_test_shards.py append one row per build:
+
+  when, source (which tool), config, env, commit (and whether the tree was
+  dirty), status, total seconds and seconds per phase, Flash and RAM usage
+  from the PlatformIO size report, warning count, firmware size, and whether
+  the firmware came from the artifact cache
+
+Builds that reused cached firmware are kept out of the build-time checks.
+
+Usage:
+  ./build_history.py list [--config NAME] [-n 20]
+  ./build_history.py compare OLD_COMMIT [NEW_COMMIT]   # per config, NEW defaults to HEAD
+  ./build_history.py check [--window 10]               # latest builds against their recent median
+  ./build_history.py record --source NAME --config NAME --env ENV --status STATUS
+                            [--seconds S] [--phase NAME=SECONDS ...] [--log FILE] [--firmware FILE]
+
+compare and check flag a build time more than --time-threshold percent
+(default 20) above the baseline, firmware more than --size-threshold bytes
+(default 1024) bigger, and any new warnings; they exit with 1 if anything
+was flagged.
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    source TEXT NOT NULL,
+    config TEXT NOT NULL,
+    env TEXT NOT NULL,
+    commit_id TEXT,
+    dirty INTEGER,
+    status TEXT NOT NULL,
+    cached INTEGER NOT NULL DEFAULT 0,
+    seconds REAL,
+    phases TEXT,
+    flash_used INTEGER,
+    flash_total INTEGER,
+    ram_used INTEGER,
+    ram_total INTEGER,
+    warnings INTEGER,
+    firmware_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS builds_config ON builds (config, env, id);
+CREATE INDEX IF NOT EXISTS builds_commit ON builds (commit_id);
+"""
+
+# PlatformIO's size report: 'RAM:   [==        ]  22.5% (used 18420 bytes from 81920 bytes)'
+USAGE = re.compile(r'^(RAM|Flash):\s+\[.*\]\s+[\d.]+%\s+\(used (\d+) bytes from (\d+) bytes\)', re.M)
+WARNING = re.compile(r'^(\S+?):(\d+)(?::\d+)?: warning: (.*)$', re.M)
+
+
+def parse_build_log(text):
+    """Flash/RAM usage and the number of distinct compiler warnings in a PlatformIO build log."""
+    usage = {}
+    for kind, used, total in USAGE.findall(text):
+        usage[f'{kind.lower()}_used'], usage[f'{kind.lower()}_total'] = int(used), int(total)
+    usage['warnings'] = len(set(WARNING.findall(text)))
+    return usage
+
+
+def git_commit(repo_root):
+    """(HEAD commit, whether the working tree has changes), or (None, None) outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_root, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_root,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                                check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def resolve_commit(repo_root, name):
+    """Full hash for a commit name, falling back to the name itself (a stored prefix)."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--verify', f'{name}^{{commit}}'], cwd=repo_root,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return name
+
+
+class BuildHistory:
+    """The builds table. Each call opens its own connection, so threads and processes can record at once."""
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=30)
+        db.row_factory = sqlite3.Row
+        if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        return db
+
+    def record(self, source, config, env, status, seconds=None, phases=None,  # pylint: disable=too-many-arguments
+               log_text=None, firmware=None, cached=False, commit=None, dirty=None):
+        """Add one build; log_text (a PlatformIO build log) provides the size and warning columns."""
+        row = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'source': source, 'config': config, 'env': env,
+               'commit_id': commit, 'dirty': None if dirty is None else int(dirty), 'status': status,
+               'cached': int(cached), 'seconds': None if seconds is None else round(seconds, 2),
+               'phases': json.dumps({k: round(v, 2) for k, v in (phases or {}).items()}),
+               'firmware_size': Path(firmware).stat().st_size if firmware else None}
+        row.update(parse_build_log(log_text) if log_text is not None else {})
+        columns = ', '.join(row)
+        with self._connect() as db:
+            db.execute(f'INSERT INTO builds ({columns}) VALUES ({", ".join("?" * len(row))})', list(row.values()))
+        db.close()
+
+    def rows(self, where='1', params=(), limit=None):
+        query = f'SELECT * FROM builds WHERE {where} ORDER BY id DESC' + (f' LIMIT {int(limit)}' if limit else '')
+        db = self._connect()
+        try:
+            return [dict(row) for row in db.execute(query, params)]
+        finally:
+            db.close()
+
+    def latest_at(self, commit):
+        """The last successful build of each (config, env) at commit (a full hash or a prefix)."""
+        latest = {}
+        for row in self.rows("status IN ('built', 'cached', 'passed') AND commit_id LIKE ?", (commit + '%',)):
+            latest.setdefault((row['config'], row['env']), row)
+        return latest
+
+
+class Thresholds:
+    def __init__(self, time_percent=20.0, size_bytes=1024):
+        self.time_percent = time_percent
+        self.size_bytes = size_bytes
+
+    def flags(self, old, new):
+        """What got worse from old to new: old holds baseline values, new a build row."""
+        found = []
+        if old.get('seconds') and new['seconds'] and not new['cached'] and not old.get('cached'):
+            if new['seconds'] > old['seconds'] * (1 + self.time_percent / 100):
+                found.append(f'build time {old["seconds"]:.0f} -> {new["seconds"]:.0f} s')
+        for column in ('flash_used', 'ram_used', 'firmware_size'):
+            if old.get(column) is not None and new[column] is not None and new[column] - old[column] > self.size_bytes:
+                found.append(f'{column.replace("_", " ")} {old[column]} -> {new[column]} bytes')
+        if old.get('warnings') is not None and new['warnings'] is not None and new['warnings'] > old['warnings']:
+            found.append(f'warnings {old["warnings"]} -> {new["warnings"]}')
+        return found
+
+
+def _delta(old, new, column, unit=''):
+    if old.get(column) is None or new.get(column) is None:
+        return '-'
+    return f'{new[column] - old[column]:+.0f}{unit}'
+
+
+def compare(history, old_commit, new_commit, thresholds):
+    """Print the change of every config built at both commits; return how many were flagged."""
+    old, new = history.latest_at(old_commit), history.latest_at(new_commit)
+    flagged = 0
+    print(f'{"config (env)":<48} {"time":>8} {"flash":>9} {"ram":>8} {"warn":>5}')
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        flags = thresholds.flags(a, b)
+        flagged += bool(flags)
+        print(f'{key[0] + " (" + key[1] + ")":<48} {_delta(a, b, "seconds", "s"):>8} {_delta(a, b, "flash_used"):>9} '
+              f'{_delta(a, b, "ram_used"):>8} {_delta(a, b, "warnings"):>5}{"  <- " + "; ".join(flags) if flags else ""}')
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f'{key[0] + " (" + key[1] + ")":<48} only built at {old_commit[:12] if key in old else new_commit[:12]}')
+    print(f'{flagged} config(s) flagged')
+    return flagged
+
+
+def check(history, window, thresholds):
+    """Compare each config's latest build with the median of its previous ones; return how many were flagged."""
+    builds = {}
+    for row in history.rows("status IN ('built', 'cached', 'passed')"):
+        builds.setdefault((row['config'], row['env']), []).append(row)
+    flagged = 0
+    for (config, env), rows in sorted(builds.items()):
+        latest, previous = rows[0], rows[1:window + 1]
+        if not previous:
+            continue
+        baseline = {}
+        for column in ('seconds', 'flash_used', 'ram_used', 'firmware_size', 'warnings'):
+            values = [r[column] for r in previous if r[column] is not None and not (column == 'seconds' and r['cached'])]
+            if values:
+                baseline[column] = statistics.median(values)
+        flags = thresholds.flags(baseline, latest)
+        if flags:
+            flagged += 1
+            print(f'{config} ({env}) at {(latest["commit_id"] or "?")[:12]}: {"; ".join(flags)} '
+                  f'(median of {len(previous)} previous builds)')
+    print(f'{flagged} config(s) flagged')
+    return flagged
+
+
+def default_path(repo_root):
+    return repo_root / '.pio' / 'build-history.sqlite'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record builds and report build time, size and warning regressions.')
+    parser.add_argument('--db', default=None, help='history database (default: .pio/build-history.sqlite)')
+    parser.add_argument('--time-threshold', type=float, default=20.0, help='flag build times this many percent slower')
+    parser.add_argument('--size-threshold', type=int, default=1024, help='flag firmware this many bytes bigger')
+    commands = parser.add_subparsers(dest='command', required=True)
+    listing = commands.add_parser('list', help='recent builds')
+    listing.add_argument('--config', default=None)
+    listing.add_argument('-n', type=int, default=20)
+    compared = commands.add_parser('compare', help='per config changes between two commits')
+    compared.add_argument('old')
+    compared.add_argument('new', nargs='?', default='HEAD')
+    checked = commands.add_parser('check', help='latest builds against the median of their previous builds')
+    checked.add_argument('--window', type=int, default=10)
+    recorded = commands.add_parser('record', help='add a build (used by build-configs.sh)')
+    recorded.add_argument('--source', required=True)
+    recorded.add_argument('--config', required=True)
+    recorded.add_argument('--env', required=True)
+    recorded.add_argument('--status', required=True)
+    recorded.add_argument('--seconds', type=float, default=None)
+    recorded.add_argument('--phase', action='append', default=[], metavar='NAME=SECONDS')
+    recorded.add_argument('--log', default=None, help='PlatformIO build log to read sizes and warnings from')
+    recorded.add_argument('--firmware', default=None)
+    recorded.add_argument('--cached', action='store_true')
+    args = parser.parse_args(argv)
+
+    from build_configs import find_repo_root  # pylint: disable=import-outside-toplevel
+    repo_root = find_repo_root(Path.cwd()) or find_repo_root()
+    if repo_root is None and not args.db:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    history = BuildHistory(args.db or default_path(repo_root))
+    thresholds = Thresholds(args.time_threshold, args.size_threshold)
+
+    if args.command == 'record':
+        commit, dirty = git_commit(repo_root) if repo_root else (None, None)
+        phases = {name: float(value) for name, value in (p.split('=', 1) for p in args.phase)}
+        log_text = Path(args.log).read_text(encoding='utf-8', errors='replace') if args.log else None
+        firmware = args.firmware if args.firmware and Path(args.firmware).is_file() else None
+        history.record(args.source, args.config, args.env, args.status, args.seconds, phases, log_text, firmware,
+                       args.cached, commit, dirty)
+    elif args.command == 'list':
+        where, params = ('config = ?', (args.config,)) if args.config else ('1', ())
+        for row in history.rows(where, params, args.n):
+            flash = f'{row["flash_used"]}/{row["flash_total"]}' if row['flash_used'] is not None else '-'
+            seconds = f'{row["seconds"]:.0f} s' if row['seconds'] is not None else '-'
+            print(f'{row["started"]}  {(row["commit_id"] or "?")[:10]}{"+" if row["dirty"] else " "} {row["source"]:<13} '
+                  f'{row["status"]:<7} {seconds:>7}  flash {flash:<15} warnings {row["warnings"] if row["warnings"] is not None else "-":<4} '
+                  f'{row["config"]} ({row["env"]})')
+    elif args.command == 'compare':
+        return 1 if compare(history, resolve_commit(repo_root, args.old), resolve_commit(repo_root, args.new), thresholds) else 0
+    else:
+        return 1 if check(history, args.window, thresholds) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
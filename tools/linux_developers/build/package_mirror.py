@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Local, content-addressed mirror of the PlatformIO packages the configs need.
+
+A fresh container or worktree downloads the platform, its toolchain and
+framework packages, tool-scons and every lib_deps entry before its first
+build, and download_mks_assets.py fetches the MKS UI assets on top. That is
+slow, and impossible on a build node without network access. 'snapshot' does
+the downloading once, for every environment in config/*/platformio-environment.txt
+(or the ones named), and keeps the result:
+
+  .pio/package-mirror/
+    objects/<sha[:2]>/<sha256>.tar.gz  one archive per installed package
+                                       directory, named by its hash
+    manifest.json                      per environment: every platform,
+                                       package and library with its version,
+                                       PlatformIO spec and object hash
+    core/, libdeps/                    what 'hydrate' unpacks for PlatformIO
+
+Each environment is installed into an empty staging core directory with
+'platformio pkg install', plus the lib_deps that ini/features.ini and the
+custom_marlin.* options can add while building (common-dependencies.py adds
+them only for enabled features, the mirror holds all of them), and
+'platformio run --list-targets' so that tool-scons is installed too. Every
+package directory it ends up with is archived deterministically (sorted
+entries, no owners or timestamps), so the same package gives the same object
+and environments that share packages share objects.
+
+'hydrate' unpacks an environment's objects into core/ and libdeps/<env>/,
+checking each object's hash on the way, and skips packages that are already
+there. With PLATFORMIO_CORE_DIR and PLATFORMIO_LIBDEPS_DIR pointing at them
+PlatformIO finds everything it needs installed and makes no downloads;
+telemetry and the upgrade check are switched off as well.
+build_configs.py --package-mirror does this for every build; for anything
+else, 'env' prints the variables for the shell.
+
+Usage:
+  ./package_mirror.py snapshot [ENV ...] [--runner podman|local]   # online
+  ./package_mirror.py hydrate [ENV ...]
+  ./package_mirror.py env ENV           # eval "$(./package_mirror.py env ENV)"
+  ./package_mirror.py list | verify | gc
+
+The mirror directory is .pio/package-mirror, or --mirror DIR, or
+$MARLIN_PACKAGE_MIRROR. The podman runners need it inside the repository.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.request
+from pathlib import Path, PurePosixPath
+
+from package_release import CHUNK, HashingWriter
+
+MANIFEST = 'manifest.json'
+MARKER = '.mirror-object'
+MIRROR_ENV = 'MARLIN_PACKAGE_MIRROR'
+PIOPM = '.piopm'
+METADATA_FILES = (PIOPM, 'library.json', 'package.json', 'platform.json', 'library.properties')
+KINDS = {'platform': 'platforms', 'package': 'packages'}    # library: libdeps/<env>/
+FEATURE_KEYS = ('build_flags', 'extra_scripts', 'build_src_filter', 'lib_ignore')
+ASSET_SCRIPTS = {'mks-assets.zip': 'buildroot/share/PlatformIO/scripts/download_mks_assets.py'}
+OFFLINE_SETTINGS = ('PLATFORMIO_SETTING_ENABLE_TELEMETRY=no', 'PLATFORMIO_SETTING_CHECK_PLATFORMIO_INTERVAL=3650')
+
+
+class MirrorError(Exception):
+    """The mirror is missing an environment or an object, or an object does not match its hash."""
+
+
+class HashingReader:
+    """Read-only file wrapper that hashes what is read through it."""
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.digest.update(data)
+        return data
+
+
+def feature_lib_deps(value):
+    """The lib_deps in a [features] or custom_marlin.* value, split the way common-dependencies.py does."""
+    deps = []
+    for line in re.sub(r',\s*', '\n', value).strip().split('\n'):
+        if line.split('=')[0].strip() not in FEATURE_KEYS and line.strip():
+            deps.append(line.strip())
+    return deps
+
+
+def extra_lib_deps(repo_root, env):
+    """Libraries common-dependencies.py can add to env at build time: every [features] entry and custom_marlin.*."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'test'))
+    from select_test_targets import Project  # pylint: disable=import-outside-toplevel
+    project = Project(repo_root)
+    deps = []
+    if project.parser.has_section('features'):
+        for _, value in project.parser.items('features'):
+            deps += feature_lib_deps(value)
+    for section in project.ancestors(f'env:{env}') + ['env']:
+        for option in project.parser.options(section) if project.parser.has_section(section) else ():
+            if option.startswith('custom_marlin.'):
+                deps += feature_lib_deps(project.get(f'env:{env}', option))
+    return list(dict.fromkeys(deps))
+
+
+def package_metadata(path):
+    """(version, spec) of an installed package directory, from PlatformIO's .piopm or the package manifest."""
+    for name in METADATA_FILES:
+        meta_file = path / name
+        if not meta_file.is_file():
+            continue
+        if name == 'library.properties':
+            match = re.search(r'^version=(.*)$', meta_file.read_text(encoding='utf-8', errors='replace'), re.M)
+            return (match.group(1).strip() if match else None), None
+        try:
+            meta = json.loads(meta_file.read_text(encoding='utf-8'))
+        except ValueError:
+            continue
+        return meta.get('version'), meta.get('spec') if name == PIOPM else None
+    return None, None
+
+
+def _normalized(info):
+    info.mtime = 0
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+
+class PackageMirror:
+    """The object store and manifest; hydrate() unpacks an environment for PlatformIO."""
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.core_dir = self.root / 'core'
+        self.libdeps_dir = self.root / 'libdeps'
+        try:
+            self.manifest = json.loads((self.root / MANIFEST).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.manifest = {'format': 1, 'envs': {}, 'assets': {}}
+
+    def object_path(self, sha):
+        return self.objects / sha[:2] / f'{sha}.tar.gz'
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        tmp = self.root / f'.{MANIFEST}.tmp'
+        tmp.write_text(json.dumps(self.manifest, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+        os.replace(tmp, self.root / MANIFEST)
+
+    def store(self, kind, path):
+        """Archive the installed package directory path; return its manifest entry."""
+        self.objects.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.object.', dir=self.objects)
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                out = HashingWriter(raw)
+                with gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as gz, \
+                        tarfile.open(fileobj=gz, mode='w', format=tarfile.PAX_FORMAT) as archive:
+                    for dirpath, dirnames, filenames in os.walk(path):
+                        dirnames.sort()
+                        for name in sorted(dirnames + filenames):
+                            if name == MARKER:
+                                continue
+                            full = Path(dirpath) / name
+                            info = _normalized(archive.gettarinfo(str(full), self._arcname(path, full)))
+                            if info.isreg():
+                                with open(full, 'rb') as f:
+                                    archive.addfile(info, f)
+                            else:
+                                archive.addfile(info)
+            sha = out.digest.hexdigest()
+            target = self.object_path(sha)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists():
+                os.unlink(tmp)
+            else:
+                os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        version, spec = package_metadata(path)
+        return {'kind': kind, 'name': path.name, 'version': version, 'spec': spec, 'sha256': sha, 'size': out.size}
+
+    @staticmethod
+    def _arcname(root, path):
+        return PurePosixPath(*path.relative_to(root).parts).as_posix()
+
+    def store_asset(self, name, url):
+        """Download url into the store as asset name; return its manifest entry."""
+        self.objects.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.asset.', dir=self.objects)
+        try:
+            with os.fdopen(fd, 'wb') as raw, urllib.request.urlopen(url) as response:  # nosec - fixed URLs
+                out = HashingWriter(raw)
+                for block in iter(lambda: response.read(CHUNK), b''):
+                    out.write(block)
+            sha = out.digest.hexdigest()
+            target = self.objects / sha[:2] / f'{sha}{Path(name).suffix}'
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return {'name': name, 'url': url, 'sha256': sha, 'size': out.size}
+
+    def asset_path(self, entry):
+        return self.objects / entry['sha256'][:2] / f'{entry["sha256"]}{Path(entry["name"]).suffix}'
+
+    def referenced(self):
+        """Every object path the manifest refers to, with its expected hash."""
+        found = {}
+        for env in self.manifest['envs'].values():
+            for entry in env['packages']:
+                found[self.object_path(entry['sha256'])] = entry['sha256']
+        for entry in self.manifest['assets'].values():
+            found[self.asset_path(entry)] = entry['sha256']
+        return found
+
+    def _destination(self, entry, env):
+        """Where hydrate puts an entry. A different version of a package already in core/ goes next to it
+        as name@version, the way PlatformIO itself keeps a second version."""
+        if entry['kind'] == 'library':
+            return self.libdeps_dir / env / entry['name']
+        base = self.core_dir / KINDS[entry['kind']]
+        for name in (entry['name'], f'{entry["name"]}@{entry["version"]}', f'{entry["name"]}@{entry["sha256"][:12]}'):
+            dest = base / name
+            marker = dest / MARKER
+            if not dest.exists() or (marker.is_file() and marker.read_text(encoding='utf-8') == entry['sha256']):
+                return dest
+        return base / f'{entry["name"]}@{entry["sha256"]}'
+
+    def _unpack(self, entry, dest):
+        """Unpack an object to dest, replacing it; raises MirrorError if the object does not match its hash."""
+        source = self.object_path(entry['sha256'])
+        if not source.is_file():
+            raise MirrorError(f'object {entry["sha256"][:12]} of {entry["name"]} is missing from the mirror')
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f'.{dest.name}.', dir=dest.parent))
+        extract_options = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+        now = time.time()
+        try:
+            with open(source, 'rb') as raw:
+                reader = HashingReader(raw)
+                with tarfile.open(fileobj=reader, mode='r|gz') as archive:
+                    for info in archive:
+                        info.mtime = now    # newer than any object built from an older version
+                        archive.extract(info, tmp, **extract_options)
+                while reader.read(CHUNK):
+                    pass
+            if reader.digest.hexdigest() != entry['sha256']:
+                raise MirrorError(f'object {entry["sha256"][:12]} of {entry["name"]} is corrupt')
+            (tmp / MARKER).write_text(entry['sha256'], encoding='utf-8')
+            if dest.exists():
+                shutil.rmtree(dest)
+            os.rename(tmp, dest)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def hydrate(self, env):
+        """Unpack what env needs into core/ and libdeps/; return (unpacked, already present) counts."""
+        if env not in self.manifest['envs']:
+            raise MirrorError(f'{env} is not in the mirror, run: package_mirror.py snapshot {env}')
+        unpacked = present = 0
+        for entry in self.manifest['envs'][env]['packages']:
+            dest = self._destination(entry, env)
+            marker = dest / MARKER
+            if marker.is_file() and marker.read_text(encoding='utf-8') == entry['sha256']:
+                present += 1
+                continue
+            self._unpack(entry, dest)
+            unpacked += 1
+        for entry in self.manifest['assets'].values():
+            dest = self.libdeps_dir / entry['name']
+            if not dest.is_file():
+                self.libdeps_dir.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(self.asset_path(entry), dest)
+        return unpacked, present
+
+    def environment(self, core_dir=None, libdeps_dir=None):
+        """Variables that point PlatformIO at the hydrated mirror (paths as seen by whoever runs it)."""
+        return {'PLATFORMIO_CORE_DIR': str(core_dir or self.core_dir),
+                'PLATFORMIO_LIBDEPS_DIR': str(libdeps_dir or self.libdeps_dir),
+                **dict(setting.split('=', 1) for setting in OFFLINE_SETTINGS)}
+
+    def verify(self):
+        """(missing, corrupt) object paths."""
+        missing, corrupt = [], []
+        for path, sha in sorted(self.referenced().items()):
+            if not path.is_file():
+                missing.append(path)
+                continue
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(CHUNK), b''):
+                    digest.update(block)
+            if digest.hexdigest() != sha:
+                corrupt.append(path)
+        return missing, corrupt
+
+    def gc(self):
+        """Delete objects no environment refers to; return how many bytes were freed."""
+        keep = set(self.referenced())
+        freed = 0
+        for path in self.objects.glob('??/*'):
+            if path not in keep:
+                freed += path.stat().st_size
+                path.unlink()
+        return freed
+
+
+def runner_path(runner, repo_root, path):
+    """path as the runner's PlatformIO sees it: the same on the host, under /code in the containers."""
+    if runner.name == 'local':
+        return Path(path).resolve()
+    from build_configs import CONTAINER_ROOT  # pylint: disable=import-outside-toplevel
+    try:
+        return CONTAINER_ROOT / Path(path).resolve().relative_to(repo_root)
+    except ValueError as error:
+        raise MirrorError(f'{path} is outside the repository, the {runner.name} runner cannot see it') from error
+
+
+def env_prefix(environment):
+    """argv prefix that runs a command with the variables set."""
+    return ['env'] + [f'{name}={value}' for name, value in environment.items()]
+
+
+def snapshot(mirror, repo_root, runner, envs, assets=True, log=print):
+    """Install every env into an empty staging core directory and store what it installed."""
+    for env in envs:
+        staging = mirror.root / '.staging' / env
+        shutil.rmtree(staging, ignore_errors=True)
+        (staging / 'core').mkdir(parents=True)
+        prefix = env_prefix(mirror.environment(runner_path(runner, repo_root, staging / 'core'),
+                                               runner_path(runner, repo_root, staging / 'libdeps')))
+        libs = [arg for spec in extra_lib_deps(repo_root, env) for arg in ('-l', spec)]
+        log_path = mirror.root / 'logs' / f'{env}.log'
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        log(f'Installing {env} into a clean core directory (log: {log_path})')
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            commands = [prefix + ['platformio', 'pkg', 'install', '-e', env]]
+            if libs:
+                commands.append(prefix + ['platformio', 'pkg', 'install', '-e', env, '--no-save'] + libs)
+            if runner.run(Path('.'), commands, log_file):
+                raise MirrorError(f'package install for {env} failed, see {log_path}')
+            if runner.run(Path('.'), [prefix + ['platformio', 'run', '-e', env, '--list-targets']], log_file):
+                log(f'WARNING: platformio run --list-targets failed for {env}, tool-scons may be missing')
+        entries = []
+        for kind, base in (('platform', staging / 'core' / 'platforms'), ('package', staging / 'core' / 'packages'),
+                           ('library', staging / 'libdeps' / env)):
+            for path in sorted(p for p in base.glob('*') if p.is_dir()) if base.is_dir() else ():
+                entries.append(mirror.store(kind, path))
+        mirror.manifest['envs'][env] = {'snapshot': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'packages': entries}
+        shutil.rmtree(staging, ignore_errors=True)
+        log(f'{env}: {len(entries)} packages, {sum(e["size"] for e in entries) / 1048576:.1f} MiB')
+        mirror.save()
+    if assets:
+        for name, script in ASSET_SCRIPTS.items():
+            match = re.search(r'^url\s*=\s*"([^"]+)"', (repo_root / script).read_text(encoding='utf-8'), re.M)
+            if match and name not in mirror.manifest['assets']:
+                log(f'Downloading {name} from {match.group(1)}')
+                mirror.manifest['assets'][name] = mirror.store_asset(name, match.group(1))
+        mirror.save()
+    shutil.rmtree(mirror.root / '.staging', ignore_errors=True)
+
+
+def default_root(repo_root):
+    return Path(os.environ.get(MIRROR_ENV) or repo_root / '.pio' / 'package-mirror')
+
+
+def config_envs(repo_root):
+    """The environments of every config/*, in config order."""
+    from build_configs import platform_env, scan_configs  # pylint: disable=import-outside-toplevel
+    envs = [platform_env(repo_root / 'config' / config) for config in scan_configs(repo_root)]
+    return [env for env in dict.fromkeys(envs) if env]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Snapshot PlatformIO packages into a local mirror and build from it.')
+    parser.add_argument('command', choices=('snapshot', 'hydrate', 'env', 'list', 'verify', 'gc'))
+    parser.add_argument('envs', nargs='*', help='environments (default: those of config/*)')
+    parser.add_argument('--mirror', default=None, help=f'mirror directory (default: ${MIRROR_ENV} or .pio/package-mirror)')
+    parser.add_argument('--runner', choices=('podman', 'local'), default='podman',
+                        help='run PlatformIO for snapshot in a podman-compose container (default) or on the host')
+    parser.add_argument('--compose-file', default=None, help='compose file for the podman runner')
+    parser.add_argument('--no-assets', action='store_true', help='do not mirror the MKS UI assets')
+    args = parser.parse_args(argv)
+
+    from build_configs import find_repo_root  # pylint: disable=import-outside-toplevel
+    repo_root = find_repo_root()
+    if repo_root is None:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    mirror = PackageMirror(args.mirror or default_root(repo_root))
+    envs = args.envs or (config_envs(repo_root) if args.command in ('snapshot', 'hydrate') else list(mirror.manifest['envs']))
+
+    try:
+        if args.command == 'snapshot':
+            from build_configs import ComposeRunner, LocalRunner  # pylint: disable=import-outside-toplevel
+            runner = LocalRunner(repo_root) if args.runner == 'local' else ComposeRunner(repo_root, args.compose_file)
+            snapshot(mirror, repo_root, runner, envs, not args.no_assets)
+        elif args.command in ('hydrate', 'env'):
+            if args.command == 'env' and len(envs) != 1:
+                parser.error('env needs exactly one environment')
+            for env in envs:
+                unpacked, present = mirror.hydrate(env)
+                print(f'{env}: {unpacked} packages unpacked, {present} already present',
+                      file=sys.stderr if args.command == 'env' else sys.stdout)
+            if args.command == 'env':
+                for name, value in mirror.environment().items():
+                    print(f'export {name}={value}')
+        elif args.command == 'list':
+            for env in envs:
+                info = mirror.manifest['envs'].get(env)
+                if not info:
+                    print(f'{env}: not in the mirror')
+                    continue
+                print(f'{env} (snapshot {info["snapshot"]})')
+                for entry in info['packages']:
+                    print(f'  {entry["kind"]:<8} {entry["name"]:<40} {entry["version"] or "?":<16} '
+                          f'{entry["sha256"][:12]}  {entry["size"] / 1048576:7.1f} MiB')
+            for entry in mirror.manifest['assets'].values():
+                print(f'asset {entry["name"]} {entry["sha256"][:12]} {entry["size"] / 1048576:.1f} MiB ({entry["url"]})')
+            objects = mirror.referenced()
+            total = sum(p.stat().st_size for p in objects if p.is_file())
+            print(f'{len(objects)} objects, {total / 1048576:.1f} MiB in {mirror.objects}')
+        elif args.command == 'verify':
+            missing, corrupt = mirror.verify()
+            for path in missing:
+                print(f'ERROR: Missing object: {path}')
+            for path in corrupt:
+                print(f'ERROR: Corrupt object: {path}')
+            print(f'{len(mirror.referenced())} objects checked, {len(missing)} missing, {len(corrupt)} corrupt')
+            return 1 if missing or corrupt else 0
+        else:
+            print(f'Freed {mirror.gc() / 1048576:.1f} MiB')
+    except MirrorError as error:
+        print(f'ERROR: {error}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
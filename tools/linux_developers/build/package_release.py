@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Packaging stage for release builds: per-config zips, checksums.txt and a manifest.
+
+Each .pio/build-output/<release>-<config>-<timestamp>/ folder is zipped to
+<folder>.zip next to it, the same layout 'zip -r' gives build-configs.sh.
+Every byte is read once and written once:
+
+  - each file is hashed while it is copied into the archive, and
+  - the archive is hashed while it is written: the zip goes through a
+    non-seekable writer, so zipfile streams it (data descriptors instead of
+    seeking back to patch headers) and the hash of the written bytes is the
+    hash of the finished file. No second pass with sha256sum.
+
+Files that are already compressed (.zip such as DWIN_SET.zip, .bin) are
+stored rather than deflated again. Archives are built concurrently (zlib and
+hashlib release the GIL), and build_configs.py hands each folder over as soon
+as its build finishes, so packaging overlaps the remaining builds.
+
+When everything is packaged, checksums.txt (same format as sha256sum) and
+release-manifest.json are written. The manifest lists every archive and every
+file inside it with its size and sha256.
+
+Usage:
+  ./package_release.py [OUTPUT_DIR [FOLDER ...]] [-j JOBS] [--release NAME]
+
+OUTPUT_DIR defaults to .pio/build-output; without FOLDERs every folder in it
+is packaged.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+CHUNK = 1 << 20
+STORED_SUFFIXES = ('.zip', '.bin', '.gz', '.png', '.jpg')
+CHECKSUMS = 'checksums.txt'
+MANIFEST = 'release-manifest.json'
+
+
+class HashingWriter:
+    """Write-only file wrapper that hashes and counts what goes through it.
+
+    It has no seek(), which is what makes zipfile stream instead of seeking back.
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def tell(self):
+        return self.size
+
+
+def zip_directory(source, zip_path, prefix=''):
+    """Zip the contents of source like 'zip -r', under prefix; return the archive's manifest entry."""
+    source = Path(source)
+    files = []
+    with open(zip_path, 'wb') as raw:
+        out = HashingWriter(raw)
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for dirpath, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                rel_dir = Path(dirpath).relative_to(source)
+                arc_dir = PurePosixPath(prefix, *rel_dir.parts)
+                if str(arc_dir) != '.':
+                    archive.write(dirpath, f'{arc_dir}/')
+                for name in sorted(filenames):
+                    path = Path(dirpath) / name
+                    info = zipfile.ZipInfo.from_file(path, str(arc_dir / name))
+                    stored = path.suffix.lower() in STORED_SUFFIXES
+                    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                    digest = hashlib.sha256()
+                    with open(path, 'rb') as src, archive.open(info, 'w', force_zip64=info.file_size > 0x7FFFFFFF) as dst:
+                        for block in iter(lambda: src.read(CHUNK), b''):
+                            digest.update(block)
+                            dst.write(block)
+                    files.append({'path': info.filename, 'size': info.file_size, 'sha256': digest.hexdigest()})
+        out.flush()
+    return {'name': Path(zip_path).name, 'size': out.size, 'sha256': out.digest.hexdigest(), 'files': files}
+
+
+class Packager:
+    """Zips build output folders on a thread pool as they are submitted, then writes checksums and manifest."""
+    def __init__(self, output_dir, jobs=None, release=None):
+        self.output_dir = Path(output_dir)
+        self.release = release
+        self.pool = ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1, thread_name_prefix='package')
+        self.futures = []     # (folder name, future) in submission order
+        self._lock = threading.Lock()
+
+    def submit(self, build_output_dir, **details):
+        """Queue build_output_dir to be zipped as <build_output_dir>.zip; details go into its manifest entry."""
+        build_output_dir = Path(build_output_dir)
+        zip_path = self.output_dir / f'{build_output_dir.name}.zip'
+
+        def package():
+            started = time.monotonic()
+            entry = zip_directory(build_output_dir, zip_path)
+            entry.update(details, seconds=round(time.monotonic() - started, 3))
+            return entry
+
+        future = self.pool.submit(package)
+        with self._lock:
+            self.futures.append((build_output_dir.name, future))
+        return future
+
+    def close(self, order=None):
+        """Wait for every archive and write checksums.txt and the manifest; return the manifest entries.
+
+        order, a list of folder names, fixes the order of both files (default: submission order).
+        """
+        self.pool.shutdown(wait=True)
+        futures = dict(self.futures)
+        names = [n for n in order if n in futures] if order else [n for n, _ in self.futures]
+        artifacts = [futures[name].result() for name in names]
+        with open(self.output_dir / CHECKSUMS, 'w', encoding='utf-8') as f:
+            for artifact in artifacts:
+                f.write(f'{artifact["sha256"]}  {artifact["name"]}\n')
+        manifest = {'release': self.release, 'generated': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                    'artifacts': artifacts}
+        tmp = self.output_dir / f'.{MANIFEST}.tmp'
+        tmp.write_text(json.dumps(manifest, indent=2) + '\n', encoding='utf-8')
+        os.replace(tmp, self.output_dir / MANIFEST)
+        return artifacts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Zip build output folders and write checksums.txt and a release manifest.')
+    parser.add_argument('output_dir', nargs='?', default=None, help='build output directory (default: .pio/build-output)')
+    parser.add_argument('folders', nargs='*', help='folders to package (default: every folder in output_dir)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='archives built at once (default: CPUs)')
+    parser.add_argument('--release', default=None, help='release name recorded in the manifest')
+    args = parser.parse_intermixed_args(argv)
+    if args.output_dir:
+        output_dir = Path(args.output_dir)
+    else:
+        from build_configs import find_repo_root  # pylint: disable=import-outside-toplevel
+        repo_root = find_repo_root()
+        if repo_root is None:
+            print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+            return 1
+        output_dir = repo_root / '.pio' / 'build-output'
+    if args.folders:
+        folders = [output_dir / Path(folder).name for folder in args.folders]
+    else:
+        folders = sorted(p for p in output_dir.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    if not folders:
+        print(f'ERROR: Nothing to package in {output_dir}', file=sys.stderr)
+        return 1
+
+    started = time.monotonic()
+    packager = Packager(output_dir, args.jobs, args.release)
+    for folder in folders:
+        packager.submit(folder)
+    for artifact in packager.close():
+        print(f'Created: {artifact["name"]} ({artifact["size"] / 1024:.0f} KiB)')
+        print(f'SHA256: {artifact["sha256"]}')
+    print(f'Packaged {len(folders)} folders in {time.monotonic() - started:.1f} s; '
+          f'wrote {CHECKSUMS} and {MANIFEST}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
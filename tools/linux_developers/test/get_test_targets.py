@@ -28,7 +28,10 @@ if REPO_ROOT is None:
 # Change to repository root for consistent path handling
 os.chdir(REPO_ROOT)
 
+# The workflows are kept under .dev/github in this repository
 workflow_file = REPO_ROOT / '.github' / 'workflows' / 'test-builds.yml'
+if not workflow_file.exists():
+    workflow_file = REPO_ROOT / '.dev' / 'github' / 'workflows' / 'test-builds.yml'
 if not workflow_file.exists():
     print(f"ERROR: Workflow file not found: {workflow_file}", file=sys.stderr)
     sys.exit(1)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Run buildroot/tests/<env> scripts in parallel, each in its own overlay project.
+
+'make tests-all-local' runs the CI test platforms one after another in the
+repository itself, because every test rewrites Marlin/Configuration*.h.
+This script gives every test env an overlay project, built the same way as
+build_configs.py builds its config overlays:
+
+  .pio/test-shards/<env>/      Marlin/ as file symlinks plus private copies of
+                               Configuration*.h, its own .pio/build
+  .pio/test-shards/.pristine/  Configuration*.h and pins_RAMPS.h as committed,
+                               what restore_configs puts back
+  .pio/test-shards/logs/<env>.log
+  .pio/test-shards/history.json   how long each env took when it last passed
+  .pio/test-shards/report.txt     results, timings and the tail of failed logs
+
+Each env run is also added to the build history database (build_history.py).
+
+The test scripts run unchanged: exec_test and restore_configs are provided as
+exported shell functions that work on the overlay (restore_configs copies the
+pristine files back instead of 'git checkout'). opt_set, pins_set & co. edit
+files with 'sed -i', which replaces a symlink with a file, so the shared
+sources are never written.
+
+Envs are scheduled longest first, using the duration from history.json (or
+the number of tests in the script for envs that never passed), so a long
+env does not start last. By default half as many envs as CPUs run at once,
+each with an equal share of the CPUs for its compiler jobs.
+
+Usage:
+  ./run_test_shards.py [ENV ...] [-j ENVS] [--build-jobs JOBS] [--only TEST]
+                       [--runner local|podman|session] [--changed [BASE]]
+
+Without ENVs the CI test platforms from get_test_targets.py are run; ALL runs
+every script in buildroot/tests. --changed narrows them down to the envs the
+changes since BASE can affect (select_test_targets.py).
+
+Examples:
+  ./run_test_shards.py                          # The CI platforms, CPUs/2 at a time
+  ./run_test_shards.py LPC1768 DUE -j 2         # Two envs
+  ./run_test_shards.py rambo --only 'Azteeg X3' # Tests whose name matches
+  ./run_test_shards.py rambo --only 3           # The third test of each env
+  ./run_test_shards.py --changed                # What the branch touches, before pushing
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'build'))
+
+# pylint: disable=wrong-import-position
+from build_configs import (CONFIG_FILES, ComposeRunner, LocalRunner, SessionRunner, cpu_count, find_repo_root,
+                           job_limits, materialize)
+from build_history import BuildHistory, default_path as history_path, git_commit
+
+PRISTINE_FILES = CONFIG_FILES + ('src/pins/ramps/pins_RAMPS.h',)
+HISTORY = 'history.json'
+REPORT = 'report.txt'
+LOG_TAIL = 30
+
+# Runs one test script in the overlay (the working directory):
+#   bash -c SHARD_DRIVER test-shard ENV ONLY_TEST BUILD_JOBS
+SHARD_DRIVER = r'''
+PRISTINE="$(cd ../.pristine && pwd)"
+export PATH="$PWD/buildroot/bin:$PWD/buildroot/tests:$PATH" PRISTINE BUILD_JOBS="$3"
+restore_configs () {
+  cp "$PRISTINE/Configuration.h" "$PRISTINE/Configuration_adv.h" Marlin/
+  rm -f Marlin/src/pins/ramps/pins_RAMPS.h && cp "$PRISTINE/pins_RAMPS.h" Marlin/src/pins/ramps/
+  rm -f Marlin/_Bootscreen.h Marlin/_Statusscreen.h
+}
+exec_test () {
+  printf "\n[Test $2] $3...\n"
+  if [[ -n "$4" && ! "$3" =~ $4 ]]; then
+    printf "Skipped\n"
+    return 0
+  fi
+  if [[ -z "$VERBOSE_PLATFORMIO" ]] ; then
+    silent="--silent"
+  else
+    silent="-v"
+  fi
+  if platformio run --project-dir "$1" -e "$2" -j "$BUILD_JOBS" $silent; then
+    printf "Passed\n"
+  else
+    printf "Failed!\n"
+    return 1
+  fi
+}
+export -f restore_configs exec_test
+buildroot/tests/"$1" . "$1" "$2"
+'''
+
+log = logging.getLogger('build_configs')
+
+
+def ci_targets(repo_root):
+    """The test platforms of the CI workflow, as printed by get_test_targets.py."""
+    script = Path(__file__).resolve().parent / 'get_test_targets.py'
+    result = subprocess.run([sys.executable, str(script)], cwd=repo_root, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=False)
+    if result.returncode:
+        raise SystemExit('ERROR: get_test_targets.py failed; name the envs to test instead')
+    return result.stdout.split()
+
+
+def test_scripts(repo_root):
+    """The env test scripts in buildroot/tests: executable files, not dotfiles such as .gitattributes."""
+    return sorted(p.name for p in (repo_root / 'buildroot' / 'tests').iterdir()
+                  if not p.name.startswith('.') and p.is_file() and os.access(p, os.X_OK))
+
+
+def select(repo_root, requested):
+    available = test_scripts(repo_root)
+    if requested == ['ALL']:
+        return available
+    targets = requested or ci_targets(repo_root)
+    unknown = [env for env in targets if env not in available]
+    if unknown:
+        raise SystemExit(f'ERROR: No test script in buildroot/tests for: {", ".join(unknown)}')
+    return list(dict.fromkeys(targets))
+
+
+def snapshot_pristine(repo_root, pristine):
+    """Save the committed Configuration*.h and pins_RAMPS.h, what restore_configs checks out."""
+    pristine.mkdir(parents=True, exist_ok=True)
+    for rel in PRISTINE_FILES:
+        try:
+            data = subprocess.run(['git', 'show', f':Marlin/{rel}'], cwd=repo_root, stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            data = (repo_root / 'Marlin' / rel).read_bytes()
+        (pristine / Path(rel).name).write_bytes(data)
+
+
+def count_tests(script):
+    return sum(1 for line in script.read_text(encoding='utf-8').splitlines() if line.startswith('exec_test'))
+
+
+def test_name(script, index):
+    """Name of the 1-based index-th exec_test in script, as buildroot/bin/run_tests resolves it; '' if none."""
+    tests = [line for line in script.read_text(encoding='utf-8').splitlines() if line.startswith('exec_test')]
+    if not 0 < index <= len(tests):
+        return ''
+    match = re.match(r'.*\$1 \$2 "([^"]*)', tests[index - 1])
+    return match.group(1) if match else tests[index - 1]
+
+
+class History:
+    """Duration of each env's last passing run, kept in history.json."""
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.envs = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.envs = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, env, tests):
+        """Expected seconds for env: its last passing run, else tests times the average seconds per test."""
+        if 'seconds' in self.envs.get(env, {}):
+            return self.envs[env]['seconds']
+        known = [entry for entry in self.envs.values() if entry.get('tests') and 'seconds' in entry]
+        per_test = sum(e['seconds'] for e in known) / sum(e['tests'] for e in known) if known else 60.0
+        return tests * per_test
+
+    def record(self, env, status, seconds, tests):
+        # A failed run stops at the first failing test: keep the duration of the last full run
+        with self._lock:
+            entry = self.envs.setdefault(env, {})
+            if status == 'passed':
+                entry.update(seconds=round(seconds, 1), tests=tests)
+            entry.update(status=status, when=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def save(self):
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.envs, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+        tmp.replace(self.path)
+
+
+class ShardRun:
+    """Everything shared by the test envs of one run."""
+    def __init__(self, repo_root, runner, build_jobs, only='', history=None):
+        self.repo_root = repo_root
+        self.runner = runner
+        self.build_jobs = build_jobs
+        self.only = only
+        self.root = repo_root / '.pio' / 'test-shards'
+        self.log_dir = self.root / 'logs'
+        self.history = History(self.root / HISTORY)
+        self.build_history = history
+        self.commit = git_commit(repo_root) if history else (None, None)
+
+    def prepare(self, envs):
+        """Snapshot the pristine configs; return envs longest first."""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        snapshot_pristine(self.repo_root, self.root / '.pristine')
+        tests = {env: count_tests(self.repo_root / 'buildroot' / 'tests' / env) for env in envs}
+        return sorted(envs, key=lambda env: -self.history.estimate(env, tests[env]))
+
+    def preinstall(self, envs):
+        """Install each env's PlatformIO packages once, before the shards share them concurrently."""
+        for env in envs:
+            overlay = materialize(self.repo_root, self.root / env, self.root / '.pristine')
+            log.info('Installing PlatformIO packages for %s...', env)
+            with open(self.log_dir / f'{env}-install.log', 'w', encoding='utf-8') as log_file:
+                if self.runner.run(overlay.relative_to(self.repo_root), [['platformio', 'pkg', 'install', '-e', env]],
+                                   log_file):
+                    log.warning('WARNING: Package install for %s failed, see %s', env, log_file.name)
+
+    def only_pattern(self, env):
+        """The --only regex for env: a 1 or 2 digit index selects that test of the env, like run_tests."""
+        if not re.fullmatch(r'[0-9][0-9]?', self.only):
+            return self.only
+        return test_name(self.repo_root / 'buildroot' / 'tests' / env, int(self.only))
+
+    def test(self, env):
+        """Run one env's test script in its overlay; return a result dict."""
+        overlay = materialize(self.repo_root, self.root / env, self.root / '.pristine')
+        project = overlay.relative_to(self.repo_root)
+        log_path = self.log_dir / f'{env}.log'
+        log.info('Testing %s', env)
+        started = time.monotonic()
+        only = self.only_pattern(env)
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            if self.only and not only:
+                log_file.write(f'Could not find test #{self.only} in buildroot/tests/{env}\n')
+                code = 1
+            else:
+                code = self.runner.run(project, [['bash', '-c', SHARD_DRIVER, 'test-shard', env, only,
+                                                  str(self.build_jobs)]], log_file)
+        seconds = time.monotonic() - started
+        text = log_path.read_text(encoding='utf-8', errors='replace')
+        names = re.findall(r'^\[Test [^\]]*\] (.*)\.\.\.$', text, re.M)
+        result = {'env': env, 'status': 'failed' if code else 'passed', 'seconds': seconds,
+                  'passed': len(re.findall(r'^Passed$', text, re.M)),
+                  'skipped': len(re.findall(r'^Skipped$', text, re.M)),
+                  'failed_test': names[-1] if code and names else '', 'log': log_path}
+        self.history.record(env, result['status'], seconds, len(names))
+        if self.build_history and not self.only:
+            # The size columns come from the last test build of the env
+            self.build_history.record('test-shards', env, env, result['status'], seconds, {'tests': seconds}, text,
+                                      commit=self.commit[0], dirty=self.commit[1])
+        log.info('%s %s (%.0f s)', 'PASSED' if not code else 'FAILED', env, seconds)
+        return result
+
+    def report(self, results, wall_seconds):
+        """Write report.txt and return its text."""
+        failed = [r for r in results if r['status'] == 'failed']
+        busy = sum(r['seconds'] for r in results)
+        lines = [f'Test shards: {len(results) - len(failed)} passed, {len(failed)} failed, '
+                 f'{wall_seconds:.0f} s wall time, {busy:.0f} s of tests ({busy / max(wall_seconds, 1):.1f}x)', '']
+        for r in sorted(results, key=lambda r: (r['status'] == 'passed', -r['seconds'])):
+            detail = f'{r["passed"]} passed, {r["skipped"]} skipped'
+            if r['failed_test']:
+                detail += f', failed: {r["failed_test"]}'
+            lines.append(f'  {r["status"]:<7} {r["seconds"]:6.0f} s  {r["env"]:<34} {detail}')
+        for r in failed:
+            tail = r['log'].read_text(encoding='utf-8', errors='replace').splitlines()[-LOG_TAIL:]
+            lines += ['', f'--- {r["env"]}: last {len(tail)} lines of {r["log"].relative_to(self.repo_root)} ---', *tail]
+        text = '\n'.join(lines) + '\n'
+        (self.root / REPORT).write_text(text, encoding='utf-8')
+        self.history.save()
+        return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run buildroot/tests envs in parallel, each in its own overlay.')
+    parser.add_argument('envs', nargs='*', help='test envs to run (default: the CI platforms, ALL: every env)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='envs to test at once (default: CPUs / 2)')
+    parser.add_argument('--build-jobs', type=int, default=None, help='compiler jobs per env (default: CPUs / envs)')
+    parser.add_argument('--only', default='', help='run only the tests whose name matches this regex, or the test with this 1-based index')
+    parser.add_argument('--runner', choices=('local', 'podman', 'session'), default='local',
+                        help='host PlatformIO (default), a podman-compose container per env, or long-lived containers')
+    parser.add_argument('--compose-file', default=None, help='compose file for the podman runners')
+    parser.add_argument('--no-history', action='store_true', help='do not record the envs in .pio/build-history.sqlite')
+    parser.add_argument('--changed', nargs='?', const='', default=None, metavar='BASE',
+                        help='only the envs affected by changes since BASE (default: fork point of upstream)')
+    args = parser.parse_args(argv)
+
+    repo_root = find_repo_root()
+    if repo_root is None:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    envs = select(repo_root, args.envs)
+    if args.changed is not None:
+        from select_test_targets import select_changed  # pylint: disable=import-outside-toplevel
+        envs, selector = select_changed(repo_root, envs, args.changed or None)
+        sys.stderr.write(selector.explain())
+        if not envs:
+            log.info('Nothing to test: no env is affected by the changes')
+            return 0
+    workers, build_jobs = job_limits(len(envs), args.jobs, args.build_jobs)
+    if args.runner == 'session':
+        runner = SessionRunner(repo_root, args.compose_file, workers)
+    elif args.runner == 'podman':
+        runner = ComposeRunner(repo_root, args.compose_file)
+    else:
+        runner = LocalRunner(repo_root)
+    history = None if args.no_history else BuildHistory(history_path(repo_root))
+    run = ShardRun(repo_root, runner, build_jobs, args.only, history)
+    envs = run.prepare(envs)
+    log.info('Testing %d envs, %d at a time with %d compiler jobs each (%s runner, %d CPUs)',
+             len(envs), workers, build_jobs, runner.name, cpu_count())
+
+    started = time.monotonic()
+    try:
+        if isinstance(runner, SessionRunner):
+            runner.start()
+        run.preinstall(envs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run.test, envs))
+    finally:
+        if isinstance(runner, SessionRunner):
+            runner.close()
+    print(run.report(results, time.monotonic() - started), end='')
+    log.info('Report written to %s', run.root / REPORT)
+    return 1 if any(r['status'] == 'failed' for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
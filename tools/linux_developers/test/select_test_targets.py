@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Pick the buildroot/tests envs that a change can affect, and say why.
+
+Every changed file (git diff against the upstream branch, plus untracked
+files) is mapped to what decides whether it gets compiled, and that to the
+test scripts that exercise it:
+
+  Marlin/src/HAL/<hal>/...      envs whose build_src_filter takes the file
+  Marlin/src/pins/.../pins_X.h  the boards that pins.h maps to the file
+                                (directly or via an including pins file),
+                                and the tests that opt_set those MOTHERBOARDs
+  Marlin/src/lcd/language/...   tests that set that LCD_LANGUAGE
+  other Marlin/src files        the feature that ini/features.ini adds the
+                                file for, else the file's own '#if' guard;
+                                HAS_* names are followed through the
+                                Conditionals headers down to Configuration
+                                options, and tests that opt_enable/opt_set
+                                one of those options are picked
+  ini/<file>.ini                envs defined in the file or extending it
+  PlatformIO scripts, boards    envs that use them
+  buildroot/tests/<env>         that env
+  Configuration*.h, platformio.ini, features.ini, buildroot/bin
+                                everything
+
+A feature that the base Configuration*.h already enables is built by every
+test, so it selects every candidate. Tests that 'use_example_configs' build
+a downloaded example, whose board and options are unknown here, so those envs
+are selected for any Marlin/src file that their build_src_filter or a
+features.ini entry takes. Files outside the firmware and its build
+(docs, tools, configs/) select nothing.
+
+Candidates are the CI test platforms from get_test_targets.py, or every
+script with --all. The targets go to stdout on one line, the explanation to
+stderr, so the output can be handed to run_test_shards.py or make:
+
+  make tests-all-local-parallel ... $(./select_test_targets.py)
+
+run_test_shards.py --changed does the same in one step.
+
+Usage:
+  ./select_test_targets.py [BASE] [--files PATH ...] [--all] [--quiet]
+
+BASE defaults to the merge base with @{upstream} (else origin/main, else HEAD).
+"""
+
+import argparse
+import configparser
+import fnmatch
+import re
+import subprocess
+import sys
+from pathlib import Path, PurePosixPath
+
+BASE_CANDIDATES = ('@{upstream}', 'origin/main', 'origin/master')
+BUILD_EVERYTHING = ('platformio.ini', 'ini/features.ini', 'buildroot/bin/*', 'buildroot/share/scripts/opt_config.py',
+                    'Marlin/Configuration*.h', 'Marlin/*.h', 'Marlin/Makefile', 'Marlin/Marlin.ino')
+DEFAULT_FILTER = '+<*>'
+FILTER_ITEM = re.compile(r'([+-])<([^>]*)>')
+INTERPOLATION = re.compile(r'\$\{([^}.]+)\.([^}]+)\}')
+IDENT = re.compile(r'\b([A-Z_][A-Z0-9_]*)\b(\s*\()?')
+PIN_EXISTS = re.compile(r'\bPINS?_EXISTS?\s*\(([^)]*)\)')
+DIRECTIVE = re.compile(r'^\s*#\s*(\w+)\s*(.*)$')
+MB = re.compile(r'\bMB\s*\(([^)]*)\)')
+INCLUDE = re.compile(r'^\s*#\s*include\s+"([^"]+)"', re.M)
+
+
+def strip_comments(text):
+    """C source without comments, continuation lines joined."""
+    text = re.sub(r'/\*.*?\*/', lambda m: '\n' * m.group(0).count('\n'), text, flags=re.S)
+    text = re.sub(r'//[^\n]*', '', text)
+    return text.replace('\\\n', ' ')
+
+
+def condition_names(condition):
+    """The option names a preprocessor condition tests: macro calls are left out, PIN_EXISTS(X) gives X_PIN."""
+    condition = PIN_EXISTS.sub(lambda m: ' '.join(f'{a.strip()}_PIN' for a in m.group(1).split(',')), condition)
+    return {name for name, call in IDENT.findall(condition) if not call}
+
+
+def file_guard(text):
+    """The condition of an '#if' that encloses all code of the file, or None."""
+    lines = [line for line in strip_comments(text).split('\n') if line.strip()]
+    depth, guard, closed = 0, None, False
+    for line in lines:
+        match = DIRECTIVE.match(line)
+        keyword, rest = (match.group(1), match.group(2)) if match else (None, None)
+        if closed:
+            if keyword not in ('include', 'pragma'):
+                return None
+            continue
+        if depth == 0 and guard is None:
+            if keyword in ('include', 'pragma'):
+                continue
+            if keyword in ('if', 'ifdef'):
+                guard = rest if keyword == 'if' else f'defined({rest})'
+                depth = 1
+                continue
+            return None
+        if keyword in ('if', 'ifdef', 'ifndef'):
+            depth += 1
+        elif keyword == 'endif':
+            depth -= 1
+            closed = depth == 0
+        elif keyword in ('else', 'elif') and depth == 1:
+            return None
+    return guard if closed else None
+
+
+def defined_names(paths):
+    """Names #define'd in the files, commented out or not; the ones enabled outside any '#if' and the values of
+    all enabled ones (the first definition wins, like MOTHERBOARD under '#ifndef MOTHERBOARD')."""
+    named, enabled, values = set(), {}, {}
+    for path in paths:
+        text = path.read_text(encoding='latin-1')
+        named.update(re.findall(r'^\s*(?://)?\s*#define\s+(\w+)', text, re.M))
+        depth = 0
+        for line in strip_comments(text).split('\n'):
+            match = DIRECTIVE.match(line)
+            if not match:
+                continue
+            keyword, rest = match.groups()
+            if keyword in ('if', 'ifdef', 'ifndef'):
+                depth += 1
+            elif keyword == 'endif':
+                depth -= 1
+            elif keyword == 'define':
+                name, _, value = rest.partition(' ')
+                values.setdefault(name, value.strip())
+                if depth == 0:
+                    enabled[name] = value.strip()
+    return named, enabled, values
+
+
+def derivations(paths):
+    """What each name #define'd in the headers depends on: the conditions it is defined under and its value."""
+    deps = {}
+    for path in paths:
+        stack = []      # per open #if: the names in all conditions of the chain so far
+        for line in strip_comments(path.read_text(encoding='latin-1')).split('\n'):
+            match = DIRECTIVE.match(line)
+            if not match:
+                continue
+            keyword, rest = match.groups()
+            if keyword in ('if', 'ifdef', 'ifndef'):
+                stack.append(condition_names(rest) if keyword == 'if' else {rest.strip()})
+            elif keyword == 'elif' and stack:
+                stack[-1] = stack[-1] | condition_names(rest)
+            elif keyword == 'endif' and stack:
+                stack.pop()
+            elif keyword == 'define':
+                name, _, value = rest.partition(' ')
+                name = name.split('(')[0]
+                found = condition_names(value) | (stack[-1] if stack else set())
+                deps.setdefault(name, set()).update(found - {name})
+    return deps
+
+
+def path_matches(path, pattern):
+    """fnmatch for paths: '*' does not cross a '/'."""
+    return path.count('/') == pattern.count('/') and fnmatch.fnmatchcase(path, pattern)
+
+
+def src_filter_match(items, path):
+    """The build_src_filter item that takes path (relative to Marlin/), or None: the last item that matches decides."""
+    parents = [str(p) for p in reversed(PurePosixPath(path).parents) if str(p) != '.'] + [path]
+    taken = None
+    for sign, pattern in FILTER_ITEM.findall(items):
+        pattern = pattern.rstrip('/')
+        if any(path_matches(p, pattern) for p in parents):
+            taken = pattern if sign == '+' else None
+    return taken
+
+
+def src_filter_takes(items, path):
+    return src_filter_match(items, path) is not None
+
+
+class Project:
+    """platformio.ini and ini/*.ini, with PlatformIO's 'extends' and ${section.option} resolved."""
+    def __init__(self, repo_root):
+        self.repo_root = repo_root
+        self.parser = configparser.RawConfigParser(strict=False, inline_comment_prefixes=(';',))
+        self.defined_in = {}
+        for path in [repo_root / 'platformio.ini'] + sorted((repo_root / 'ini').glob('*.ini')):
+            before = set(self.parser.sections())
+            self.parser.read(path, encoding='utf-8')
+            for section in set(self.parser.sections()) - before:
+                self.defined_in[section] = path.relative_to(repo_root).as_posix()
+
+    @property
+    def envs(self):
+        return [s[4:] for s in self.parser.sections() if s.startswith('env:')]
+
+    def ancestors(self, section):
+        """The section and every section it extends, nearest first."""
+        found, todo = [], [section]
+        while todo:
+            current = todo.pop(0)
+            if current in found or not self.parser.has_section(current):
+                continue
+            found.append(current)
+            todo += [s.strip() for s in self.parser.get(current, 'extends', fallback='').split(',') if s.strip()]
+        return found
+
+    def get(self, section, option, default='', depth=0):
+        """The option of the section or the nearest section it extends (envs fall back to [env]), interpolated."""
+        fallback = ['env'] if section.startswith('env:') else []
+        for current in self.ancestors(section) + fallback:
+            if self.parser.has_option(current, option):
+                value = self.parser.get(current, option)
+                if depth > 10:
+                    return value
+                return INTERPOLATION.sub(lambda m: self.get(m.group(1), m.group(2), '', depth + 1), value)
+        return default
+
+    def src_filter(self, env):
+        section = f'env:{env}'
+        return self.get(section, 'build_src_filter') or self.get(section, 'src_filter') or DEFAULT_FILTER
+
+    def features(self):
+        """ini/features.ini: feature name -> its build_src_filter items."""
+        found = {}
+        if self.parser.has_section('features'):
+            for name, value in self.parser.items('features'):
+                match = re.search(r'build_src_filter\s*=\s*([^\n]*)', value)
+                if match:
+                    found[name.upper()] = match.group(1)
+        return found
+
+
+class TestScripts:
+    """What each buildroot/tests script configures, from its opt_* lines (per exec_test, see opt_config.segments)."""
+    def __init__(self, repo_root, envs):
+        sys.path.insert(0, str(repo_root / 'buildroot' / 'share' / 'scripts'))
+        from opt_config import parse_script, segments  # pylint: disable=import-outside-toplevel
+        self.options, self.boards, self.languages = {}, {}, {}
+        self.examples = {}  # env -> the example configs it starts tests from (segments() treats them as the defaults)
+        for env in envs:
+            script = repo_root / 'buildroot' / 'tests' / env
+            examples = [' '.join(args) for command, args in parse_script(script.read_text(encoding='utf-8'))
+                        if command == 'use_example_configs']
+            if examples:
+                self.examples[env] = examples
+            options, boards, languages = set(), set(), set()
+            for segment in segments(script):
+                board = None
+                for command, args in segment:
+                    pairs = list(zip(args[::2], args[1::2])) if command == 'opt_set' else [(a, None) for a in args]
+                    if command in ('opt_set', 'opt_enable', 'opt_add'):
+                        # Values count too: HAS_DRIVER(TMC2209) comes down to 'opt_set X_DRIVER_TYPE TMC2209'
+                        options.update(name for name, _ in pairs)
+                        options.update(value for _, value in pairs if value and IDENT.fullmatch(value))
+                    for name, value in pairs:
+                        if name == 'MOTHERBOARD':
+                            board = value
+                        elif name.startswith('LCD_LANGUAGE') and value:
+                            languages.add(value)
+                boards.add(board)
+            self.options[env], self.boards[env], self.languages[env] = options, boards, languages
+
+    def setting(self, names):
+        return sorted(env for env, options in self.options.items() if options & names)
+
+    def building(self, boards):
+        return sorted(env for env, used in self.boards.items() if used & boards)
+
+    def in_language(self, language):
+        return sorted(env for env, languages in self.languages.items() if language in languages)
+
+    @property
+    def all_options(self):
+        return set().union(*self.options.values()) if self.options else set()
+
+
+class Selector:
+    """Maps changed files to test envs; explain() tells which file selected what, and why."""
+    def __init__(self, repo_root, candidates):
+        self.repo_root = repo_root
+        self.marlin = repo_root / 'Marlin'
+        self.candidates = list(candidates)
+        self.project = Project(repo_root)
+        from run_test_shards import test_scripts  # pylint: disable=import-outside-toplevel
+        available = set(test_scripts(repo_root))
+        self.tests = TestScripts(repo_root, sorted(available))
+        self.available = available
+        config_files = sorted(self.marlin.glob('Configuration*.h'))
+        self.configured, self.enabled, self.values = defined_names(config_files)
+        self.primary = self.configured | self.tests.all_options
+        # Conditionals_*.h derive HAS_* from the options; common-dependencies.h names the features.ini entries
+        self.deps = derivations(sorted((self.marlin / 'src' / 'inc').glob('Conditionals_*.h'))
+                                + [self.marlin / 'src' / 'core' / 'drivers.h', repo_root / 'buildroot' / 'share' / 'PlatformIO' / 'scripts' / 'common-dependencies.h'])
+        self._pins = None
+        self.features = self.project.features()
+        self.reasons = []       # (path, reason, envs)
+
+    # Options
+
+    def primary_options(self, names):
+        """Follow derived names (HAS_* & co.) down to Configuration options or options the tests set."""
+        found, seen, todo = set(), set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in self.primary:
+                found.add(name)
+            else:
+                todo += self.deps.get(name, ())
+        return found
+
+    def by_options(self, names):
+        """(envs, reason) for code that is built when one of the options is set."""
+        options = self.primary_options(names)
+        shown = ', '.join(sorted(options)[:6]) + (' ...' if len(options) > 6 else '')
+        on_by_default = sorted(options & (set(self.enabled) | set(self.enabled.values())))
+        if on_by_default:
+            return self.candidates, f'{", ".join(on_by_default[:3])} enabled in Configuration*.h'
+        if not options:
+            return [], f'no Configuration option behind {", ".join(sorted(names))}'
+        envs = self.tests.setting(options)
+        return envs, f'tests set {shown}' if envs else f'no test sets {shown}'
+
+    # Pins
+
+    def pins_boards(self):
+        """pins file (relative to Marlin/src/pins) -> the boards pins.h selects it for, via includes too."""
+        if self._pins is None:
+            pins_dir = self.marlin / 'src' / 'pins'
+            boards, current = {}, set()
+            for line in strip_comments((pins_dir / 'pins.h').read_text(encoding='latin-1')).split('\n'):
+                match = DIRECTIVE.match(line)
+                if match and match.group(1) in ('if', 'elif'):
+                    current = {b.strip() for m in MB.findall(match.group(2)) for b in m.split(',') if b.strip()}
+                elif match and match.group(1) == 'include' and current:
+                    included = match.group(2).strip().strip('"')
+                    boards.setdefault(included, set()).update(current)
+            included_by = {}
+            for path in pins_dir.rglob('pins_*.h'):
+                rel = path.relative_to(pins_dir)
+                for name in INCLUDE.findall(strip_comments(path.read_text(encoding='latin-1'))):
+                    target = PurePosixPath(rel.parent.as_posix(), name)
+                    parts = []
+                    for part in target.parts:
+                        if part == '..':
+                            parts = parts[:-1]
+                        elif part != '.':
+                            parts.append(part)
+                    included_by.setdefault('/'.join(parts), set()).add(rel.as_posix())
+            resolved = {}
+
+            def resolve(name, seen=()):
+                if name not in resolved:
+                    found = set(boards.get(name, ()))
+                    for parent in included_by.get(name, ()):
+                        if parent not in seen:
+                            found |= resolve(parent, seen + (name,))
+                    resolved[name] = found
+                return resolved[name]
+
+            for name in set(boards) | set(included_by):
+                resolve(name)
+            self._pins = resolved
+        return self._pins
+
+    # Files
+
+    def envs_taking(self, marlin_path):
+        return sorted(env for env in self.candidates
+                      if env in self.project.envs and src_filter_takes(self.project.src_filter(env), marlin_path))
+
+    def envs_using(self, path):
+        """Envs whose resolved settings name the file (extra_scripts, boards, variants, ...)."""
+        name = PurePosixPath(path).name
+        stem = PurePosixPath(path).stem
+        found = []
+        for env in self.candidates:
+            section = f'env:{env}'
+            values = [self.project.get(section, option) for option in
+                      ('extra_scripts', 'board', 'board_build.variant', 'board_build.ldscript', 'board_build.offset',
+                       'platform_packages', 'build_flags')]
+            text = '\n'.join(values)
+            if name in text or re.search(rf'(^|[\s/=]){re.escape(stem)}($|\s)', text, re.M):
+                found.append(env)
+        return found
+
+    def envs_from_ini(self, path):
+        sections = {s for s, defined in self.project.defined_in.items() if defined == path}
+        return sorted(env for env in self.candidates if sections & set(self.project.ancestors(f'env:{env}')))
+
+    def classify(self, path):
+        """(envs, reason) for one changed file, path relative to the repository root."""
+        if any(path_matches(path, pattern) for pattern in BUILD_EVERYTHING):
+            return self.candidates, 'used by every build'
+        if path.startswith('buildroot/tests/'):
+            env = PurePosixPath(path).name
+            return ([env], 'test script') if env in self.available else ([], 'removed test script')
+        if path.startswith('ini/') and path.endswith('.ini'):
+            return self.envs_from_ini(path), 'env definitions'
+        if path.startswith('buildroot/share/PlatformIO/'):
+            return self.envs_using(path), 'PlatformIO script, board or variant'
+        if not path.startswith('Marlin/src/'):
+            return [], 'not part of the firmware build'
+
+        marlin_path = path[len('Marlin/'):]
+        if path.endswith('.py'):
+            return self.envs_using(path), 'PlatformIO script'
+        if marlin_path.startswith('src/HAL/') and not marlin_path.startswith('src/HAL/shared/'):
+            return self.envs_taking(marlin_path), 'HAL, by build_src_filter'
+        envs, reason = self.classify_source(path, marlin_path)
+        # What an example config enables is unknown, so whatever its env or any feature can build may be built
+        by_feature = any(src_filter_takes(items, marlin_path) for items in self.features.values())
+        unknown = [env for env in self.candidates if env in self.tests.examples and env not in envs
+                   and (by_feature or env not in self.project.envs
+                        or src_filter_takes(self.project.src_filter(env), marlin_path))]
+        if unknown:
+            envs = sorted(set(envs) | set(unknown))
+            reason += f'; {len(unknown)} env{"s" if len(unknown) > 1 else ""} testing example configs'
+        return envs, reason
+
+    def classify_source(self, path, marlin_path):
+        """(envs, reason) for a Marlin/src file from what the tests set, leaving example configs out."""
+        if marlin_path.startswith('src/pins/') and PurePosixPath(path).name.startswith('pins_') \
+                and 'pins_postprocess' not in path:
+            boards = self.pins_boards().get(marlin_path[len('src/pins/'):], set())
+            default = self.values.get('MOTHERBOARD', '')
+            tested = {f'BOARD_{b}' for b in boards}
+            envs = self.tests.building(tested)
+            if default in tested:
+                envs = sorted(set(envs) | {env for env, used in self.tests.boards.items() if None in used})
+            shown = ', '.join(sorted(boards)[:4]) + (' ...' if len(boards) > 4 else '')
+            return envs, f'pins for {shown or "no board"}'
+        match = re.match(r'src/lcd/language/language_(\w+)\.h$', marlin_path)
+        if match:
+            language = match.group(1)
+            if language == self.values.get('LCD_LANGUAGE'):
+                return self.candidates, f'LCD_LANGUAGE {language} is the default'
+            envs = self.tests.in_language(language)
+            return envs, f'tests set LCD_LANGUAGE {language}'
+
+        # The feature whose filter names the file most precisely, e.g. HAS_MENU_FILAMENT over HAS_LCD_MENU
+        features = {name: src_filter_match(items, marlin_path) for name, items in self.features.items()}
+        features = {name: pattern for name, pattern in features.items() if pattern}
+        if features:
+            longest = max(len(pattern) for pattern in features.values())
+            names = {name for name, pattern in features.items() if len(pattern) == longest}
+            if self.primary_options(names):
+                envs, why = self.by_options(names)
+                return envs, f'features.ini {", ".join(sorted(names))}: {why}'
+        source = self.repo_root / path
+        guard = file_guard(source.read_text(encoding='latin-1')) if source.is_file() else None
+        if guard and self.primary_options(condition_names(guard)):
+            envs, why = self.by_options(condition_names(guard))
+            return envs, f'#if {" ".join(guard.split())}: {why}'
+        envs = sorted(env for env in self.candidates
+                      if env not in self.project.envs or src_filter_takes(self.project.src_filter(env), marlin_path))
+        return envs, 'built unconditionally' if len(envs) == len(self.candidates) else 'by build_src_filter'
+
+    def select(self, paths):
+        targets = set()
+        for path in paths:
+            envs, reason = self.classify(path)
+            if not path.startswith('buildroot/tests/'):
+                envs = [env for env in envs if env in self.candidates]
+            self.reasons.append((path, reason, envs))
+            targets.update(envs)
+        return [env for env in self.candidates if env in targets] + sorted(targets - set(self.candidates))
+
+    def explain(self):
+        lines = []
+        for path, reason, envs in self.reasons:
+            if len(envs) == len(self.candidates) and envs:
+                selected = f'all {len(envs)}'
+            else:
+                selected = ' '.join(envs) if envs else 'none'
+            lines.append(f'{path}\n    {reason} -> {selected}')
+        uncovered = [path for path, reason, envs in self.reasons
+                     if not envs and path.startswith('Marlin/src/')]
+        if uncovered:
+            lines.append('WARNING: No test covers: ' + ', '.join(uncovered))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def git_lines(repo_root, *args):
+    result = subprocess.run(['git', *args], cwd=repo_root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True, check=False)
+    return result.stdout.split('\n') if result.returncode == 0 else None
+
+
+def changed_files(repo_root, base=None):
+    """Files that differ from base (committed, staged, unstaged or untracked); base defaults to the fork point."""
+    if not base:
+        for candidate in BASE_CANDIDATES:
+            found = git_lines(repo_root, 'merge-base', 'HEAD', candidate)
+            if found and found[0]:
+                base = found[0]
+                break
+        else:
+            base = 'HEAD'
+    diff = git_lines(repo_root, 'diff', '--name-only', base)
+    if diff is None:
+        raise SystemExit(f'ERROR: git diff against {base} failed')
+    untracked = git_lines(repo_root, 'ls-files', '--others', '--exclude-standard') or []
+    return [path for path in dict.fromkeys(diff + untracked) if path]
+
+
+def select_changed(repo_root, candidates, base=None, files=None):
+    """The targets for the changed files and a Selector with the explanation."""
+    selector = Selector(repo_root, candidates)
+    paths = files if files is not None else changed_files(repo_root, base)
+    return selector.select(paths), selector
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Select the buildroot/tests envs affected by a change.')
+    parser.add_argument('base', nargs='?', default=None, help='commit to diff against (default: fork point of upstream)')
+    parser.add_argument('--files', nargs='+', default=None, help='changed paths, relative to the repository root')
+    parser.add_argument('--all', action='store_true', help='select from every script, not just the CI platforms')
+    parser.add_argument('--quiet', action='store_true', help='print the targets only')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'build'))
+    from build_configs import find_repo_root  # pylint: disable=import-outside-toplevel
+    repo_root = find_repo_root()
+    if repo_root is None:
+        print('ERROR: Could not detect repository root or not in a Marlin repository', file=sys.stderr)
+        return 1
+
+    from run_test_shards import ci_targets, test_scripts  # pylint: disable=import-outside-toplevel
+    candidates = test_scripts(repo_root) if args.all else ci_targets(repo_root)
+    targets, selector = select_changed(repo_root, candidates, args.base, args.files)
+    if not args.quiet:
+        sys.stderr.write(selector.explain())
+        print(f'{len(targets)} of {len(candidates)} targets selected', file=sys.stderr)
+    print(' '.join(targets))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())